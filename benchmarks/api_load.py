@@ -0,0 +1,373 @@
+"""
+Measures the latency, throughput and query counts of the main API endpoints on a seeded
+scratch database, and writes a report that can be compared across commits.
+
+    python -m benchmarks.api_load --sales 1000000 --json report.json
+    python -m benchmarks.api_load --sales 1000000 --json new.json --compare report.json
+
+Every endpoint is first called sequentially, to time single requests and count their queries,
+then from concurrent clients, for its throughput. A last phase has concurrent clients buy the
+same few food items until they sell out, and checks that the stock and the sales recorded add
+up. Requests go through the WSGI handler in-process, without a server or sockets.
+
+With --compare, the changes against an earlier report are printed, and the command exits with
+status 1 if a median latency or a throughput got worse by more than --threshold, or if a
+request runs more queries. It also exits with status 1 if the contention phase finds stock
+and sales that do not add up. The scratch database is set by the BENCHMARK_DB environment variable and is
+wiped first.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections, transaction  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from icecreamtruck.icecreamapi.models import FoodItem, Sale, Truck  # noqa: E402
+from icecreamtruck.tests.factories import FoodItemFactory, TruckFactory  # noqa: E402
+
+ITEM_TYPES = ['ice_cream', 'shaved_ice', 'snack_bar']
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+DAYS = 365
+CHUNK_SIZE = 50000
+STOCK = 10**9
+
+WARMUP = 20
+THROUGHPUT = 'requests_per_second'
+# tail latencies vary too much between runs to fail a comparison on
+GATED_LATENCIES = ['p50_ms', 'concurrent_p50_ms']
+
+
+def seed(trucks, items_per_truck, sales):
+    """
+    Bulk inserts trucks and food items built by the test factories, and sales spread over a
+    year, then brings the trucks' running sales totals up to date.
+    """
+    rng = random.Random(0)
+    Truck.objects.bulk_create(TruckFactory.build_batch(trucks))
+    trucks = list(Truck.objects.order_by('id'))
+    FoodItem.objects.bulk_create(
+        FoodItemFactory.build(
+            name=f'Item {index}',
+            item_type=rng.choice(ITEM_TYPES),
+            price=Decimal(rng.randint(100, 900)) / 100,
+            quantity=STOCK,
+            truck=truck,
+        )
+        for truck in trucks
+        for index in range(items_per_truck)
+    )
+    food_items = list(FoodItem.objects.values_list('id', 'truck_id', 'price'))
+
+    # purchase_time is auto_now_add, which the ORM's bulk_create would overwrite
+    table = Sale._meta.db_table
+    for offset in range(0, sales, CHUNK_SIZE):
+        rows = []
+        for _ in range(min(CHUNK_SIZE, sales - offset)):
+            food_item_id, truck_id, price = rng.choice(food_items)
+            quantity = rng.randint(1, 3)
+            purchase_time = START + timedelta(seconds=rng.randrange(DAYS * 24 * 3600))
+            rows.append(
+                (
+                    quantity,
+                    price,
+                    price * quantity,
+                    connection.ops.adapt_datetimefield_value(purchase_time),
+                    food_item_id,
+                    truck_id,
+                )
+            )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (quantity, unit_price, line_total, purchase_time, food_item_id, truck_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+    call_command('rebuild_sales_totals', verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return [truck.id for truck in trucks], [food_item_id for food_item_id, _, _ in food_items]
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentiles[94], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'max_ms': round(latencies[-1], 3),
+    }
+
+
+class Endpoint:
+    """
+    Requests of one endpoint, cycling through the given paths or request bodies.
+    """
+
+    def __init__(self, method, path, bodies=None, expected=(200,)):
+        self.method = method
+        self.path = path
+        self.bodies = bodies
+        self.expected = expected
+
+    def call(self, client, index):
+        if self.method == 'post':
+            response = client.post(self.path, self.bodies[index % len(self.bodies)], content_type='application/json')
+        else:
+            response = client.get(self.path[index % len(self.path)] if isinstance(self.path, list) else self.path)
+        if response.status_code not in self.expected:
+            raise RuntimeError(f"{self.method.upper()} {self.path} answered {response.status_code}")
+        return response
+
+
+def sequential(endpoint, requests):
+    """
+    Times requests one at a time, after a few untimed ones, and counts their queries.
+    """
+    client = Client()
+    for index in range(WARMUP):
+        endpoint.call(client, index)
+    latencies, queries = [], []
+    for index in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            endpoint.call(client, index)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+    return {**latency_summary(latencies), 'queries_per_request': round(statistics.mean(queries), 2)}
+
+
+def concurrent(endpoint, requests, concurrency, record=None):
+    """
+    Sends the requests from concurrent clients, each on a thread of its own with its own
+    database connection, and returns the throughput and latencies.
+    """
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    latencies = []
+
+    def client():
+        http = Client()
+        try:
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                started = time.perf_counter()
+                response = endpoint.call(http, index)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    if record:
+                        record(index, response)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    return {THROUGHPUT: round(requests / elapsed, 1), **latency_summary(latencies)}
+
+
+def contention(food_item_ids, stock, requests, concurrency):
+    """
+    Has concurrent clients buy the same food items until they sell out, and checks that no
+    unit was oversold or lost.
+    """
+    FoodItem.objects.filter(id__in=food_item_ids).update(quantity=stock)
+    last_sale = Sale.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    rng = random.Random(1)
+    bodies = [{'food_id': rng.choice(food_item_ids), 'quantity': rng.randint(1, 3)} for _ in range(min(requests, 1000))]
+    outcomes = {'enjoy': 0, 'sorry': 0}
+    bought = [0]
+
+    def record(index, response):
+        if response.status_code == 201:
+            outcomes['enjoy'] += 1
+            bought[0] += bodies[index % len(bodies)]['quantity']
+        else:
+            outcomes['sorry'] += 1
+
+    endpoint = Endpoint('post', reverse('purchase-list'), bodies, expected=(201, 400))
+    result = concurrent(endpoint, requests, concurrency, record)
+
+    left = FoodItem.objects.filter(id__in=food_item_ids).aggregate(total=Sum('quantity'))['total']
+    sales = Sale.objects.filter(food_item_id__in=food_item_ids, id__gt=last_sale)
+    recorded = sales.aggregate(total=Sum('quantity'))['total'] or 0
+    consistent = left >= 0 and stock * len(food_item_ids) - left == bought[0] == recorded
+    return {
+        **result,
+        'hot_items': len(food_item_ids),
+        'stock_per_item': stock,
+        'purchases': outcomes['enjoy'],
+        'sold_out_answers': outcomes['sorry'],
+        'units_sold': bought[0],
+        'consistent': consistent,
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain'], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def compare(report, baseline, threshold):
+    """
+    Prints the changes of every figure against a baseline report, and returns the regressions.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'the baseline'}:")
+    if baseline.get('scale') != report['scale']:
+        print(f"  The baseline was run at another scale: {baseline.get('scale')}")
+    for name, result in report['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        for field, value in result.items():
+            if field not in old:
+                continue
+            before = old[field]
+            change = (value - before) / before if before else 0
+            if field == THROUGHPUT:
+                worse = change < -threshold
+            elif field in GATED_LATENCIES:
+                worse = change > threshold
+            elif field == 'queries_per_request':
+                worse = value > before
+            elif field.endswith('_ms'):
+                worse = False
+            else:
+                continue
+            marker = '  REGRESSION' if worse else ''
+            print(f"  {name:<20}{field:<22}{before:>12}{value:>12}{change:>+9.1%}{marker}")
+            if worse:
+                regressions.append((name, field))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trucks', type=int, default=100)
+    parser.add_argument('--items-per-truck', type=int, default=20)
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and phase.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--hot-items', type=int, default=3, help="Food items bought by the contention phase.")
+    parser.add_argument('--stock', type=int, default=100, help="Stock of each of the hot items.")
+    parser.add_argument('--json', type=Path, help="Also write the report to this JSON file.")
+    parser.add_argument('--compare', type=Path, help="Report of an earlier run to compare with.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Tolerated slowdown, 0.2 for 20%%.")
+    args = parser.parse_args()
+
+    database = Path(connection.settings_dict['NAME'])
+    connection.close()
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{database}{suffix}').unlink(missing_ok=True)
+    call_command('migrate', verbosity=0)
+    started = time.perf_counter()
+    truck_ids, food_item_ids = seed(args.trucks, args.items_per_truck, args.sales)
+    seconds = round(time.perf_counter() - started, 1)
+    print(f"Seeded {args.trucks} trucks, {len(food_item_ids)} food items and {args.sales} sales in {seconds}s")
+
+    rng = random.Random(0)
+    hot_items = rng.sample(food_item_ids, args.hot_items)
+    cold_items = [food_item_id for food_item_id in food_item_ids if food_item_id not in set(hot_items)]
+    endpoints = {
+        'purchase': Endpoint(
+            'post',
+            reverse('purchase-list'),
+            [{'food_id': rng.choice(cold_items), 'quantity': 1} for _ in range(100)],
+            expected=(201,),
+        ),
+        'inventory': Endpoint('get', reverse('inventory-list') + '?page_size=20'),
+        'inventory detail': Endpoint('get', [reverse('inventory-detail', args=[pk]) for pk in truck_ids[:50]]),
+        'truck list': Endpoint('get', reverse('truck-list') + '?page_size=20'),
+        'truck detail': Endpoint('get', [reverse('truck-detail', args=[pk]) for pk in truck_ids[:50]]),
+        'food item list': Endpoint('get', reverse('fooditem-list') + '?page_size=50'),
+        'food item detail': Endpoint(
+            'get', [reverse('fooditem-detail', args=[pk]) for pk in rng.sample(cold_items, min(50, len(cold_items)))]
+        ),
+    }
+
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'scale': {
+            'trucks': args.trucks,
+            'food_items': len(food_item_ids),
+            'sales': args.sales,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'seed_seconds': seconds,
+        'endpoints': {},
+    }
+    for name, endpoint in endpoints.items():
+        report['endpoints'][name] = {
+            **sequential(endpoint, args.requests),
+            **{
+                f'concurrent_{field}' if field != THROUGHPUT else field: value
+                for field, value in concurrent(endpoint, args.requests, args.concurrency).items()
+            },
+        }
+    report['endpoints']['purchase contention'] = contention(hot_items, args.stock, args.requests, args.concurrency)
+
+    print(f"\n{'endpoint':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'req/s':>10}")
+    for name, result in report['endpoints'].items():
+        print(
+            f"{name:<22}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+            f"{result.get('queries_per_request', ''):>9}{result[THROUGHPUT]:>10}"
+        )
+    contended = report['endpoints']['purchase contention']
+    print(
+        f"\nContention: {contended['purchases']} purchases and {contended['sold_out_answers']} sold out answers, "
+        f"stock and sales {'consistent' if contended['consistent'] else 'INCONSISTENT'}"
+    )
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+    failed = not contended['consistent']
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
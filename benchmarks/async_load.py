@@ -0,0 +1,170 @@
+"""
+Compares the requests per second and latency of the sync (DRF) read endpoints with their
+async versions under /async/, served by the ASGI application under concurrent load.
+
+    python -m benchmarks.async_load --concurrency 50 --requests 2000
+
+Requests are driven through the ASGI application in-process, without a server or sockets, so
+the numbers measure the request handling alone. The scratch database is set by the
+BENCHMARK_DB environment variable and is wiped first.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from icecreamtruck.icecreamapi.models import FoodItem, Truck  # noqa: E402
+
+ITEM_TYPES = ['ice_cream', 'shaved_ice', 'snack_bar']
+
+
+def seed(trucks, items_per_truck):
+    rng = random.Random(0)
+    Truck.objects.bulk_create(Truck(name=f'Truck {index}') for index in range(trucks))
+    truck_ids = list(Truck.objects.values_list('id', flat=True))
+    FoodItem.objects.bulk_create(
+        FoodItem(
+            name=f'Item {index}',
+            item_type=rng.choice(ITEM_TYPES),
+            price=rng.randint(100, 900) / 100,
+            quantity=1000,
+            truck_id=truck_id,
+        )
+        for truck_id in truck_ids
+        for index in range(items_per_truck)
+    )
+    return truck_ids, list(FoodItem.objects.values_list('id', flat=True))
+
+
+async def get(application, path):
+    """
+    Sends a GET request to the ASGI application and returns its response status.
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    received = asyncio.Event()
+    response = {}
+
+    async def receive():
+        if received.is_set():
+            # the request has no more body: wait for the response to be sent
+            await asyncio.Event().wait()
+        received.set()
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await application(scope, receive, send)
+    return response['status']
+
+
+async def load(application, paths, concurrency, requests):
+    """
+    Sends the requests from concurrent clients, and returns the throughput and latencies.
+    """
+    latencies = []
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(paths[index % len(paths)])
+
+    async def client():
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            status = await get(application, path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                raise RuntimeError(f"GET {path} answered {status}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests_per_second': round(requests / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trucks', type=int, default=100)
+    parser.add_argument('--items-per-truck', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per endpoint and version.")
+    parser.add_argument('--json', type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    database = Path(connection.settings_dict['NAME'])
+    connection.close()
+    database.unlink(missing_ok=True)
+    call_command('migrate', verbosity=0)
+    truck_ids, food_item_ids = seed(args.trucks, args.items_per_truck)
+    connection.close()
+
+    rng = random.Random(0)
+    endpoints = {
+        'inventory': ['/inventory/?page_size=20'],
+        'truck list': ['/trucks/?page_size=20'],
+        'truck detail': [f'/trucks/{truck_id}/' for truck_id in rng.sample(truck_ids, min(50, len(truck_ids)))],
+        'food item list': ['/fooditem/?page_size=50'],
+        'food item detail': [
+            f'/fooditem/{food_item_id}/' for food_item_id in rng.sample(food_item_ids, min(50, len(food_item_ids)))
+        ],
+    }
+
+    application = get_asgi_application()
+    results = {'concurrency': args.concurrency, 'requests': args.requests, 'endpoints': {}}
+    for name, paths in endpoints.items():
+        results['endpoints'][name] = {
+            version: asyncio.run(load(application, [prefix + path for path in paths], args.concurrency, args.requests))
+            for version, prefix in [('sync', ''), ('async', '/async')]
+        }
+
+    print(f"{args.requests} requests per endpoint, {args.concurrency} concurrent clients\n")
+    print(f"{'endpoint':<18}{'version':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, versions in results['endpoints'].items():
+        for version, result in versions.items():
+            print(
+                f"{name:<18}{version:<8}{result['requests_per_second']:>10}"
+                f"{result['p50_ms']:>10}{result['p99_ms']:>10}"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures purchase throughput as more and more concurrent clients buy the same food item, with
+its stock held on the food item itself and spread over stock shards.
+
+    python -m benchmarks.hot_item --shards 8 --concurrency 1 2 4 8 16 32
+
+Each run buys one unit at a time of a single food item, through the WSGI handler in-process,
+on the seeded scratch database set by the BENCHMARK_DB environment variable, which is wiped
+first. After each run the units left in stock are checked against the purchases answered.
+
+On SQLite, which lets a single transaction write at a time, sharded and unsharded runs are
+expected to come out within run-to-run noise of each other: sharding spreads row locks, which
+only databases with row-level locking such as PostgreSQL take.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+
+# sets Django up with the benchmark settings
+from benchmarks.api_load import Endpoint, concurrent, seed
+from icecreamtruck.icecreamapi.models import FoodItem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, default=8, help="Stock shards of the sharded runs.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--requests', type=int, default=2000, help="Purchases per run.")
+    parser.add_argument('--json', type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    database = Path(connection.settings_dict['NAME'])
+    connection.close()
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{database}{suffix}').unlink(missing_ok=True)
+    call_command('migrate', verbosity=0)
+    _, (food_item_id,) = seed(1, 1, 0)
+    food_item = FoodItem.objects.get(id=food_item_id)
+    endpoint = Endpoint('post', reverse('purchase-list'), [{'food_id': food_item_id, 'quantity': 1}], expected=(201,))
+
+    results = {'requests': args.requests, 'shards': args.shards, 'runs': []}
+    for shards in (0, args.shards):
+        for concurrency in args.concurrency:
+            # enough stock for every purchase of the run
+            FoodItem.objects.filter(id=food_item_id).update(quantity=args.requests)
+            food_item.reshard_stock(shards)
+            result = concurrent(endpoint, args.requests, concurrency)
+            left = FoodItem.objects.with_stock().get(id=food_item_id).stock
+            result.update(shards=shards, concurrency=concurrency, consistent=left == 0)
+            results['runs'].append(result)
+            food_item.reshard_stock(0)
+
+    print(f"{args.requests} purchases of a single food item per run\n")
+    print(f"{'shards':<8}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'consistent':>12}")
+    for run in results['runs']:
+        print(
+            f"{run['shards']:<8}{run['concurrency']:>8}{run['requests_per_second']:>10}{run['p50_ms']:>10}"
+            f"{run['p99_ms']:>10}{str(run['consistent']):>12}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares the purchase throughput and latency of the 'immediate' and 'buffered' (group commit)
+purchase write modes, with concurrent clients buying from many food items.
+
+    python -m benchmarks.purchase_writes --concurrency 16 --requests 5000
+
+Each mode runs on the same seeded scratch database, through the WSGI handler in-process. After
+each run the sales still buffered are flushed, and the sales recorded are checked against the
+purchases answered. The scratch database is set by the BENCHMARK_DB environment variable and is
+wiped first.
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+
+# sets Django up with the benchmark settings
+from benchmarks.api_load import Endpoint, concurrent, seed
+from icecreamtruck.icecreamapi.models import Sale
+from icecreamtruck.icecreamapi.sales_buffer import get_sale_buffer
+
+MODES = ['immediate', 'buffered']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trucks', type=int, default=20)
+    parser.add_argument('--items-per-truck', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=5000, help="Purchases per mode.")
+    parser.add_argument('--flush-milliseconds', type=int, default=50)
+    parser.add_argument('--max-rows', type=int, default=500)
+    parser.add_argument('--json', type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    database = Path(connection.settings_dict['NAME'])
+    connection.close()
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{database}{suffix}').unlink(missing_ok=True)
+    call_command('migrate', verbosity=0)
+    _, food_item_ids = seed(args.trucks, args.items_per_truck, 0)
+
+    rng = random.Random(0)
+    bodies = [{'food_id': rng.choice(food_item_ids), 'quantity': 1} for _ in range(1000)]
+    endpoint = Endpoint('post', reverse('purchase-list'), bodies, expected=(201,))
+
+    results = {'concurrency': args.concurrency, 'requests': args.requests, 'modes': {}}
+    for mode in MODES:
+        with override_settings(
+            PURCHASE_WRITE_MODE=mode,
+            SALE_BUFFER_FLUSH_MILLISECONDS=args.flush_milliseconds,
+            SALE_BUFFER_MAX_ROWS=args.max_rows,
+        ):
+            sales_before = Sale.objects.count()
+            result = concurrent(endpoint, args.requests, args.concurrency)
+            started = time.perf_counter()
+            get_sale_buffer().shutdown()
+            result['final_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            result['sales_recorded'] = Sale.objects.count() - sales_before
+        results['modes'][mode] = result
+
+    print(f"{args.requests} purchases per mode, {args.concurrency} concurrent clients\n")
+    print(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'sales':>10}")
+    for mode, result in results['modes'].items():
+        print(
+            f"{mode:<12}{result['requests_per_second']:>10}{result['p50_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['sales_recorded']:>10}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
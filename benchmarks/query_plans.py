@@ -0,0 +1,188 @@
+"""
+Shows the query plans and timings of the hot queries before and after the indexes added by
+migration 0007_query_indexes, on a freshly seeded scratch database.
+
+    python -m benchmarks.query_plans --sales 1000000
+
+The scratch database is set by the BENCHMARK_DB environment variable and is wiped first.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+BEFORE = '0006_sales_rollups'
+AFTER = '0007_query_indexes'
+
+ITEM_TYPES = ['ice_cream', 'shaved_ice', 'snack_bar']
+FLAVORS = ['chocolate', 'pistachio', 'strawberry', 'mint']
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+DAYS = 365
+CHUNK_SIZE = 50000
+
+# Raw SQL keeps the queries valid against the schema of both migrations above, whatever
+# columns later migrations add to the models.
+QUERIES = {
+    'sales of a truck over a week': (
+        'SELECT COUNT(*), SUM(line_total) FROM icecreamapi_sale '
+        'WHERE truck_id = %(truck)s AND purchase_time >= %(week_start)s AND purchase_time < %(week_end)s'
+    ),
+    'latest sales of a food item': (
+        'SELECT id, quantity, purchase_time FROM icecreamapi_sale '
+        'WHERE food_item_id = %(food_item)s ORDER BY purchase_time DESC LIMIT 50'
+    ),
+    'food items of a truck by type': (
+        'SELECT id, name, quantity FROM icecreamapi_fooditem WHERE truck_id = %(truck)s AND item_type = %(item_type)s'
+    ),
+    'flavor of a food item': (
+        'SELECT id FROM icecreamapi_foodflavor WHERE food_item_id = %(food_item)s AND name = %(flavor)s'
+    ),
+}
+
+
+def seed(trucks, items_per_truck, sales):
+    """
+    Bulk inserts trucks, food items with one flavor each, and sales spread over a year.
+    """
+    rng = random.Random(0)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO icecreamapi_truck (name, sales_total, units_sold) VALUES (%s, 0, 0)',
+            [(f'Truck {index}',) for index in range(trucks)],
+        )
+        cursor.execute('SELECT id FROM icecreamapi_truck ORDER BY id')
+        truck_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.executemany(
+            'INSERT INTO icecreamapi_fooditem (item_type, price, name, quantity, truck_id) VALUES (%s, %s, %s, %s, %s)',
+            [
+                (rng.choice(ITEM_TYPES), Decimal(rng.randint(100, 900)) / 100, f'Item {index}', 1000, truck_id)
+                for truck_id in truck_ids
+                for index in range(items_per_truck)
+            ],
+        )
+        cursor.execute('SELECT id, truck_id, price FROM icecreamapi_fooditem ORDER BY id')
+        food_items = cursor.fetchall()
+
+        cursor.executemany(
+            'INSERT INTO icecreamapi_foodflavor (name, food_item_id) VALUES (%s, %s)',
+            [(rng.choice(FLAVORS), food_item_id) for food_item_id, _, _ in food_items],
+        )
+
+    for offset in range(0, sales, CHUNK_SIZE):
+        rows = []
+        for _ in range(min(CHUNK_SIZE, sales - offset)):
+            food_item_id, truck_id, price = rng.choice(food_items)
+            quantity = rng.randint(1, 3)
+            purchase_time = START + timedelta(seconds=rng.randrange(DAYS * 24 * 3600))
+            rows.append(
+                (
+                    quantity,
+                    Decimal(price),
+                    Decimal(price) * quantity,
+                    connection.ops.adapt_datetimefield_value(purchase_time),
+                    food_item_id,
+                    truck_id,
+                )
+            )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO icecreamapi_sale (quantity, unit_price, line_total, purchase_time, food_item_id, truck_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+    return truck_ids, food_items
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def measure(params, repeat):
+    """
+    Returns the plan and the median time in milliseconds of every query.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    results = {}
+    for name, sql in QUERIES.items():
+        timings = []
+        for attempt in range(repeat + 1):
+            query_params = params(attempt)
+            with connection.cursor() as cursor:
+                started = time.perf_counter()
+                cursor.execute(sql, query_params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        # the first run only warms the page cache
+        results[name] = {'plan': explain(sql, params(0)), 'median_ms': round(statistics.median(timings[1:]), 3)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trucks', type=int, default=50)
+    parser.add_argument('--items-per-truck', type=int, default=20)
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs of every query.")
+    parser.add_argument('--json', type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    database = Path(connection.settings_dict['NAME'])
+    connection.close()
+    database.unlink(missing_ok=True)
+
+    call_command('migrate', 'icecreamapi', BEFORE, verbosity=0)
+    started = time.perf_counter()
+    truck_ids, food_items = seed(args.trucks, args.items_per_truck, args.sales)
+    print(f"Seeded {args.sales} sales in {time.perf_counter() - started:.1f}s")
+
+    def params(attempt):
+        rng = random.Random(attempt)
+        week_start = START + timedelta(days=rng.randrange(DAYS - 7))
+        return {
+            'truck': rng.choice(truck_ids),
+            'food_item': rng.choice(food_items)[0],
+            'item_type': rng.choice(ITEM_TYPES),
+            'flavor': rng.choice(FLAVORS),
+            'week_start': connection.ops.adapt_datetimefield_value(week_start),
+            'week_end': connection.ops.adapt_datetimefield_value(week_start + timedelta(days=7)),
+        }
+
+    results = {'sales': args.sales, 'before': measure(params, args.repeat)}
+    started = time.perf_counter()
+    call_command('migrate', 'icecreamapi', AFTER, verbosity=0)
+    results['migration_seconds'] = round(time.perf_counter() - started, 2)
+    results['after'] = measure(params, args.repeat)
+
+    print(f"Applied {AFTER} in {results['migration_seconds']}s\n")
+    for name in QUERIES:
+        before, after = results['before'][name], results['after'][name]
+        print(f"{name}: {before['median_ms']} ms -> {after['median_ms']} ms")
+        print('  before: ' + '\n          '.join(before['plan']))
+        print('  after:  ' + '\n          '.join(after['plan']))
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Settings for the benchmarks: the local settings, pointed at a scratch SQLite database that
+the benchmarks are free to wipe and reseed.
+"""
+
+from icecreamtruck.settings.local_settings import *
+
+DEBUG = False
+
+# the host of django.test.Client requests
+ALLOWED_HOSTS = ['localhost', 'testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('BENCHMARK_DB', default=str(BASE_DIR.parent / 'benchmark.sqlite3')),
+        'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT},
+    }
+}
+DATABASE_REPLICAS = []
+
+# only the sampled requests would pay for profiling, which would skew their latency
+REQUEST_PROFILING_SAMPLE_RATE = 0
+
+# measure the database and serialization paths, not the inventory cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
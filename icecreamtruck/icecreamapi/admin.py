@@ -1,8 +1,20 @@
 from django.contrib import admin
 
-from .models import FoodFlavor, FoodItem, Sale, Truck
+from icecreamtruck.routers import SAFE_METHODS, use_replica_for_reads
+
+from .models import FoodFlavor, FoodItem, Sale, SalesRollup, Truck
+
+
+@admin.register(Sale)
+class SaleAdmin(admin.ModelAdmin):
+    def changelist_view(self, request, extra_context=None):
+        # the sale listing is a heavy read, served by a replica
+        if request.method in SAFE_METHODS:
+            use_replica_for_reads()
+        return super().changelist_view(request, extra_context)
+
 
 admin.site.register(FoodItem)
-admin.site.register(Sale)
 admin.site.register(Truck)
 admin.site.register(FoodFlavor)
+admin.site.register(SalesRollup)
@@ -0,0 +1,250 @@
+"""
+Async versions of the read endpoints, served under /async/, and the stream of live stock
+levels.
+
+They answer with the same data, headers and caching as their DRF counterparts in views.py,
+but read through Django's async ORM and cache APIs, so under ASGI a request waiting on the
+database does not hold a worker thread for its whole duration. They run under WSGI as well,
+where Django runs each of them in its own event loop.
+
+Lists are paginated by IdCursorPagination, with the same cursors, links and page sizes as
+the DRF lists, so a client can follow a page of one with the other.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.views import View
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from icecreamtruck.routers import ReplicaReadMixin
+
+from .cache import FLEET, acached_inventory, aget_generation, generation_validators
+from .events import get_broker, stock_events
+from .models import FoodItem, Truck
+from .pagination import IdCursorPagination
+from .serializers import FoodItemSerializer, TruckSerializer
+from .views import set_validators, version_validators
+
+
+def json_response(data, status=200):
+    # rendered as DRF does, so both versions of an endpoint answer the same bytes
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def not_found():
+    return json_response({'detail': "Not found."}, status=404)
+
+
+async def fetch_page(request, queryset):
+    """
+    Returns the objects of the requested page of a queryset, and the paginator holding the
+    links to the next and previous pages. Raises NotFound for an invalid cursor.
+    """
+    paginator = IdCursorPagination()
+    # read in a thread, as the async ORM does for its queries
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, Request(request))
+    return page, paginator
+
+
+async def inventory_validators(scope, request):
+    """
+    Returns the ETag and Last-Modified timestamp of an inventory response.
+    """
+    etag, last_modified = generation_validators(await aget_generation(scope), request)
+    return quote_etag(etag), int(last_modified.timestamp())
+
+
+class AsyncListView(ReplicaReadMixin, View):
+    """
+    Base view for the paginated lists, answering invalid cursors as DRF does.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            return await self.list(request, *args, **kwargs)
+        except NotFound as exc:
+            return json_response({'detail': exc.detail}, status=404)
+
+
+class AsyncInventoryListView(AsyncListView):
+    """
+    Async version of InventoryViewSet.list.
+    """
+
+    async def list(self, request):
+        etag, last_modified = await inventory_validators(FLEET, request)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        async def build():
+            page, paginator = await fetch_page(request, Truck.objects.with_inventory())
+            trucks = TruckSerializer(page, many=True)
+            return {
+                'Inventory': trucks.data,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            }
+
+        data = await acached_inventory(FLEET, request, build)
+        return set_validators(json_response(data), etag, last_modified)
+
+
+class AsyncInventoryDetailView(ReplicaReadMixin, View):
+    """
+    Async version of InventoryViewSet.retrieve.
+    """
+
+    async def get(self, request, pk):
+        etag, last_modified = await inventory_validators(pk, request)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        async def build():
+            trucks = [truck async for truck in Truck.objects.with_inventory().filter(id=pk)]
+            # None is never cached, so an unknown truck is looked up again every time
+            return TruckSerializer(trucks[0]).data if trucks else None
+
+        data = await acached_inventory(pk, request, build)
+        if data is None:
+            return not_found()
+        return set_validators(json_response(data), etag, last_modified)
+
+
+class AsyncDetailView(ReplicaReadMixin, View):
+    """
+    Base view for a single versioned object, answering conditional requests from its version
+    alone.
+    """
+
+    queryset = None
+    serializer_class = None
+
+    async def get(self, request, pk):
+        model = self.queryset.model
+        stamp = await model._default_manager.filter(pk=pk).version_stamps().afirst()
+        if stamp is None:
+            return not_found()
+
+        etag, last_modified = version_validators(model, pk, *stamp)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        objects = [obj async for obj in self.queryset.filter(pk=pk)]
+        if not objects:
+            return not_found()
+        data = self.serializer_class(objects[0], context={'request': request}).data
+        return set_validators(json_response(data), etag, last_modified)
+
+
+class AsyncTruckListView(AsyncListView):
+    """
+    Async version of TruckViewSet.list.
+    """
+
+    async def list(self, request):
+        page, paginator = await fetch_page(request, Truck.objects.with_inventory())
+        trucks = TruckSerializer(page, many=True, context={'request': request})
+        return json_response(paginator.get_paginated_response(trucks.data).data)
+
+
+class AsyncTruckDetailView(AsyncDetailView):
+    """
+    Async version of TruckViewSet.retrieve.
+    """
+
+    queryset = Truck.objects.with_inventory()
+    serializer_class = TruckSerializer
+
+
+class AsyncFoodItemListView(AsyncListView):
+    """
+    Async version of FoodItemViewSet.list.
+    """
+
+    async def list(self, request):
+        page, paginator = await fetch_page(request, FoodItem.objects.with_stock())
+        food_items = FoodItemSerializer(page, many=True, context={'request': request})
+        return json_response(paginator.get_paginated_response(food_items.data).data)
+
+
+class AsyncFoodItemDetailView(AsyncDetailView):
+    """
+    Async version of FoodItemViewSet.retrieve.
+    """
+
+    queryset = FoodItem.objects.with_stock()
+    serializer_class = FoodItemSerializer
+
+
+class StockEventsView(View):
+    """
+    Streams the stock levels of a truck's food items as server-sent events.
+
+    The stream starts with a 'stock' event per food item, followed by a 'stock' event each time
+    a purchase changes the quantity of one, and a 'sold_out' event when it runs out. Each event
+    holds the 'truck', 'food_item' and 'quantity'. Comments are sent as heartbeats while
+    nothing happens. After STOCK_EVENTS_MAX_SECONDS, or if the client falls too far behind, the
+    stream ends and EventSource clients reconnect to a fresh one.
+
+    Streams are served over ASGI only: WSGI servers would buffer them, and hold a worker for
+    each of them, so requests handled under WSGI get a 501 Not Implemented response.
+    """
+
+    async def get(self, request, pk):
+        if not isinstance(request, ASGIRequest):
+            return json_response({'detail': "Stock events are only streamed by ASGI servers."}, status=501)
+        if not await Truck.objects.filter(id=pk).aexists():
+            return not_found()
+
+        # subscribed before reading the stock levels, so no change falls in between
+        broker = get_broker()
+        subscription = broker.subscribe(pk)
+        try:
+            food_items = FoodItem.objects.filter(truck_id=pk).order_by('id').stock_levels()
+            snapshot = [food_item async for food_item in food_items]
+        except BaseException:
+            broker.unsubscribe(subscription)
+            raise
+
+        response = StreamingHttpResponse(self.stream(broker, subscription, snapshot), content_type='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # stop nginx from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, broker, subscription, snapshot):
+        try:
+            yield f'retry: {settings.STOCK_EVENTS_RETRY_MILLISECONDS}\n\n'
+            for event in stock_events(snapshot):
+                yield self.format(*event)
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.STOCK_EVENTS_MAX_SECONDS
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), min(settings.STOCK_EVENTS_HEARTBEAT_SECONDS, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is None:
+                    return
+                yield self.format(*event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    @staticmethod
+    def format(event_type, data):
+        return f'event: {event_type}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,139 @@
+"""
+Cache of the serialized inventory, for the whole fleet and for every truck.
+
+Each scope (the fleet, or one truck) has a generation: a random token and the time it was
+started. Cached inventory pages are stored under their scope's current token, so starting a
+new generation invalidates them all at once, and the token doubles as the ETag and its start
+time as the Last-Modified date of the responses. Any change to a truck, its food items or its
+sales starts a new generation for that truck and for the fleet, once the change is committed.
+
+Async views use the a-prefixed variants of these functions, which go through the async cache
+API instead.
+
+The cache is the one named by INVENTORY_CACHE_ALIAS. With the default local-memory backend
+every process has its own copy, so deployments running several processes must point it at a
+shared backend for invalidations to reach all of them.
+
+Pages read from a read replica are cached apart from those read from the primary, and for no
+longer than REPLICA_MAX_LAG_SECONDS, so a client pinned to the primary after a write always
+sees it.
+"""
+
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+from icecreamtruck.routers import reading_from_replica
+
+FLEET = 'fleet'
+
+
+def inventory_cache():
+    return caches[settings.INVENTORY_CACHE_ALIAS]
+
+
+def generation_key(scope):
+    return f'inventory:generation:{scope}'
+
+
+def new_generation():
+    return uuid.uuid4().hex, time.time()
+
+
+def get_generation(scope):
+    """
+    Returns the (token, start timestamp) of the current generation of a scope.
+    """
+    cache = inventory_cache()
+    generation = cache.get(generation_key(scope))
+    if generation is None:
+        generation = new_generation()
+        if not cache.add(generation_key(scope), generation, None):
+            generation = cache.get(generation_key(scope), generation)
+    return generation
+
+
+async def aget_generation(scope):
+    cache = inventory_cache()
+    generation = await cache.aget(generation_key(scope))
+    if generation is None:
+        generation = new_generation()
+        if not await cache.aadd(generation_key(scope), generation, None):
+            generation = await cache.aget(generation_key(scope), generation)
+    return generation
+
+
+def invalidate_inventory(*truck_ids):
+    """
+    Starts a new generation for the fleet and for the given trucks.
+    """
+    generation = new_generation()
+    inventory_cache().set_many({generation_key(scope): generation for scope in (FLEET, *truck_ids)}, None)
+
+
+def inventory_timeout():
+    # data read from a lagging replica may predate the last invalidation
+    if reading_from_replica():
+        return min(settings.INVENTORY_CACHE_TIMEOUT, settings.REPLICA_MAX_LAG_SECONDS)
+    return settings.INVENTORY_CACHE_TIMEOUT
+
+
+def inventory_key(scope, token, request):
+    # keyed by the full URL, as pages hold absolute links, and apart for pages read from a
+    # replica: one that lags may still serve data from before the generation started, which
+    # clients reading their own writes from the primary must never get
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    source = 'replica' if reading_from_replica() else 'primary'
+    return f'inventory:{scope}:{token}:{source}:{url}'
+
+
+def cached_inventory(scope, request, build):
+    """
+    Returns the inventory data for a request from the cache, calling build() and caching its
+    result on a miss.
+    """
+    token, _ = get_generation(scope)
+    key = inventory_key(scope, token, request)
+
+    cache = inventory_cache()
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, inventory_timeout())
+    return data
+
+
+async def acached_inventory(scope, request, build):
+    """
+    Async cached_inventory(), awaiting build() on a miss.
+    """
+    token, _ = await aget_generation(scope)
+    key = inventory_key(scope, token, request)
+
+    cache = inventory_cache()
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, inventory_timeout())
+    return data
+
+
+def generation_validators(generation, request):
+    """
+    Returns the ETag and Last-Modified date of an inventory response from its generation.
+    """
+    token, started = generation
+    etag = hashlib.md5(f'{token}:{request.get_full_path()}'.encode()).hexdigest()
+    return etag, datetime.fromtimestamp(started, tz=timezone.utc)
+
+
+def inventory_etag(request, pk=None):
+    return generation_validators(get_generation(FLEET if pk is None else pk), request)[0]
+
+
+def inventory_last_modified(request, pk=None):
+    return generation_validators(get_generation(FLEET if pk is None else pk), request)[1]
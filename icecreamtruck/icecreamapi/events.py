@@ -0,0 +1,230 @@
+"""
+Live stock level events, published per truck to the clients streaming them.
+
+Purchases publish the new stock level of the food items they sold from, once committed, and
+a 'sold_out' event for items left without stock. Nothing is read or published for trucks
+nobody is listening to.
+
+The broker is the class named by STOCK_EVENTS_BROKER. The default InProcessBroker only reaches
+the clients connected to the same process. Deployments running several processes use the
+PollingBroker, which finds the changes made by any process in the database, or a broker
+backed by a shared pub/sub (e.g. Redis) implementing StockEventBroker.
+"""
+
+import abc
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import FoodItem
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.STOCK_EVENTS_BROKER)()
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'STOCK_EVENTS_BROKER':
+        _broker = None
+
+
+class Subscription:
+    """
+    Queue of the events of a truck for one client, consumed on the client's event loop.
+
+    A client falling more than STOCK_EVENTS_MAX_QUEUED events behind gets a None instead of
+    the events it missed, and should reconnect to start again from the current stock levels.
+    """
+
+    def __init__(self, truck_id):
+        self.truck_id = truck_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(settings.STOCK_EVENTS_MAX_QUEUED)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class StockEventBroker(abc.ABC):
+    """
+    Interface of the stock event brokers.
+    """
+
+    # whether the broker finds the changes by itself, so purchases need not publish them
+    polls = False
+
+    @abc.abstractmethod
+    def has_subscribers(self, truck_id):
+        pass
+
+    @abc.abstractmethod
+    def subscribe(self, truck_id):
+        """
+        Returns a new Subscription to the events of a truck. Called on the client's event loop.
+        """
+
+    @abc.abstractmethod
+    def unsubscribe(self, subscription):
+        pass
+
+    @abc.abstractmethod
+    def publish(self, truck_id, event):
+        """
+        Delivers an event to the subscribers of a truck. Called from any thread.
+        """
+
+
+class InProcessBroker(StockEventBroker):
+    """
+    Broker delivering events to the subscribers connected to the current process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def has_subscribers(self, truck_id):
+        return bool(self.subscriptions.get(truck_id))
+
+    def subscribe(self, truck_id):
+        subscription = Subscription(truck_id)
+        with self.lock:
+            self.subscriptions[truck_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.truck_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.truck_id, None)
+
+    def publish(self, truck_id, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(truck_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # the client's event loop is gone
+                self.unsubscribe(subscription)
+
+
+class PollingBroker(InProcessBroker):
+    """
+    Broker for deployments running several processes, without a shared pub/sub.
+
+    Each process reads the stock levels of the trucks its clients are subscribed to every
+    STOCK_EVENTS_POLL_SECONDS, in one query, and delivers the ones that changed since the last
+    read, whichever process made the change. Events are delayed by up to a poll interval. The
+    polling thread starts with the first subscription and stops when there are none left.
+    """
+
+    polls = True
+
+    def __init__(self):
+        super().__init__()
+        self.levels = {}
+        self.thread = None
+
+    def subscribe(self, truck_id):
+        subscription = super().subscribe(truck_id)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='stock-events-poller', daemon=True)
+                self.thread.start()
+        return subscription
+
+    def publish(self, truck_id, event):
+        # changes are found by polling, so the ones made by this process are not told apart
+        pass
+
+    def run(self):
+        try:
+            while True:
+                time.sleep(settings.STOCK_EVENTS_POLL_SECONDS)
+                with self.lock:
+                    if not self.subscriptions:
+                        self.thread = None
+                        return
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("Could not poll the stock levels")
+                    connection.close()
+        finally:
+            connection.close()
+
+    def poll(self):
+        """
+        Delivers the stock levels that changed since the last poll. Those of trucks just
+        subscribed to are all delivered, as they may have changed since their clients read them.
+        """
+        with self.lock:
+            truck_ids = list(self.subscriptions)
+        levels = {}
+        for food_item_id, truck_id, quantity in FoodItem.objects.filter(truck_id__in=truck_ids).stock_levels():
+            levels[food_item_id] = quantity
+            if self.levels.get(food_item_id) != quantity:
+                for event_type, event in stock_events([(food_item_id, truck_id, quantity)]):
+                    super().publish(truck_id, (event_type, event))
+        self.levels = levels
+
+
+def stock_events(food_items):
+    """
+    Returns the events announcing the stock levels of food items, given as (id, truck ID,
+    quantity) tuples.
+    """
+    events = []
+    for food_item_id, truck_id, quantity in food_items:
+        event = {'truck': truck_id, 'food_item': food_item_id, 'quantity': quantity}
+        events.append(('stock', event))
+        if quantity <= 0:
+            events.append(('sold_out', event))
+    return events
+
+
+def publish_stock_levels(truck_ids, food_item_ids):
+    """
+    Publishes the stock levels of food items of the given trucks once the current transaction
+    commits, if anyone is listening to them and the broker does not poll for them.
+    """
+    broker = get_broker()
+    if broker.polls:
+        return
+    truck_ids = [truck_id for truck_id in set(truck_ids) if broker.has_subscribers(truck_id)]
+    if not truck_ids:
+        return
+
+    def publish():
+        food_items = FoodItem.objects.filter(id__in=food_item_ids, truck_id__in=truck_ids)
+        for event_type, event in stock_events(food_items.stock_levels()):
+            broker.publish(event['truck'], (event_type, event))
+
+    transaction.on_commit(publish)
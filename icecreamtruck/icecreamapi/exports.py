@@ -0,0 +1,45 @@
+"""
+Streaming export of the sales, as CSV or JSON Lines.
+
+Sales are read with values_list() and QuerySet.iterator(), SALES_EXPORT_CHUNK_SIZE rows at a
+time, so no model instances are built and memory stays flat whatever the number of sales.
+Rows are written out in batches of one chunk, each sent as a single piece of the response.
+"""
+
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+COLUMNS = ['id', 'purchase_time', 'truck_id', 'food_item_id', 'user_id', 'quantity', 'unit_price', 'line_total']
+
+
+def export_sales(sales, format):
+    """
+    Yields a queryset of sales in the given format, piece by piece.
+    """
+    rows = sales.values_list(*COLUMNS).iterator(chunk_size=settings.SALES_EXPORT_CHUNK_SIZE)
+    if format == 'csv':
+        write = write_csv
+        yield ','.join(COLUMNS) + '\r\n'
+    else:
+        write = write_jsonl
+    while chunk := list(islice(rows, settings.SALES_EXPORT_CHUNK_SIZE)):
+        yield write(chunk)
+
+
+def write_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows((id, purchase_time.isoformat(), *rest) for id, purchase_time, *rest in rows)
+    return buffer.getvalue()
+
+
+def write_jsonl(rows):
+    encoder = DjangoJSONEncoder()
+    return ''.join(encoder.encode(dict(zip(COLUMNS, row))) + '\n' for row in rows)
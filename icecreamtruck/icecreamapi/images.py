@@ -0,0 +1,129 @@
+"""
+Metadata stripping of uploaded food item images, and background generation of their resized
+variants.
+
+Uploads are re-encoded without their EXIF metadata, which may hold the location a photo was
+taken at, before they are stored. The variants listed in FOOD_ITEM_IMAGE_VARIANTS are
+generated afterwards by a small thread pool in the web process, so the upload request does
+not wait for them. Every variant is saved as JPEG and WebP in the food item's image storage,
+which references the variants it replaces no more.
+
+Pending work lives in memory only: images whose processing was lost with a restarting
+process are picked up again by the generate_image_variants management command.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_inventory
+from .models import FoodItem, Truck
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'jpeg': 'JPEG',
+    'webp': 'WEBP',
+}
+
+# quality of the JPEG and WebP uploads re-encoded without their metadata
+UPLOAD_QUALITY = 95
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS, thread_name_prefix='food-item-images'
+        )
+    return _executor
+
+
+def strip_metadata(upload):
+    """
+    Re-encodes an uploaded image in place, in its format, without its metadata and with its
+    EXIF orientation applied. Returns the upload.
+    """
+    with Image.open(upload) as image:
+        image_format = image.format
+        # the color profile is kept, as dropping it would shift the colors
+        icc_profile = image.info.get('icc_profile')
+        # read in full, before the file is written over
+        image = ImageOps.exif_transpose(image)
+    upload.seek(0)
+    image.save(upload, image_format, quality=UPLOAD_QUALITY, icc_profile=icc_profile)
+    upload.truncate()
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
+
+
+def schedule_image_variants(food_item_id):
+    """
+    Generates the image variants of a food item once the current transaction commits, in the
+    background unless IMAGE_PROCESSING_EAGER is set.
+    """
+    if settings.IMAGE_PROCESSING_EAGER:
+        transaction.on_commit(lambda: generate_image_variants(food_item_id))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_generate_in_background, food_item_id))
+
+
+def _generate_in_background(food_item_id):
+    close_old_connections()
+    try:
+        generate_image_variants(food_item_id)
+    except Exception:
+        logger.exception("Could not generate the image variants of food item %s", food_item_id)
+    finally:
+        close_old_connections()
+
+
+def generate_image_variants(food_item_id):
+    """
+    Generates and records the image variants of a food item.
+    """
+    food_item = FoodItem.objects.only('id', 'image', 'image_variants', 'truck_id').filter(id=food_item_id).first()
+    if food_item is None or not food_item.image:
+        return
+
+    with food_item.image.open('rb') as image_file:
+        original = Image.open(image_file)
+        # apply the EXIF orientation before the metadata is dropped
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    storage = food_item.image.storage
+    variants = {}
+    for name, size in settings.FOOD_ITEM_IMAGE_VARIANTS.items():
+        resized = original.copy()
+        resized.thumbnail((size, size))
+        variants[name] = {}
+        for extension, image_format in FORMATS.items():
+            image = resized
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            content = BytesIO()
+            image.save(content, image_format, quality=settings.IMAGE_VARIANT_QUALITY)
+            path = f'images/variants/{food_item.id}/{name}.{extension}'
+            variants[name][extension] = storage.save(path, ContentFile(content.getvalue()))
+
+    # skip recording variants of an image that was replaced in the meantime, and release the
+    # variants that are not kept
+    with transaction.atomic():
+        if FoodItem.objects.filter(id=food_item.id, image=food_item.image.name).touch(image_variants=variants):
+            Truck.objects.filter(id=food_item.truck_id).touch()
+            transaction.on_commit(lambda: invalidate_inventory(food_item.truck_id))
+            replaced = food_item.image_variants
+        else:
+            replaced = variants
+        for variant in replaced.values():
+            for name in variant.values():
+                storage.delete(name)
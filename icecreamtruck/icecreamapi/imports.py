@@ -0,0 +1,204 @@
+"""
+Bulk import of trucks, food items and restocks from CSV or JSON Lines.
+
+Every row has an 'action' and the fields of that action:
+- 'truck': 'name', creates a truck.
+- 'food_item': 'truck' (an ID), 'name', 'price', 'quantity', and optionally 'item_type' and
+  'flavour', creates a food item.
+- 'restock': 'food_item' (an ID) and 'quantity', adds that quantity to the food item's stock.
+
+CSV files have a header row naming the columns, and leave the cells of the fields a row does
+not use empty. JSON Lines files have one JSON object per line.
+
+The input is read as a stream, IMPORT_CHUNK_SIZE rows at a time. Each chunk is validated with
+one query per referenced model, then applied in its own transaction with bulk inserts and a
+single UPDATE for all its restocks, so memory stays flat whatever the size of the input.
+Invalid rows are skipped and reported by row number, up to IMPORT_MAX_ERRORS of them; the
+valid rows are imported. Food items can only refer to trucks that existed before the chunk.
+"""
+
+import codecs
+import csv
+import json
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from .cache import invalidate_inventory
+from .events import publish_stock_levels
+from .models import FoodFlavor, FoodItem, Truck
+from .serializers import FoodItemImportSerializer, ImportRowSerializer, RestockImportSerializer, TruckImportSerializer
+
+FORMATS = ['csv', 'jsonl']
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/jsonl': 'jsonl',
+    'application/x-ndjson': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+}
+ROW_SERIALIZERS = {
+    'truck': TruckImportSerializer,
+    'food_item': FoodItemImportSerializer,
+    'restock': RestockImportSerializer,
+}
+
+
+class ImportResult:
+    """
+    Counts of what an import created and restocked, and the errors of its invalid rows.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.trucks_created = 0
+        self.food_items_created = 0
+        self.restocks = 0
+        self.units_restocked = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.error_count += 1
+        if len(self.errors) < settings.IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'trucks_created': self.trucks_created,
+            'food_items_created': self.food_items_created,
+            'restocks': self.restocks,
+            'units_restocked': self.units_restocked,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def read_rows(lines, format):
+    """
+    Yields the rows of an input given as an iterable of byte lines, as (row number, fields)
+    pairs. Fields are None for a line that cannot be parsed.
+    """
+    text = codecs.iterdecode(lines, 'utf-8-sig')
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            # empty cells are fields the row does not use
+            yield number, {field: value for field, value in row.items() if field is not None and value != ''}
+    else:
+        number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+
+
+def import_rows(rows, chunk_size=None):
+    """
+    Imports (row number, fields) pairs chunk by chunk, and returns the ImportResult.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    result = ImportResult()
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        result.rows += len(chunk)
+        import_chunk(chunk, result)
+    return result
+
+
+class RowValidator:
+    """
+    Validates rows with one instance of each row serializer, whose fields are built once
+    rather than for every row.
+    """
+
+    def __init__(self):
+        self.action = ImportRowSerializer()
+        self.serializers = {action: serializer() for action, serializer in ROW_SERIALIZERS.items()}
+
+    def validate(self, fields):
+        """
+        Returns the action and validated data of a row, or None and its errors.
+        """
+        if fields is None:
+            return None, {'non_field_errors': ["Not a valid row."]}
+        try:
+            action = self.action.run_validation(fields)['action']
+            return action, self.serializers[action].run_validation(fields)
+        except ValidationError as error:
+            return None, as_serializer_error(error)
+
+
+def import_chunk(chunk, result):
+    validator = RowValidator()
+    valid = {action: [] for action in ROW_SERIALIZERS}
+    for number, fields in chunk:
+        action, data = validator.validate(fields)
+        if action is None:
+            result.add_error(number, data)
+        else:
+            valid[action].append((number, data))
+
+    # rows referring to a missing truck or food item are errors too
+    trucks = Truck.objects.filter(id__in={data['truck'] for _, data in valid['food_item']})
+    truck_ids = set(trucks.values_list('id', flat=True))
+    new_food_items = []
+    for number, data in valid['food_item']:
+        if data['truck'] in truck_ids:
+            new_food_items.append(data)
+        else:
+            result.add_error(number, {'truck': ["Truck not found."]})
+
+    restocked = FoodItem.objects.filter(id__in={data['food_item'] for _, data in valid['restock']})
+    restocked_items = dict(restocked.values_list('id', 'truck_id'))
+    quantities = Counter()
+    for number, data in valid['restock']:
+        if data['food_item'] in restocked_items:
+            quantities[data['food_item']] += data['quantity']
+            result.restocks += 1
+        else:
+            result.add_error(number, {'food_item': ["Food item not found."]})
+
+    if not (valid['truck'] or new_food_items or quantities):
+        return
+
+    changed_trucks = {data['truck'] for data in new_food_items}
+    changed_trucks.update(restocked_items[food_item_id] for food_item_id in quantities)
+    with transaction.atomic():
+        Truck.objects.bulk_create(Truck(name=data['name']) for _, data in valid['truck'])
+        food_items = FoodItem.objects.bulk_create(
+            FoodItem(
+                truck_id=data['truck'],
+                name=data['name'],
+                price=data['price'],
+                quantity=data['quantity'],
+                item_type=data['item_type'],
+            )
+            for data in new_food_items
+        )
+        FoodFlavor.objects.bulk_create(
+            FoodFlavor(name=data['flavour'], food_item=food_item)
+            for food_item, data in zip(food_items, new_food_items)
+            if 'flavour' in data
+        )
+        if quantities:
+            FoodItem.objects.increment_stock_bulk(quantities)
+
+        # bulk changes send no signals, so the trucks are touched and their inventory
+        # invalidated here
+        if changed_trucks:
+            Truck.objects.filter(id__in=changed_trucks).touch()
+        transaction.on_commit(lambda: invalidate_inventory(*changed_trucks))
+        publish_stock_levels(changed_trucks, list(quantities))
+
+    result.trucks_created += len(valid['truck'])
+    result.food_items_created += len(food_items)
+    result.units_restocked += sum(quantities.values())
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from icecreamtruck.icecreamapi.images import generate_image_variants
+from icecreamtruck.icecreamapi.models import FoodItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the resized variants of food item images that have none yet, e.g. because "
+        "the process handling their upload restarted before getting to them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', help="Regenerate the variants of every image, e.g. after changing sizes."
+        )
+
+    def handle(self, *args, **options):
+        food_items = FoodItem.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            food_items = food_items.filter(image_variants={})
+
+        count = 0
+        for food_item_id in food_items.values_list('id', flat=True).iterator():
+            generate_image_variants(food_item_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated image variants for {count} food item(s)."))
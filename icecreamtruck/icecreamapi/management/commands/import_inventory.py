@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from icecreamtruck.icecreamapi.imports import FORMATS, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports trucks, food items and restocks from a CSV or JSON Lines file, or from the "
+        "standard input with '-'. See icecreamapi/imports.py for the format of the rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for the standard input.")
+        parser.add_argument(
+            '--format', choices=FORMATS, help="Format of the input, by default from the file extension."
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, help="Rows imported per transaction, IMPORT_CHUNK_SIZE by default."
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format']
+        if format is None:
+            suffix = Path(path).suffix.lower().lstrip('.')
+            format = {'ndjson': 'jsonl'}.get(suffix, suffix)
+            if format not in FORMATS:
+                raise CommandError("Give the --format of the input.")
+
+        if path == '-':
+            result = import_rows(read_rows(sys.stdin.buffer, format), options['chunk_size'])
+        else:
+            try:
+                with open(path, 'rb') as file:
+                    result = import_rows(read_rows(file, format), options['chunk_size'])
+            except OSError as error:
+                raise CommandError(error)
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... and {result.error_count - len(result.errors)} more invalid row(s).")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.rows - result.error_count} of {result.rows} row(s): "
+                f"{result.trucks_created} truck(s) and {result.food_items_created} food item(s) created, "
+                f"{result.units_restocked} unit(s) restocked in {result.restocks} restock(s)."
+            )
+        )
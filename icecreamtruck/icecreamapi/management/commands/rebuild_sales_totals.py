@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from icecreamtruck.icecreamapi.cache import invalidate_inventory
+from icecreamtruck.icecreamapi.models import Truck
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the running sales totals stored on every truck, and its sales shards, from its sales history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--truck', type=int, action='append', dest='trucks', help="Only rebuild this truck.")
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only report the trucks whose stored totals differ from their sales history.",
+        )
+
+    def handle(self, *args, **options):
+        trucks = Truck.objects.all()
+        if options['trucks']:
+            trucks = trucks.filter(id__in=options['trucks'])
+
+        if not options['check']:
+            updated = trucks.rebuild_sales_totals()
+            invalidate_inventory(*trucks.values_list('id', flat=True))
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt sales totals for {updated} truck(s)."))
+            return
+
+        drifted = (
+            trucks.with_sales_totals()
+            .with_sales_history()
+            .filter(
+                ~Q(history_sales_total=F('sales_total') + F('shard_sales_total'))
+                | ~Q(history_units_sold=F('units_sold') + F('shard_units_sold'))
+            )
+        )
+        count = 0
+        for truck in drifted.order_by('id'):
+            count += 1
+            self.stdout.write(
+                f"{truck} (id {truck.id}): stored {truck.total_sales()} for {truck.total_units_sold()} units, "
+                f"history has {truck.history_sales_total} for {truck.history_units_sold} units"
+            )
+
+        if count:
+            self.stdout.write(self.style.WARNING(f"{count} truck(s) have drifted from their sales history."))
+        else:
+            self.stdout.write(self.style.SUCCESS("All sales totals match the sales history."))
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from icecreamtruck.icecreamapi.models import RollupWatermark, Sale, SalesRollup
+
+WATERMARK_NAME = 'sales_rollup'
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the sales recorded since the last run to the hourly and daily sales rollups. "
+        "Run it periodically, e.g. every minute from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Number of sales rolled up per transaction.")
+        parser.add_argument(
+            '--settle-seconds',
+            type=int,
+            default=5,
+            help=(
+                "Leave sales younger than this for the next run, so purchases still committing "
+                "with a lower id are not skipped by the watermark."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['settle_seconds'])
+        RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+
+        rolled_up = 0
+        while True:
+            with transaction.atomic():
+                watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+                pending = Sale.objects.filter(id__gt=watermark.last_sale_id).order_by('id')
+                # ids and purchase times of concurrent purchases are not in the same order, so
+                # the batch stops below the first unsettled sale rather than skipping it, which
+                # would move the watermark past it for good
+                unsettled_id = pending.filter(purchase_time__gt=cutoff).values_list('id', flat=True).first()
+                if unsettled_id is not None:
+                    pending = pending.filter(id__lt=unsettled_id)
+                sale_ids = list(pending.values_list('id', flat=True)[: options['batch_size']])
+                if not sale_ids:
+                    break
+
+                # the rollup and the watermark move together, so no sale is ever counted twice
+                SalesRollup.objects.add_sales(Sale.objects.filter(id__in=sale_ids))
+                watermark.last_sale_id = sale_ids[-1]
+                watermark.save(update_fields=['last_sale_id', 'updated_at'])
+                rolled_up += len(sale_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {rolled_up} sale(s)."))
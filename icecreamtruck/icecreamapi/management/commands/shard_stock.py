@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from icecreamtruck.icecreamapi.models import FoodItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Spreads the stock of a popular food item over several stock shards, so concurrent purchases of it "
+        "update different rows, or merges it back into the food item with --shards 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('food_item', type=int, help="ID of the food item.")
+        parser.add_argument('--shards', type=int, default=8, help="Number of stock shards, 0 to merge them.")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError("The number of shards must be between 0 and 256.")
+        try:
+            food_item = FoodItem.objects.get(id=options['food_item'])
+        except FoodItem.DoesNotExist:
+            raise CommandError(f"Food item {options['food_item']} does not exist.")
+
+        food_item.reshard_stock(options['shards'])
+        if food_item.stock_shards:
+            message = f"Spread the {food_item.stock} unit(s) of {food_item} over {food_item.stock_shards} shard(s)."
+        else:
+            message = f"Merged the {food_item.stock} unit(s) of {food_item} back into the food item."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from icecreamtruck.icecreamapi.reservations import reclaim_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Puts the stock held by expired reservations back in stock, in batches of oldest first. Run it "
+        "periodically, or keep it running with --interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Reservations reclaimed per transaction.")
+        parser.add_argument('--interval', type=float, help="Keep sweeping, waiting this many seconds after each sweep.")
+
+    def handle(self, *args, **options):
+        while True:
+            reclaimed = 0
+            while batch := reclaim_expired(options['batch_size']):
+                reclaimed += batch
+            if reclaimed or options['interval'] is None:
+                self.stdout.write(self.style.SUCCESS(f"Reclaimed {reclaimed} expired reservation(s)."))
+
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
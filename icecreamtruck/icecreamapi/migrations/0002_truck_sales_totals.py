@@ -0,0 +1,38 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:41
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_sales_totals(apps, schema_editor):
+    Sale = apps.get_model("icecreamapi", "Sale")
+    Truck = apps.get_model("icecreamapi", "Truck")
+
+    sales = Sale.objects.filter(truck=OuterRef("pk")).values("truck")
+    amount = sales.annotate(amount=Sum(F("food_item__price") * F("quantity"))).values("amount")
+    units = sales.annotate(units=Sum("quantity")).values("units")
+    Truck.objects.update(
+        sales_total=Coalesce(Subquery(amount), 0, output_field=models.DecimalField()),
+        units_sold=Coalesce(Subquery(units), 0),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="truck",
+            name="sales_total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="truck",
+            name="units_sold",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sales_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0002_truck_sales_totals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sale",
+            name="unit_price",
+            field=models.DecimalField(
+                decimal_places=2,
+                max_digits=8,
+                null=True,
+                validators=[django.core.validators.MinValueValidator(0)],
+            ),
+        ),
+        migrations.AddField(
+            model_name="sale",
+            name="line_total",
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+    ]
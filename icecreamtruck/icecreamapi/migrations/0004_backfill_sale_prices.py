@@ -0,0 +1,35 @@
+from django.db import migrations, transaction
+from django.db.models import F, OuterRef, Subquery
+
+BATCH_SIZE = 10000
+
+
+def backfill_sale_prices(apps, schema_editor):
+    """
+    Snapshots each existing sale's price from its food item, a batch of rows per transaction,
+    so the backfill never holds a lock on the whole sales table.
+    """
+    FoodItem = apps.get_model("icecreamapi", "FoodItem")
+    Sale = apps.get_model("icecreamapi", "Sale")
+    db_alias = schema_editor.connection.alias
+
+    price = Subquery(FoodItem.objects.using(db_alias).filter(id=OuterRef("food_item")).values("price")[:1])
+    pending = Sale.objects.using(db_alias).filter(unit_price__isnull=True).order_by("id")
+    while True:
+        with transaction.atomic(using=db_alias):
+            ids = list(pending.values_list("id", flat=True)[:BATCH_SIZE])
+            if not ids:
+                break
+            Sale.objects.using(db_alias).filter(id__in=ids).update(unit_price=price, line_total=price * F("quantity"))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("icecreamapi", "0003_sale_unit_price_line_total"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sale_prices, migrations.RunPython.noop),
+    ]
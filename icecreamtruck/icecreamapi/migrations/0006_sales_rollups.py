@@ -0,0 +1,85 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0005_sale_price_not_null"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("last_sale_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SalesRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularity",
+                    models.CharField(choices=[("hour", "Hour"), ("day", "Day")], max_length=10),
+                ),
+                ("bucket_start", models.DateTimeField()),
+                ("units", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "food_item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_rollups",
+                        to="icecreamapi.fooditem",
+                    ),
+                ),
+                (
+                    "truck",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_rollups",
+                        to="icecreamapi.truck",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["granularity", "bucket_start"],
+                        name="sales_rollup_bucket_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="salesrollup",
+            constraint=models.UniqueConstraint(
+                fields=("granularity", "truck", "food_item", "bucket_start"),
+                name="unique_sales_rollup_bucket",
+            ),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0006_sales_rollups"),
+    ]
+
+    operations = [
+        # create the composite indexes before dropping the foreign key indexes they replace
+        migrations.AddIndex(
+            model_name="foodflavor",
+            index=models.Index(fields=["food_item", "name"], name="foodflavor_item_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="fooditem",
+            index=models.Index(fields=["truck", "item_type"], name="fooditem_truck_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(fields=["truck", "purchase_time"], name="sale_truck_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(fields=["food_item", "purchase_time"], name="sale_item_time_idx"),
+        ),
+        migrations.AlterField(
+            model_name="foodflavor",
+            name="food_item",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="icecreamapi.fooditem",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="fooditem",
+            name="truck",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="food_items",
+                to="icecreamapi.truck",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="sale",
+            name="food_item",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="icecreamapi.fooditem",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="sale",
+            name="truck",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="sales",
+                to="icecreamapi.truck",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="fooditem",
+            constraint=models.CheckConstraint(
+                check=models.Q(("quantity__gte", 0)),
+                name="fooditem_quantity_non_negative",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0007_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fooditem",
+            name="updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="fooditem",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="truck",
+            name="updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="truck",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0008_version_stamps"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fooditem",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:58
+
+from django.db import migrations, models
+import icecreamtruck.icecreamapi.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0009_fooditem_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("references", models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="fooditem",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=icecreamtruck.icecreamapi.storage.get_food_item_image_storage,
+                upload_to="images/",
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0010_image_blobs"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(fields=["purchase_time"], name="sale_time_idx"),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0011_sale_time_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fooditem",
+            name="stock_shards",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="StockShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(default=1)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("quantity", models.IntegerField(default=0)),
+                (
+                    "food_item",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="icecreamapi.fooditem",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="stockshard",
+            constraint=models.UniqueConstraint(fields=("food_item", "shard"), name="unique_stock_shard"),
+        ),
+        migrations.AddConstraint(
+            model_name="stockshard",
+            constraint=models.CheckConstraint(
+                check=models.Q(("quantity__gte", 0)),
+                name="stockshard_quantity_non_negative",
+            ),
+        ),
+    ]
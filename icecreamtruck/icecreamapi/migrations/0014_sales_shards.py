@@ -0,0 +1,52 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("icecreamapi", "0013_stock_reservations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(default=1)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("shard", models.PositiveSmallIntegerField()),
+                (
+                    "sales_total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("units_sold", models.PositiveIntegerField(default=0)),
+                (
+                    "truck",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_shards",
+                        to="icecreamapi.truck",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="salesshard",
+            constraint=models.UniqueConstraint(fields=("truck", "shard"), name="unique_sales_shard"),
+        ),
+    ]
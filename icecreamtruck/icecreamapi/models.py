@@ -1,29 +1,241 @@
+import random
+import uuid
+from collections import defaultdict
+
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import F, Sum
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Max, OuterRef, Prefetch, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Greatest, TruncDay, TruncHour
+from django.utils import timezone
+
+from .storage import get_food_item_image_storage
+
+
+class VersionedQuerySet(models.QuerySet):
+    def touch(self, **changes):
+        """
+        Updates the matching rows with the given changes, if any, and bumps their version.
+        """
+        return self.update(version=F('version') + 1, updated_at=timezone.now(), **changes)
+
+    def version_stamps(self):
+        """
+        Returns the (version, last change time) pairs the matching objects are revalidated with.
+        """
+        return self.values_list('version', 'updated_at')
+
+    def version_stamps_with(self, *related):
+        """
+        Returns the version stamps of the matching objects folded with those of the versioned
+        objects they are represented with, given as (queryset, lookup of the object) pairs: the
+        versions are added up and the latest change time is kept.
+
+        The related objects' versions must be carried over to the object when they are deleted,
+        so its version stamp never goes back to a value clients may have cached.
+        """
+        version = F('version')
+        updated_at = [F('updated_at')]
+        for queryset, lookup in related:
+            rows = queryset.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup)
+            version += Coalesce(Subquery(rows.annotate(versions=Sum('version')).values('versions')), 0)
+            updated_at.append(Coalesce(Subquery(rows.annotate(last=Max('updated_at')).values('last')), 'updated_at'))
+        return self.annotate(stamp_version=version, stamp_updated_at=Greatest(*updated_at)).values_list(
+            'stamp_version', 'stamp_updated_at'
+        )
+
+
+class VersionedModel(models.Model):
+    """
+    Abstract model with a version counter and the time of the last change, both bumped on
+    every change, so clients can revalidate what they cached without loading the object.
+    """
+
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        self.version = F('version') + 1
+        self.updated_at = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+
+class TruckQuerySet(VersionedQuerySet):
+    def with_inventory(self):
+        """
+        Prefetches the food items of every truck, so a list of trucks serializes in a fixed
+        number of queries.
+        """
+        food_items = FoodItem.objects.with_stock().order_by('id')
+        return self.with_sales_totals().prefetch_related(Prefetch('food_items', queryset=food_items))
+
+    def with_sales_totals(self):
+        """
+        Annotates every truck with the sales total and units sold held by its sales shards, as
+        `shard_sales_total` and `shard_units_sold`, so its whole totals are read in the same query.
+        """
+        shards = SalesShard.objects.filter(truck=OuterRef('pk')).values('truck')
+        amount = shards.annotate(amount=Sum('sales_total')).values('amount')
+        units = shards.annotate(units=Sum('units_sold')).values('units')
+        return self.annotate(
+            shard_sales_total=Coalesce(Subquery(amount), 0, output_field=models.DecimalField()),
+            shard_units_sold=Coalesce(Subquery(units), 0),
+        )
+
+    def version_stamps(self):
+        # a truck is represented with its food items, whose stock purchases change without
+        # touching the truck, e.g. when its sales are buffered, and with its sales shards
+        return self.version_stamps_with(
+            (FoodItem.objects, 'truck'), (StockShard.objects, 'food_item__truck'), (SalesShard.objects, 'truck')
+        )
 
+    def record_sales(self, amount, units):
+        """
+        Adds a sales amount and the units sold to the running totals of the matching trucks.
+        """
+        return self.touch(sales_total=F('sales_total') + amount, units_sold=F('units_sold') + units)
+
+    def with_sales_history(self):
+        """
+        Annotates every truck with the sales total and units sold computed from its full
+        sales history, as `history_sales_total` and `history_units_sold`.
+        """
+        return self.annotate(**self._sales_history())
 
-class Truck(models.Model):
+    def rebuild_sales_totals(self):
+        """
+        Recomputes the running totals of the matching trucks from their full sales history, and
+        empties their sales shards.
+
+        Returns the number of trucks updated.
+        """
+        history = self._sales_history()
+        with transaction.atomic(using=self.db):
+            SalesShard.objects.filter(truck__in=self.values('id')).touch(sales_total=0, units_sold=0)
+            return self.touch(sales_total=history['history_sales_total'], units_sold=history['history_units_sold'])
+
+    @staticmethod
+    def _sales_history():
+        sales = Sale.objects.filter(truck=OuterRef('pk')).values('truck')
+        amount = sales.annotate(amount=Sum('line_total')).values('amount')
+        units = sales.annotate(units=Sum('quantity')).values('units')
+        return {
+            'history_sales_total': Coalesce(Subquery(amount), 0, output_field=models.DecimalField()),
+            'history_units_sold': Coalesce(Subquery(units), 0),
+        }
+
+
+class Truck(VersionedModel):
     """
     Ice Cream Truck model representing an ice cream truck.
+
+    The truck's sales total and units sold are kept as running totals, updated in the same
+    transaction as every sale, so reading them never touches the sales history. The sales of
+    sharded food items are added to the truck's sales shards instead (see SalesShard).
     """
 
     name = models.CharField(max_length=100)
+    sales_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+
+    objects = TruckQuerySet.as_manager()
 
     def total_sales(self):
         """
-        Returns the total sales for a given truck.
+        Returns the total sales for a given truck, adding up its sales shards.
+        """
+        return self.sales_total + self._shard_totals()[0]
+
+    def total_units_sold(self):
         """
-        sales = self.sales.annotate(total=F('food_item__price') * F('quantity'))
-        total = sales.aggregate(total_sales=Sum('total'))['total_sales']
-        return total if total else 0
+        Returns the units sold by a given truck, adding up its sales shards.
+        """
+        return self.units_sold + self._shard_totals()[1]
+
+    def _shard_totals(self):
+        if getattr(self, 'shard_sales_total', None) is not None:
+            return self.shard_sales_total, self.shard_units_sold
+        totals = self.sales_shards.aggregate(
+            sales_total=Coalesce(Sum('sales_total'), 0, output_field=models.DecimalField()),
+            units_sold=Coalesce(Sum('units_sold'), 0),
+        )
+        return totals['sales_total'], totals['units_sold']
 
     def __str__(self):
         return self.name
 
 
-class FoodItem(models.Model):
+class FoodItemQuerySet(VersionedQuerySet):
+    def with_stock(self):
+        """
+        Annotates every food item with the stock held by its stock shards, as `shard_stock`,
+        so the stock of sharded food items is read in the same query.
+        """
+        shards = StockShard.objects.filter(food_item=OuterRef('pk')).values('food_item')
+        return self.annotate(shard_stock=Coalesce(Subquery(shards.annotate(stock=Sum('quantity')).values('stock')), 0))
+
+    def stock_levels(self):
+        """
+        Returns the (id, truck ID, quantity) of the matching food items, adding up the stock
+        shards of sharded ones.
+        """
+        return self.with_stock().values_list('id', 'truck_id', F('quantity') + F('shard_stock'))
+
+    def version_stamps(self):
+        # a purchase of a sharded food item changes one of its shards, not the food item
+        return self.version_stamps_with((StockShard.objects, 'food_item'))
+
+    def decrement_stock(self, quantity):
+        """
+        Deducts quantity from the stock of every matching food item that has enough of it left.
+
+        The check and the deduction run as a single conditional UPDATE, so concurrent
+        purchases can never drive the stock below zero. Returns the number of rows updated.
+        """
+        return self.filter(quantity__gte=quantity).touch(quantity=F('quantity') - quantity)
+
+    def decrement_stock_bulk(self, quantities):
+        """
+        Deducts stock for several food items, given as a {food_item_id: quantity} mapping,
+        in a single conditional UPDATE.
+
+        Only rows that still have enough stock are touched, so callers should compare the
+        returned number of updated rows against len(quantities) and roll back on a mismatch.
+        """
+        condition = Q()
+        for food_item_id, quantity in quantities.items():
+            condition |= Q(id=food_item_id, quantity__gte=quantity)
+        deducted = Case(
+            *[When(id=food_item_id, then=F('quantity') - quantity) for food_item_id, quantity in quantities.items()],
+            default=F('quantity'),
+        )
+        return self.filter(condition).touch(quantity=deducted)
+
+    def increment_stock_bulk(self, quantities):
+        """
+        Adds stock to several food items, given as a {food_item_id: quantity} mapping, in a
+        single UPDATE. Returns the number of rows updated.
+
+        The quantities are added to the stock in the database rather than written over it, so
+        purchases made meanwhile are kept.
+        """
+        added = Case(
+            *[When(id=food_item_id, then=F('quantity') + quantity) for food_item_id, quantity in quantities.items()],
+            default=F('quantity'),
+        )
+        return self.filter(id__in=quantities).touch(quantity=added)
+
+
+class FoodItem(VersionedModel):
     """
 
     This model is used to track different food items sold by the ice cream truck.
@@ -40,14 +252,199 @@ class FoodItem(models.Model):
         default='ice_cream',
     )
     price = models.DecimalField(max_digits=8, decimal_places=2, validators=[MinValueValidator(0)])
-    image = models.ImageField(upload_to='images/', blank=True, null=True)
+    # stored once per distinct content, see storage.py
+    image = models.ImageField(upload_to='images/', storage=get_food_item_image_storage, blank=True, null=True)
+    # storage names of the resized copies of the image, by variant name and format
+    image_variants = models.JSONField(default=dict, blank=True)
     name = models.CharField(max_length=100)
+    # the unsharded stock; a sharded food item also holds stock in its stock shards
     quantity = models.IntegerField()
-    truck = models.ForeignKey(Truck, related_name="food_items", on_delete=models.CASCADE)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+    # indexed by the leading column of the (truck, item_type) index
+    truck = models.ForeignKey(Truck, related_name="food_items", on_delete=models.CASCADE, db_index=False)
+
+    objects = FoodItemQuerySet.as_manager()
+
+    class Meta(VersionedModel.Meta):
+        constraints = [
+            models.CheckConstraint(check=Q(quantity__gte=0), name='fooditem_quantity_non_negative'),
+        ]
+        indexes = [
+            models.Index(fields=['truck', 'item_type'], name='fooditem_truck_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_item_type_display()}) - ${self.price}"
 
+    @property
+    def stock(self):
+        """
+        Returns the quantity left, adding up the stock shards of a sharded food item.
+        """
+        if not self.stock_shards:
+            return self.quantity
+        shard_stock = getattr(self, 'shard_stock', None)
+        if shard_stock is None:
+            shard_stock = self.shards.aggregate(stock=Coalesce(Sum('quantity'), 0))['stock']
+        return self.quantity + shard_stock
+
+    def decrement_stock(self, quantity):
+        """
+        Deducts quantity from the stock of the food item, if it has enough of it left. Returns
+        whether it had.
+        """
+        if self.stock_shards:
+            return StockShard.objects.take(self.id, self.stock_shards, quantity)
+        return bool(FoodItem.objects.filter(id=self.id).decrement_stock(quantity))
+
+    def reshard_stock(self, shards):
+        """
+        Spreads the whole stock of the food item evenly over the given number of stock shards,
+        or moves it back to the food item itself with 0 shards. Its truck gets at least as many
+        sales shards.
+        """
+        with transaction.atomic():
+            food_item = FoodItem.objects.select_for_update().get(id=self.id)
+            current = list(StockShard.objects.select_for_update().filter(food_item=food_item))
+            total = food_item.quantity + sum(shard.quantity for shard in current)
+
+            StockShard.objects.filter(food_item=food_item).delete()
+            StockShard.objects.bulk_create(
+                StockShard(food_item=food_item, shard=shard, quantity=total // shards + (shard < total % shards))
+                for shard in range(shards)
+            )
+            # the item's sales go to as many sales shards of its truck, which are never dropped
+            SalesShard.objects.bulk_create(
+                (SalesShard(truck_id=food_item.truck_id, shard=shard) for shard in range(shards)), ignore_conflicts=True
+            )
+            # the dropped shards' versions are carried over, so the food item's version stamp
+            # never goes back to a value clients may have cached
+            FoodItem.objects.filter(id=self.id).update(
+                version=F('version') + sum(shard.version for shard in current) + 1,
+                updated_at=timezone.now(),
+                quantity=0 if shards else total,
+                stock_shards=shards,
+            )
+        self.refresh_from_db(fields=['quantity', 'stock_shards', 'version', 'updated_at'])
+
+
+class StockShardQuerySet(VersionedQuerySet):
+    def take(self, food_item_id, shards, quantity):
+        """
+        Deducts quantity from the stock of a sharded food item. Returns whether it had enough.
+
+        A single conditional UPDATE of a shard picked at random comes first, so concurrent
+        purchases of the item mostly update different rows. When that shard is short, the
+        quantity is swept from the fullest shards and the item's unsharded stock, and the
+        sweep is rolled back if they do not add up to it either.
+        """
+        shard = random.randrange(shards)
+        taken = self.filter(food_item_id=food_item_id, shard=shard, quantity__gte=quantity)
+        if taken.touch(quantity=F('quantity') - quantity):
+            return True
+
+        with transaction.atomic(using=self.db):
+            remaining = quantity
+            stocked = self.filter(food_item_id=food_item_id, quantity__gt=0).order_by('-quantity')
+            for shard_id, available in list(stocked.values_list('id', 'quantity')):
+                taken = min(available, remaining)
+                if self.filter(id=shard_id, quantity__gte=taken).touch(quantity=F('quantity') - taken):
+                    remaining -= taken
+                if not remaining:
+                    return True
+            if FoodItem.objects.filter(id=food_item_id).decrement_stock(remaining):
+                return True
+            transaction.set_rollback(True)
+            return False
+
+
+class StockShard(VersionedModel):
+    """
+    Part of the stock of a food item, so purchases of a popular item do not all update the
+    same row.
+    """
+
+    # indexed by the leading column of the (food_item, shard) constraint
+    food_item = models.ForeignKey(FoodItem, related_name='shards', on_delete=models.CASCADE, db_index=False)
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+
+    objects = StockShardQuerySet.as_manager()
+
+    class Meta(VersionedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['food_item', 'shard'], name='unique_stock_shard'),
+            models.CheckConstraint(check=Q(quantity__gte=0), name='stockshard_quantity_non_negative'),
+        ]
+
+    def __str__(self):
+        return f"Shard {self.shard} of {self.food_item} - {self.quantity} left"
+
+
+class SalesShardQuerySet(VersionedQuerySet):
+    def record_sales(self, truck_id, shards, amount, units):
+        """
+        Adds a sales amount and the units sold to the running totals of a truck. With shards,
+        they go to one of its first `shards` sales shards, picked at random, so concurrent
+        purchases of its sharded food items mostly update different rows. Without, or when the
+        truck has no such shard, they go to the truck itself.
+        """
+        if shards:
+            shard = self.filter(truck_id=truck_id, shard=random.randrange(shards))
+            if shard.touch(sales_total=F('sales_total') + amount, units_sold=F('units_sold') + units):
+                return
+        Truck.objects.filter(id=truck_id).record_sales(amount, units)
+
+
+class SalesShard(VersionedModel):
+    """
+    Part of the running sales totals of a truck, so purchases of its sharded food items do not
+    all update the truck's row.
+    """
+
+    # indexed by the leading column of the (truck, shard) constraint
+    truck = models.ForeignKey(Truck, related_name='sales_shards', on_delete=models.CASCADE, db_index=False)
+    shard = models.PositiveSmallIntegerField()
+    sales_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+
+    objects = SalesShardQuerySet.as_manager()
+
+    class Meta(VersionedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['truck', 'shard'], name='unique_sales_shard'),
+        ]
+
+    def __str__(self):
+        return f"Sales shard {self.shard} of {self.truck} - {self.units_sold} units"
+
+
+class StockReservation(models.Model):
+    """
+
+    This model is used to hold a quantity of a food item, already deducted from its stock, for
+    a checkout until it expires.
+
+    Reservations are deleted once purchased, released or reclaimed after expiring, so the
+    table only ever holds the live ones and those waiting to be reclaimed.
+
+    """
+
+    # unguessable, as it is all it takes to purchase or release the reservation
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    food_item = models.ForeignKey(FoodItem, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # expired reservations are reclaimed oldest first
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.food_item} held until {self.expires_at}"
+
 
 class FoodFlavor(models.Model):
     """
@@ -64,24 +461,236 @@ class FoodFlavor(models.Model):
     ]
 
     name = models.CharField(max_length=20, choices=FLAVORS)
-    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE)
+    # indexed by the leading column of the (food_item, name) index
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['food_item', 'name'], name='foodflavor_item_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class SaleQuerySet(models.QuerySet):
+    def bulk_record(self, sales):
+        """
+        Inserts several sales at once and adds them to their trucks' running totals, with one
+        UPDATE per truck, and per truck sales shard, in a single transaction. Sales without a unit price must have their
+        food item set, so its current price can be snapshotted.
+        """
+        totals = defaultdict(lambda: [0, 0])
+        for sale in sales:
+            sale.snapshot_price()
+            totals[sale.truck_id, sale.stock_shards()][0] += sale.line_total
+            totals[sale.truck_id, sale.stock_shards()][1] += sale.quantity
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            sales = self.bulk_create(sales)
+            for (truck_id, shards), (amount, units) in totals.items():
+                SalesShard.objects.record_sales(truck_id, shards, amount, units)
+        return sales
+
+
 class Sale(models.Model):
     """
 
     This model is used to track individual purchase transactions made by customers.
 
+    The unit price is snapshotted from the food item when the sale is made, so revenue can be
+    summed over the sales table alone and stays correct after a price change.
+
     """
 
-    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE)
-    truck = models.ForeignKey(Truck, related_name='sales', on_delete=models.CASCADE)
+    # both indexed by the leading column of a (foreign key, purchase_time) index
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, db_index=False)
+    truck = models.ForeignKey(Truck, related_name='sales', on_delete=models.CASCADE, db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, validators=[MinValueValidator(0)])
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
     purchase_time = models.DateTimeField(auto_now_add=True)
 
+    objects = SaleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['truck', 'purchase_time'], name='sale_truck_time_idx'),
+            models.Index(fields=['food_item', 'purchase_time'], name='sale_item_time_idx'),
+            # date range exports across the fleet
+            models.Index(fields=['purchase_time'], name='sale_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the sale and, when it is new, adds it to the truck's running totals, or to one of
+        its sales shards for a sharded food item.
+        """
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        self.snapshot_price()
+        # no savepoint, as purchases already save their sale inside a transaction of their own
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+            SalesShard.objects.record_sales(self.truck_id, self.stock_shards(), self.line_total, self.quantity)
+
+        # keep an already loaded truck in step with its new totals
+        if Sale.truck.is_cached(self):
+            self.truck.refresh_from_db(fields=['sales_total', 'units_sold', 'version', 'updated_at'])
+
+    def stock_shards(self):
+        """
+        Returns the number of stock shards of the food item, when it is loaded, whose sales
+        go to as many sales shards of the truck. Otherwise the sale goes to the truck itself.
+        """
+        return self.food_item.stock_shards if Sale.food_item.is_cached(self) else 0
+
+    def snapshot_price(self):
+        """
+        Copies the food item's current price onto the sale, unless a unit price was given,
+        and computes the line total.
+        """
+        if self.unit_price is None:
+            self.unit_price = self.food_item.price
+        self.unit_price = self._meta.get_field('unit_price').to_python(self.unit_price)
+        self.line_total = self.unit_price * self.quantity
+
     def __str__(self):
         return f"Sale of {self.quantity} x {self.food_item}"
+
+
+class SalesRollupQuerySet(models.QuerySet):
+    def add_sales(self, sales):
+        """
+        Adds a queryset of sales to the hourly and daily rollups of their trucks and food items.
+
+        Existing buckets are incremented and missing ones created, with one bulk update and
+        one bulk insert per granularity. Callers are responsible for never adding a sale twice.
+        """
+        for granularity, truncate in ((SalesRollup.HOUR, TruncHour), (SalesRollup.DAY, TruncDay)):
+            totals = {
+                (row['truck_id'], row['food_item_id'], row['bucket_start']): row
+                for row in sales.annotate(bucket_start=truncate('purchase_time'))
+                .values('truck_id', 'food_item_id', 'bucket_start')
+                .annotate(units=Sum('quantity'), revenue=Sum('line_total'))
+                .order_by()
+            }
+            if not totals:
+                continue
+
+            existing = self.filter(
+                granularity=granularity,
+                truck_id__in={truck_id for truck_id, _, _ in totals},
+                food_item_id__in={food_item_id for _, food_item_id, _ in totals},
+                bucket_start__in={bucket_start for _, _, bucket_start in totals},
+            )
+            updated = []
+            for rollup in existing:
+                row = totals.pop((rollup.truck_id, rollup.food_item_id, rollup.bucket_start), None)
+                if row is not None:
+                    rollup.units += row['units']
+                    rollup.revenue += row['revenue']
+                    updated.append(rollup)
+
+            self.bulk_update(updated, ['units', 'revenue'])
+            self.bulk_create(SalesRollup(granularity=granularity, **row) for row in totals.values())
+
+
+class SalesRollup(models.Model):
+    """
+
+    This model is used to store units sold and revenue per truck and food item over an hour or a day.
+
+    Rollups are maintained incrementally from the sales table by the rollup_sales management
+    command, so sales reports never have to aggregate raw sales.
+
+    """
+
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITIES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    truck = models.ForeignKey(Truck, related_name='sales_rollups', on_delete=models.CASCADE)
+    food_item = models.ForeignKey(FoodItem, related_name='sales_rollups', on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=10, choices=GRANULARITIES)
+    bucket_start = models.DateTimeField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = SalesRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'truck', 'food_item', 'bucket_start'], name='unique_sales_rollup_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start'], name='sales_rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_granularity_display()} from {self.bucket_start} - {self.units} x {self.food_item}"
+
+
+class RollupWatermark(models.Model):
+    """
+
+    This model is used to remember the last sale already added to the sales rollups.
+
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    last_sale_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} up to sale {self.last_sale_id}"
+
+
+class ImageBlobQuerySet(models.QuerySet):
+    def add_reference(self, name):
+        """
+        Counts a new reference to a stored file. Returns whether it is the first one.
+        """
+        with transaction.atomic():
+            if self.filter(name=name).update(references=F('references') + 1):
+                return False
+            try:
+                with transaction.atomic():
+                    self.create(name=name)
+            except IntegrityError:
+                # counted concurrently
+                self.filter(name=name).update(references=F('references') + 1)
+                return False
+            return True
+
+    def remove_reference(self, name):
+        """
+        Drops a reference to a stored file. Returns whether it was the last one; files stored
+        before references were counted have a single one.
+        """
+        with transaction.atomic():
+            if not self.filter(name=name).update(references=F('references') - 1):
+                return True
+            deleted, _ = self.filter(name=name, references__lte=0).delete()
+            return bool(deleted)
+
+
+class ImageBlob(models.Model):
+    """
+    Number of references to a file of the content-addressed image storage.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=1)
+
+    objects = ImageBlobQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination ordered by primary key.
+
+    Each page is fetched with `WHERE id > <last id seen>`, never with an OFFSET scan, and the
+    primary key is unique and never reused, so rows inserted while a client is paging are
+    neither skipped nor repeated. Clients can pick a page size with `?page_size=`, up to
+    API_MAX_PAGE_SIZE.
+    """
+
+    ordering = 'id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
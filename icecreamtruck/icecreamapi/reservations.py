@@ -0,0 +1,110 @@
+"""
+Time-limited stock reservations, for checkout carts.
+
+A reservation deducts its quantity from the stock when it is made, as a purchase would, and
+holds it for RESERVATION_TTL_SECONDS. Purchasing it only deletes it, by primary key and on
+condition that it has not expired, and records the sale: the stock is not touched again at
+checkout, so checkouts never wait on, nor fail because of, purchases of the same item.
+
+A released reservation puts its quantity back in stock right away. Expired ones are left in
+place, where they can no longer be purchased, until the sweep_reservations management command
+reclaims them in batches along the expiry index. Whoever deletes a reservation, be it a
+purchase, a release or the sweep, is the only one to act on it, so its quantity is never sold
+and restocked both.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_inventory
+from .events import publish_stock_levels
+from .models import FoodItem, StockReservation, Truck
+
+
+def reserve(food_item, quantity):
+    """
+    Deducts quantity from the stock of a food item and holds it in a new reservation. Returns
+    the reservation, or None when the food item is short of stock.
+    """
+    with transaction.atomic():
+        if not food_item.decrement_stock(quantity):
+            return None
+        reservation = StockReservation.objects.create(
+            food_item=food_item,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=settings.RESERVATION_TTL_SECONDS),
+        )
+        stock_changed({food_item.id: food_item.truck_id})
+    return reservation
+
+
+def claim(reservation_id):
+    """
+    Deletes a reservation that has not expired yet, with a single DELETE by primary key.
+    Returns whether it was deleted, in which case its quantity is the caller's to sell.
+    """
+    deleted, _ = StockReservation.objects.filter(id=reservation_id, expires_at__gt=timezone.now()).delete()
+    return bool(deleted)
+
+
+def release(reservation_id):
+    """
+    Deletes a reservation, expired or not, and puts its quantity back in stock. Returns
+    whether it still existed.
+    """
+    with transaction.atomic():
+        reservation = (
+            StockReservation.objects.filter(id=reservation_id)
+            .values_list('id', 'food_item_id', 'food_item__truck_id', 'quantity')
+            .first()
+        )
+        if reservation is None or not StockReservation.objects.filter(id=reservation_id).delete()[0]:
+            return False
+        restock([reservation])
+    return True
+
+
+def reclaim_expired(batch_size):
+    """
+    Deletes up to batch_size expired reservations, oldest first, and puts their quantities
+    back in stock, in a single transaction. Returns the number of reservations reclaimed.
+    """
+    while True:
+        with transaction.atomic():
+            expired = list(
+                StockReservation.objects.filter(expires_at__lte=timezone.now())
+                .order_by('expires_at')
+                .values_list('id', 'food_item_id', 'food_item__truck_id', 'quantity')[:batch_size]
+            )
+            if not expired:
+                return 0
+            deleted, _ = StockReservation.objects.filter(id__in=[row[0] for row in expired]).delete()
+            if deleted == len(expired):
+                restock(expired)
+                return deleted
+            # some were purchased or released meanwhile, start the batch over
+            transaction.set_rollback(True)
+
+
+def restock(reservations):
+    """
+    Puts the quantities of deleted reservations, given as (id, food item ID, truck ID,
+    quantity) tuples, back in stock.
+    """
+    quantities = Counter()
+    for _, food_item_id, _, quantity in reservations:
+        quantities[food_item_id] += quantity
+    FoodItem.objects.increment_stock_bulk(quantities)
+    stock_changed({food_item_id: truck_id for _, food_item_id, truck_id, _ in reservations})
+
+
+def stock_changed(trucks_by_food_item):
+    # bulk changes send no signals, so the trucks are touched and their inventory invalidated here
+    truck_ids = set(trucks_by_food_item.values())
+    Truck.objects.filter(id__in=truck_ids).touch()
+    transaction.on_commit(lambda: invalidate_inventory(*truck_ids))
+    publish_stock_levels(truck_ids, list(trucks_by_food_item))
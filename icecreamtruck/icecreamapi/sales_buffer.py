@@ -0,0 +1,199 @@
+"""
+Group commit of the sales of single purchases, for high purchase rates.
+
+With PURCHASE_WRITE_MODE set to 'buffered', a purchase still deducts the stock in its own
+transaction, so nothing is ever oversold, but the sale it makes is queued in memory instead of
+being inserted. A flusher thread inserts the queued sales, together with their trucks' running
+totals, every SALE_BUFFER_FLUSH_MILLISECONDS or as soon as SALE_BUFFER_MAX_ROWS are queued,
+in a single transaction per batch: one commit, and one fsync, for many purchases. The default
+'immediate' mode inserts every sale in the purchase's transaction.
+
+Durability: a buffered purchase is answered once its stock deduction is committed, before its
+sale is. Sales still queued are inserted when the process exits normally (e.g. on SIGTERM
+from the server restarting workers), but are lost if it is killed or crashes: at most a flush
+interval's worth of sales, whose stock stays deducted. Sales and truck totals also trail the
+stock by up to a flush interval, and a buffered sale's purchase time is the time it was
+flushed. A batch that fails to insert is put back in the queue and retried, unless it fails
+an integrity check, e.g. because the food item or truck of a sale was deleted while it was
+queued: it is then split until the failing sales are found, which are logged and dropped,
+so they never hold up the sales queued behind them.
+
+When SALE_BUFFER_MAX_QUEUED sales are waiting, e.g. because the database is slow, purchases
+flush the queue themselves until it drains, which slows them down instead of growing the
+queue without bounds.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connection
+from django.dispatch import receiver
+
+from icecreamtruck.metrics import (
+    SALE_BUFFER_DEPTH,
+    SALE_BUFFER_DROPPED,
+    SALE_BUFFER_FLUSH_DURATION,
+    SALE_BUFFER_FLUSHED,
+)
+
+from .cache import invalidate_inventory
+from .models import Sale
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+
+
+def get_sale_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = SaleBuffer(
+            settings.SALE_BUFFER_FLUSH_MILLISECONDS / 1000,
+            settings.SALE_BUFFER_MAX_ROWS,
+            settings.SALE_BUFFER_MAX_QUEUED,
+        )
+    return _buffer
+
+
+@receiver(setting_changed)
+def reset_sale_buffer(setting, **kwargs):
+    global _buffer
+    if setting.startswith('SALE_BUFFER_') and _buffer is not None:
+        _buffer.shutdown()
+        _buffer = None
+
+
+class SaleBuffer:
+    """
+    Queue of unsaved sales, inserted in batches by a flusher thread started with the first
+    sale queued.
+    """
+
+    def __init__(self, flush_interval, max_rows, max_queued):
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_queued = max_queued
+        self.sales = deque()
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.stopping = False
+
+    def add(self, sale):
+        with self.condition:
+            if self.thread is None and not self.stopping:
+                self.thread = threading.Thread(target=self.run, name='sale-buffer', daemon=True)
+                self.thread.start()
+                atexit.register(self.shutdown)
+            self.sales.append(sale)
+            depth = len(self.sales)
+            if depth >= self.max_rows:
+                self.condition.notify()
+        SALE_BUFFER_DEPTH.inc()
+
+        if depth >= self.max_queued or self.stopping:
+            # runs once the purchase has committed, so its response must not fail with the
+            # flush: the sales stay queued for the flusher thread to retry
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not insert the buffered sales, leaving them queued")
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopping or len(self.sales) >= self.max_rows, self.flush_interval)
+                if self.stopping:
+                    break
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not insert the buffered sales, retrying")
+                # start over with a new connection, and leave the database some time
+                connection.close()
+                time.sleep(self.flush_interval)
+        connection.close()
+
+    def flush(self):
+        """
+        Inserts every sale queued so far, in batches of at most SALE_BUFFER_MAX_ROWS. Returns
+        the number of sales inserted.
+        """
+        flushed = 0
+        with self.flush_lock:
+            while True:
+                with self.condition:
+                    batch = [self.sales.popleft() for _ in range(min(self.max_rows, len(self.sales)))]
+                if not batch:
+                    return flushed
+
+                started = time.perf_counter()
+                pending = [batch]
+                try:
+                    flushed += self.record(pending)
+                except Exception:
+                    with self.condition:
+                        self.sales.extendleft(reversed([sale for chunk in pending for sale in chunk]))
+                    raise
+                SALE_BUFFER_FLUSH_DURATION.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def record(pending):
+        """
+        Inserts the chunks of sales of the pending list, one transaction each, removing them
+        from it as they are done. A chunk failing an integrity check is split in halves, down to
+        the sales that fail it, which are logged and dropped. Returns the number of sales
+        inserted.
+        """
+        recorded = 0
+        while pending:
+            chunk = pending.pop(0)
+            try:
+                Sale.objects.bulk_record(chunk)
+            except Exception as exc:
+                for sale in chunk:
+                    # the IDs given by the rolled back insert
+                    sale.pk = None
+                    sale._state.adding = True
+                if not isinstance(exc, IntegrityError):
+                    pending.insert(0, chunk)
+                    raise
+                if len(chunk) > 1:
+                    pending[:0] = [chunk[: len(chunk) // 2], chunk[len(chunk) // 2 :]]
+                else:
+                    sale = chunk[0]
+                    logger.exception(
+                        "Dropped a buffered sale of %s x food item %s of truck %s",
+                        sale.quantity,
+                        sale.food_item_id,
+                        sale.truck_id,
+                    )
+                    SALE_BUFFER_DEPTH.dec()
+                    SALE_BUFFER_DROPPED.inc()
+            else:
+                SALE_BUFFER_DEPTH.dec(len(chunk))
+                SALE_BUFFER_FLUSHED.inc(len(chunk))
+                # bulk inserts send no signals
+                invalidate_inventory(*{sale.truck_id for sale in chunk})
+                recorded += len(chunk)
+        return recorded
+
+    def shutdown(self):
+        """
+        Stops the flusher thread and inserts the sales still queued.
+        """
+        atexit.unregister(self.shutdown)
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Lost %s buffered sale(s) at shutdown", len(self.sales))
@@ -1,10 +1,27 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
-from .models import FoodFlavor, FoodItem, Sale, Truck
+from icecreamtruck.middleware import current_profile
 
+from .images import strip_metadata
+from .models import FoodFlavor, FoodItem, Sale, SalesRollup, StockReservation, Truck
 
-class FoodFlavorSerializer(serializers.ModelSerializer):
+
+class ProfiledSerializerMixin:
+    """
+    Serializer mixin timing the serialization of the objects of profiled requests, reported
+    in their Server-Timing header (see QueryProfilingMiddleware).
+    """
+
+    def to_representation(self, instance):
+        profile = current_profile()
+        if profile is None:
+            return super().to_representation(instance)
+        with profile.time_serialization():
+            return super().to_representation(instance)
+
+
+class FoodFlavorSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """
     This serializer is used for serializing food item flavors.
     """
@@ -14,19 +31,61 @@ class FoodFlavorSerializer(serializers.ModelSerializer):
         fields = ['name', 'food_item']
 
 
-class FoodItemSerializer(serializers.ModelSerializer):
+class StrippedImageField(serializers.ImageField):
+    """
+    Field for an uploaded image, stored without its metadata (see strip_metadata).
+    """
+
+    def to_internal_value(self, data):
+        return strip_metadata(super().to_internal_value(data))
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Field for the resized copies of a food item's image, as URLs by variant name and format.
+    """
+
+    def to_representation(self, value):
+        storage = self.parent.Meta.model._meta.get_field('image').storage
+        request = self.context.get('request')
+        variants = {}
+        for name, formats in value.items():
+            variants[name] = {}
+            for image_format, path in formats.items():
+                url = storage.url(path)
+                variants[name][image_format] = request.build_absolute_uri(url) if request is not None else url
+        return variants
+
+
+class StockField(serializers.IntegerField):
+    """
+    Field for a food item's quantity, read as its whole stock, sharded or not.
+    """
+
+    def get_attribute(self, instance):
+        return instance.stock
+
+
+class FoodItemSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """
     This serializer is used for serializing food items and their associated flavors.
     """
 
-    image = serializers.ImageField(required=False)
+    image = StrippedImageField(required=False)
+    image_variants = ImageVariantsField()
+    quantity = StockField(min_value=0)
 
     class Meta:
         model = FoodItem
-        fields = ['name', 'price', 'quantity', 'item_type', 'image', 'truck']
+        fields = ['name', 'price', 'quantity', 'item_type', 'image', 'image_variants', 'truck']
+
+    def validate_quantity(self, value):
+        if self.instance is not None and self.instance.stock_shards:
+            raise serializers.ValidationError('The stock of a sharded food item can only be restocked.')
+        return value
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """
     This serializer is used for serializing customer data.
     """
@@ -36,7 +95,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['username', 'email']
 
 
-class TruckSerializer(serializers.ModelSerializer):
+class TruckSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for truck model.
     """
@@ -62,6 +121,26 @@ class PurchaseSerializer(serializers.Serializer):
         return value
 
 
+class BatchPurchaseSerializer(serializers.Serializer):
+    """
+    Serializer for purchasing several food items in a single order.
+    """
+
+    items = PurchaseSerializer(many=True, allow_empty=False)
+
+
+class ReservationSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for a stock reservation.
+    """
+
+    food_id = serializers.IntegerField(source='food_item_id')
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'food_id', 'quantity', 'expires_at']
+
+
 class CreateTruckSerializer(serializers.Serializer):
     # creating a new truck
     name = serializers.CharField(max_length=100, required=True)
@@ -69,7 +148,7 @@ class CreateTruckSerializer(serializers.Serializer):
 
 class CreateFoodItemSerializer(serializers.ModelSerializer):
     # add a field for flavour
-    image = serializers.ImageField(required=False)
+    image = StrippedImageField(required=False)
     quantity = serializers.IntegerField(required=True, min_value=1)
 
     class Meta:
@@ -77,11 +156,83 @@ class CreateFoodItemSerializer(serializers.ModelSerializer):
         fields = ['name', 'price', 'quantity', 'item_type', 'image']
 
 
-class SaleSerializer(serializers.ModelSerializer):
+class SalesExportQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating the query parameters of the sales export.
+    """
+
+    # 'format' is taken by DRF's format suffixes
+    output = serializers.ChoiceField(choices=['csv', 'jsonl'], default='csv')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    truck = serializers.IntegerField(required=False)
+
+
+class ImportRowSerializer(serializers.Serializer):
+    """
+    Serializer for validating the action of a bulk import row.
+    """
+
+    ACTIONS = ['truck', 'food_item', 'restock']
+
+    action = serializers.ChoiceField(choices=ACTIONS)
+
+
+class TruckImportSerializer(serializers.Serializer):
+    # a new truck
+    name = serializers.CharField(max_length=100)
+
+
+class FoodItemImportSerializer(serializers.Serializer):
+    # a new food item of an existing truck, with an optional flavour
+    truck = serializers.IntegerField()
+    name = serializers.CharField(max_length=100)
+    price = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0)
+    quantity = serializers.IntegerField(min_value=0)
+    item_type = serializers.ChoiceField(choices=FoodItem.ITEM_TYPES, default='ice_cream')
+    flavour = serializers.ChoiceField(choices=FoodFlavor.FLAVORS, required=False)
+
+
+class RestockImportSerializer(serializers.Serializer):
+    # stock added to an existing food item
+    food_item = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class SaleSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Sale model.
     """
 
     class Meta:
         model = Sale
-        fields = ['truck', 'food_item', 'user', 'quantity', 'purchase_time']
+        fields = ['truck', 'food_item', 'user', 'quantity', 'unit_price', 'line_total', 'purchase_time']
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating the query parameters of the sales report.
+    """
+
+    granularity = serializers.ChoiceField(choices=SalesRollup.GRANULARITIES, default=SalesRollup.DAY)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    truck = serializers.IntegerField(required=False)
+    group_by = serializers.ChoiceField(choices=['truck', 'food_item'], default='food_item')
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError('start must be before end')
+        return attrs
+
+
+class SalesReportSerializer(ProfiledSerializerMixin, serializers.Serializer):
+    """
+    Serializer for one bucket of the sales report.
+    """
+
+    bucket_start = serializers.DateTimeField()
+    truck = serializers.IntegerField()
+    food_item = serializers.IntegerField(required=False)
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from icecreamtruck.metrics import count_queries
+
+from .cache import invalidate_inventory
+from .models import FoodItem, Sale, Truck
+
+
+@receiver([post_save, post_delete], sender=Truck)
+def invalidate_truck_inventory(sender, instance, **kwargs):
+    """
+    Invalidates the cached inventory of a truck once a change to it is committed.
+    """
+    transaction.on_commit(lambda: invalidate_inventory(instance.id))
+
+
+@receiver([post_save, post_delete], sender=FoodItem)
+@receiver([post_save, post_delete], sender=Sale)
+def invalidate_truck_inventory_of(sender, instance, **kwargs):
+    """
+    Invalidates the cached inventory of the truck that owns a food item or a sale, once a
+    change to it is committed.
+    """
+    transaction.on_commit(lambda: invalidate_inventory(instance.truck_id))
+
+
+@receiver(post_save, sender=FoodItem)
+def touch_truck_of(sender, instance, **kwargs):
+    """
+    Bumps the version of the truck that owns a changed food item, as a truck is represented
+    together with its food items.
+    """
+    Truck.objects.filter(id=instance.truck_id).touch()
+
+
+@receiver(pre_delete, sender=FoodItem)
+def carry_over_version_of(sender, instance, **kwargs):
+    """
+    Adds the version stamp of a food item about to be deleted to the version of its truck,
+    whose version stamp adds up those of its food items, so it never goes back.
+    """
+    stamp = FoodItem.objects.filter(id=instance.id).version_stamps().first()
+    if stamp is not None:
+        Truck.objects.filter(id=instance.truck_id).update(
+            version=F('version') + stamp[0] + 1, updated_at=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=FoodItem)
+def delete_images_of(sender, instance, **kwargs):
+    """
+    Drops the references of a deleted food item to its image and image variants.
+    """
+    if instance.image:
+        instance.image.delete(save=False)
+    for variant in instance.image_variants.values():
+        for name in variant.values():
+            instance.image.storage.delete(name)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Sets the journal mode of new SQLite connections, write-ahead logging by default.
+    """
+    if connection.vendor == 'sqlite' and settings.SQLITE_JOURNAL_MODE:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}')
+            if settings.SQLITE_JOURNAL_MODE.upper() == 'WAL':
+                # safe with WAL: a power loss can drop the last commits, never corrupt the database
+                cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Counts the queries run by requests, for the metrics.
+    """
+    connection.execute_wrappers.append(count_queries)
@@ -0,0 +1,94 @@
+"""
+Content-addressed storage of food item images.
+
+Every file is stored once, under the SHA-256 digest of its content, in the default storage:
+uploading a photo that is already stored adds a reference to the stored copy instead of a new
+copy. References are counted in ImageBlob rows, and a file is removed when its last reference
+is deleted. As the name of a file changes with its content, its URL never serves anything else
+and can be cached forever.
+"""
+
+import hashlib
+import os
+
+from django.core.files.storage import Storage, storages
+from django.db import transaction
+
+BLOB_DIRECTORY = 'sha256'
+
+
+def file_digest(content):
+    """
+    Returns the SHA-256 hex digest of a file.
+    """
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ContentAddressedStorage(Storage):
+    """
+    Storage saving files in the default storage under the digest of their content, e.g.
+    `images/foo.jpg` becomes `images/sha256/3f/3f8a...e1.jpg`.
+    """
+
+    @property
+    def backend(self):
+        return storages['default']
+
+    def blob_name(self, name, digest):
+        directory = name.split('/', 1)[0] if '/' in name else ''
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(filter(None, [directory, BLOB_DIRECTORY, digest[:2], f'{digest}{extension}']))
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content in _save, so equal names hold equal files.
+        return name
+
+    def _save(self, name, content):
+        from .models import ImageBlob
+
+        name = self.blob_name(name, file_digest(content))
+        if ImageBlob.objects.add_reference(name) or not self.backend.exists(name):
+            content.seek(0)
+            stored = self.backend.save(name, content)
+            if stored != name:
+                # another upload of the same content stored it first
+                self.backend.delete(stored)
+        return name
+
+    def delete(self, name):
+        """
+        Drops a reference to a file, and removes the file once its last reference is gone and
+        the deletion is committed.
+        """
+        from .models import ImageBlob
+
+        if ImageBlob.objects.remove_reference(name):
+            transaction.on_commit(lambda: self.backend.delete(name))
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+
+food_item_image_storage = ContentAddressedStorage()
+
+
+def get_food_item_image_storage():
+    return food_item_image_storage
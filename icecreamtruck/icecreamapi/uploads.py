@@ -0,0 +1,108 @@
+"""
+Streaming validation of food item image uploads.
+
+Images are checked while the request body is still being read: the declared request size up
+front, the format and dimensions from the image header in the first chunks, and the running
+size with every chunk. A bad upload is rejected as soon as the problem shows, without reading
+the rest of the body. Accepted uploads are streamed chunk by chunk into a temporary file on
+disk, never into memory, where they are re-encoded without their metadata (see
+strip_metadata), and from there into the image storage when the food item is saved.
+"""
+
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from PIL import Image
+from rest_framework.parsers import MultiPartParser
+
+# Bytes of an image read at most to find its header; JPEG headers can follow up to 64KB of
+# EXIF data, and a few more segments.
+HEADER_SIZE = 256 * 2**10
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Upload handler that validates image files as they stream in, and writes them to a
+    temporary file.
+
+    The size limit is FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE, the accepted formats are
+    FOOD_ITEM_IMAGE_FORMATS and neither side of an image may exceed
+    FOOD_ITEM_IMAGE_MAX_DIMENSION. Violations raise a MultiPartParserError.
+    """
+
+    chunk_size = 64 * 2**10
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The body also holds the other form fields, up to DATA_UPLOAD_MAX_MEMORY_SIZE.
+        limit = settings.FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        if content_length > limit:
+            raise MultiPartParserError(self.too_large_message())
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.checked = False
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE:
+            self.reject(self.too_large_message())
+        if not self.checked:
+            self.header += raw_data
+            self.check_header(complete=False)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            self.check_header(complete=True)
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+    def check_header(self, complete):
+        """
+        Validates the format and dimensions of the image once enough of it has arrived to read
+        its header.
+        """
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                image_format, size = image.format, image.size
+        except Exception:
+            if complete or len(self.header) >= HEADER_SIZE:
+                self.reject("Upload a valid image.")
+            return
+
+        self.checked = True
+        self.header = b''
+        if image_format not in settings.FOOD_ITEM_IMAGE_FORMATS:
+            self.reject(f"Images in {image_format} format are not supported.")
+        if max(size) > settings.FOOD_ITEM_IMAGE_MAX_DIMENSION:
+            self.reject(
+                f"Images can be at most {settings.FOOD_ITEM_IMAGE_MAX_DIMENSION} pixels wide and high, "
+                f"not {size[0]}x{size[1]}."
+            )
+
+    def reject(self, message):
+        self.file.close()
+        raise MultiPartParserError(message)
+
+    def too_large_message(self):
+        return f"Images can be at most {settings.FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE} bytes."
+
+
+class ImageUploadParser(MultiPartParser):
+    """
+    Multipart parser streaming uploaded files through an ImageUploadHandler.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request._request.upload_handlers = [ImageUploadHandler(request._request)]
+        return super().parse(stream, media_type, parser_context)
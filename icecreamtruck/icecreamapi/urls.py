@@ -1,25 +1,62 @@
 from django.urls import include, path
 
+from .async_views import (
+    AsyncFoodItemDetailView,
+    AsyncFoodItemListView,
+    AsyncInventoryDetailView,
+    AsyncInventoryListView,
+    AsyncTruckDetailView,
+    AsyncTruckListView,
+    StockEventsView,
+)
 from .views import (
+    BatchPurchaseViewSet,
     CreateFoodItemViewset,
     CreateTruckViewSet,
     FoodItemViewSet,
+    ImportViewSet,
     InventoryViewSet,
     PurchaseViewSet,
+    ReservationViewSet,
+    SalesExportViewSet,
+    SalesReportViewSet,
     TruckViewSet,
 )
 
+async_urlpatterns = [
+    path('inventory/', AsyncInventoryListView.as_view(), name='async-inventory-list'),
+    path('inventory/<int:pk>/', AsyncInventoryDetailView.as_view(), name='async-inventory-detail'),
+    path('fooditem/', AsyncFoodItemListView.as_view(), name='async-fooditem-list'),
+    path('fooditem/<int:pk>/', AsyncFoodItemDetailView.as_view(), name='async-fooditem-detail'),
+    path('trucks/', AsyncTruckListView.as_view(), name='async-truck-list'),
+    path('trucks/<int:pk>/', AsyncTruckDetailView.as_view(), name='async-truck-detail'),
+]
+
 urlpatterns = [
     path('purchase/', PurchaseViewSet.as_view({'post': 'create'}), name='purchase-list'),
+    path('purchase/batch/', BatchPurchaseViewSet.as_view({'post': 'create'}), name='purchase-batch'),
+    path('reservations/', ReservationViewSet.as_view({'post': 'create'}), name='reservation-list'),
+    path('reservations/<uuid:pk>/', ReservationViewSet.as_view({'delete': 'destroy'}), name='reservation-detail'),
+    path(
+        'reservations/<uuid:pk>/purchase/',
+        ReservationViewSet.as_view({'post': 'purchase'}),
+        name='reservation-purchase',
+    ),
     path('inventory/', InventoryViewSet.as_view({'get': 'list'}), name='inventory-list'),
+    path('inventory/<int:pk>/', InventoryViewSet.as_view({'get': 'retrieve'}), name='inventory-detail'),
     path('fooditem/', FoodItemViewSet.as_view({'get': 'list'}), name='fooditem-list'),
     path('fooditem/<int:pk>/', FoodItemViewSet.as_view({'get': 'retrieve'}), name='fooditem-detail'),
     path('trucks/', TruckViewSet.as_view({'get': 'list'}), name='truck-list'),
     path('trucks/<int:pk>/', TruckViewSet.as_view({'get': 'retrieve'}), name='truck-detail'),
+    path('trucks/<int:pk>/stock-events/', StockEventsView.as_view(), name='truck-stock-events'),
+    path('reports/sales/', SalesReportViewSet.as_view({'get': 'list'}), name='sales-report'),
+    path('sales/export/', SalesExportViewSet.as_view({'get': 'list'}), name='sales-export'),
+    path('import/', ImportViewSet.as_view({'post': 'create'}), name='import'),
     path('trucks/create/', CreateTruckViewSet.as_view({'post': 'create'}), name='create-truck'),
     path(
         'trucks/<int:truck_id>/create-food-item/<str:flavour>/',
         CreateFoodItemViewset.as_view({'post': 'create'}),
         name='create-food-item',
     ),
+    path('async/', include(async_urlpatterns)),
 ]
@@ -1,16 +1,113 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 from rest_framework import status, viewsets
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.parsers import FormParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
-from .models import FoodFlavor, FoodItem, Sale, Truck
+from icecreamtruck.metrics import PURCHASES, UNITS_SOLD
+from icecreamtruck.routers import ReplicaReadMixin
+
+from .cache import FLEET, cached_inventory, inventory_etag, inventory_last_modified, invalidate_inventory
+from .events import publish_stock_levels
+from .images import schedule_image_variants
+from .exports import FORMATS, export_sales
+from .imports import CONTENT_TYPES, import_rows, read_rows
+from .models import FoodFlavor, FoodItem, Sale, SalesRollup, StockReservation, Truck
+from .pagination import IdCursorPagination
+from .reservations import claim, release, reserve
+from .sales_buffer import get_sale_buffer
 from .serializers import (
+    BatchPurchaseSerializer,
     CreateFoodItemSerializer,
     CreateTruckSerializer,
     FoodItemSerializer,
     PurchaseSerializer,
+    ReservationSerializer,
+    SalesExportQuerySerializer,
+    SalesReportQuerySerializer,
+    SalesReportSerializer,
     TruckSerializer,
 )
+from .uploads import ImageUploadParser
+
+
+def version_validators(model, pk, version, updated_at):
+    """
+    Returns the ETag and Last-Modified timestamp of a versioned object.
+    """
+    return quote_etag(f'{model._meta.model_name}-{pk}-{version}'), int(updated_at.timestamp())
+
+
+def set_validators(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answers conditional requests (If-None-Match / If-Modified-Since) for a single versioned
+    object with a 304 Not Modified response when it is unchanged.
+
+    The check only reads the object's version and last change time, so an unchanged object
+    is never loaded with its related objects nor serialized. Full responses carry the ETag
+    and Last-Modified headers to revalidate with.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        model = self.get_serializer_class().Meta.model
+        stamp = model._default_manager.filter(pk=kwargs['pk']).version_stamps().first()
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, last_modified = version_validators(model, kwargs['pk'], *stamp)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        return set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+
+
+def record_purchase(kind, units_by_truck):
+    """
+    Counts a successful purchase, and the units it sold per truck, once the current transaction
+    commits.
+    """
+
+    def record():
+        PURCHASES.inc(kind=kind, outcome='enjoy')
+        for truck_id, units in units_by_truck.items():
+            UNITS_SOLD.inc(units, truck=truck_id)
+
+    transaction.on_commit(record)
+
+
+def record_sale(food_item, user, quantity):
+    """
+    Records the sale of a purchase and adds it to its truck's running totals, or queues it for
+    a group commit with PURCHASE_WRITE_MODE set to 'buffered'. The food item must have its ID,
+    price, truck ID and number of stock shards loaded.
+    """
+    if settings.PURCHASE_WRITE_MODE == 'buffered':
+        sale = Sale(food_item=food_item, truck_id=food_item.truck_id, user=user, quantity=quantity)
+        # priced now, as the food item's price may change before the sale is inserted
+        sale.snapshot_price()
+        buffer = get_sale_buffer()
+        transaction.on_commit(lambda: buffer.add(sale))
+        transaction.on_commit(lambda: invalidate_inventory(food_item.truck_id))
+    else:
+        Sale.objects.create(food_item=food_item, truck_id=food_item.truck_id, user=user, quantity=quantity)
 
 
 class PurchaseViewSet(viewsets.ViewSet):
@@ -24,6 +121,15 @@ class PurchaseViewSet(viewsets.ViewSet):
     - 'food_id': The ID of the food item to purchase.
     - 'quantity': The quantity of the food item to purchase.
 
+    The stock check and deduction happen in a single conditional update, recorded together
+    with the sale and the truck's running sales totals in one transaction, so concurrent
+    purchases can never oversell an item. The stock of a sharded food item is deducted from
+    one of its stock shards instead (see StockShardQuerySet.take), and its sale added to one of
+    its truck's sales shards, so its purchases do not all update the same rows.
+
+    With PURCHASE_WRITE_MODE set to 'buffered', the sale and the truck's totals are instead
+    inserted shortly after the response, grouped with other sales (see sales_buffer.py).
+
     If the food item is found and the quantity is available, the purchase is successful,
     and the response message is 'ENJOY!'. If the food item is not found, a 404 Not Found
     response is returned. If the quantity is not available, a 400 Bad Request response is
@@ -38,44 +144,232 @@ class PurchaseViewSet(viewsets.ViewSet):
 
         # Confirm if food item is available
         try:
-            food_item = FoodItem.objects.get(id=food_id)
+            food_item = FoodItem.objects.only('id', 'price', 'truck_id', 'stock_shards').get(id=food_id)
         except FoodItem.DoesNotExist:
+            PURCHASES.inc(kind='single', outcome='not_found')
             return Response({'message': 'Food item not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # check if the customer's purchase_quantity exceeds available stock
-        if food_item.quantity < quantity:
-            return Response({'message': 'SORRY!'}, status=status.HTTP_400_BAD_REQUEST)
+        user = request.user if request.user.is_authenticated else None
+
+        with transaction.atomic():
+            # deduct the purchased quantity from inventory, unless it exceeds available stock
+            if not food_item.decrement_stock(quantity):
+                PURCHASES.inc(kind='single', outcome='sorry')
+                return Response({'message': 'SORRY!'}, status=status.HTTP_400_BAD_REQUEST)
+
+            record_sale(food_item, user, quantity)
+            publish_stock_levels([food_item.truck_id], [food_id])
+            record_purchase('single', {food_item.truck_id: quantity})
+        return Response({'message': "ENJOY!"}, status=status.HTTP_201_CREATED)
+
+
+class BatchPurchaseViewSet(viewsets.ViewSet):
+    """
+    API endpoint for purchasing several food items in a single order.
+
+    Expects a POST request with the following data:
+    - 'items': A list of lines, each with a 'food_id' and a 'quantity'.
+
+    The order is all-or-nothing. All food items are fetched in one query, their stock is
+    deducted with one conditional update and all sales are inserted together, along with the
+    trucks' running sales totals, inside a single transaction. If every line can be fulfilled,
+    the response message is 'ENJOY!'. Otherwise nothing is purchased and a 400 Bad Request
+    response is returned with the message 'SORRY!' and an 'errors' list describing each line
+    that failed.
+    """
+
+    def create(self, request):
+        serializer = BatchPurchaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data['items']
+
+        # the same food item may appear on several lines, so stock is checked per item
+        quantities = Counter()
+        for line in lines:
+            quantities[line['food_id']] += line['quantity']
+
+        user = request.user if request.user.is_authenticated else None
+
+        with transaction.atomic():
+            food_items = self.food_items(quantities)
+            errors = self.line_errors(lines, food_items, quantities)
+            if not errors:
+                if self.decrement_stock(food_items, quantities):
+                    Sale.objects.bulk_record(
+                        [
+                            Sale(
+                                food_item=food_items[line['food_id']],
+                                truck_id=food_items[line['food_id']].truck_id,
+                                user=user,
+                                quantity=line['quantity'],
+                            )
+                            for line in lines
+                        ]
+                    )
+                    # bulk inserts send no signals, so the cached inventory is invalidated here
+                    truck_ids = {food_item.truck_id for food_item in food_items.values()}
+                    transaction.on_commit(lambda: invalidate_inventory(*truck_ids))
+                    publish_stock_levels(truck_ids, list(quantities))
+                    units = Counter()
+                    for food_id, quantity in quantities.items():
+                        units[food_items[food_id].truck_id] += quantity
+                    record_purchase('batch', units)
+                    return Response({'message': "ENJOY!"}, status=status.HTTP_201_CREATED)
+
+                # stock ran out between the read and the update, undo the partial deduction
+                transaction.set_rollback(True)
+
+        if not errors:
+            food_items = self.food_items(quantities)
+            errors = self.line_errors(lines, food_items, quantities) or [
+                {'line': index, 'food_id': line['food_id'], 'message': 'SORRY!'} for index, line in enumerate(lines)
+            ]
+        missing = any(error['message'] == 'Food item not found' for error in errors)
+        PURCHASES.inc(kind='batch', outcome='not_found' if missing else 'sorry')
+        return Response({'message': 'SORRY!', 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    @staticmethod
+    def food_items(quantities):
+        fields = ['id', 'price', 'quantity', 'truck_id', 'stock_shards']
+        return FoodItem.objects.with_stock().only(*fields).in_bulk(quantities)
+
+    @staticmethod
+    def decrement_stock(food_items, quantities):
+        """
+        Deducts the quantities from the stock of the food items, unsharded ones all in one
+        conditional update. Returns whether every food item had enough.
+        """
+        unsharded = {
+            food_id: quantity for food_id, quantity in quantities.items() if not food_items[food_id].stock_shards
+        }
+        if unsharded and FoodItem.objects.decrement_stock_bulk(unsharded) != len(unsharded):
+            return False
+        return all(
+            food_items[food_id].decrement_stock(quantity)
+            for food_id, quantity in quantities.items()
+            if food_items[food_id].stock_shards
+        )
+
+    @staticmethod
+    def line_errors(lines, food_items, quantities):
+        """
+        Returns an error for every line whose food item is missing or short of stock.
+        """
+        errors = []
+        for index, line in enumerate(lines):
+            food_item = food_items.get(line['food_id'])
+            if food_item is None:
+                errors.append({'line': index, 'food_id': line['food_id'], 'message': 'Food item not found'})
+            elif food_item.stock < quantities[line['food_id']]:
+                errors.append({'line': index, 'food_id': line['food_id'], 'message': 'SORRY!'})
+        return errors
+
+
+class ReservationViewSet(viewsets.ViewSet):
+    """
+    API endpoint for holding stock during a checkout, then purchasing or releasing it.
+
+    - To reserve, POST a 'food_id' and a 'quantity'. The quantity is deducted from the stock
+      right away and held for RESERVATION_TTL_SECONDS. Returns the reservation's 'id' and
+      'expires_at', or a 400 Bad Request response with the message 'SORRY!' when the quantity
+      is not available.
+    - To purchase a reservation, POST to its 'purchase/' URL before it expires. The stock is
+      not checked again, so the response message is 'ENJOY!' unless the reservation is
+      missing (404 Not Found) or has expired (410 Gone).
+    - To give the quantity back, DELETE the reservation.
+
+    Expired reservations are put back in stock by the sweep_reservations management command
+    (see reservations.py).
+    """
 
-        # deduct the purchased quantity from inventory
-        food_item.quantity -= quantity
-        food_item.save()
+    def create(self, request):
+        serializer = PurchaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        food_id = serializer.validated_data['food_id']
 
-        if request.user.is_authenticated:
-            Sale.objects.create(food_item=food_item, truck=food_item.truck, user=request.user, quantity=quantity)
-        else:
-            Sale.objects.create(food_item=food_item, truck=food_item.truck, quantity=quantity)
+        try:
+            food_item = FoodItem.objects.only('id', 'truck_id', 'stock_shards').get(id=food_id)
+        except FoodItem.DoesNotExist:
+            return Response({'message': 'Food item not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        reservation = reserve(food_item, serializer.validated_data['quantity'])
+        if reservation is None:
+            return Response({'message': 'SORRY!'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+    def purchase(self, request, pk=None):
+        reservation = (
+            StockReservation.objects.select_related('food_item')
+            .only(
+                'id', 'quantity', 'food_item__id', 'food_item__price', 'food_item__truck_id', 'food_item__stock_shards'
+            )
+            .filter(id=pk)
+            .first()
+        )
+        if reservation is None:
+            PURCHASES.inc(kind='reservation', outcome='not_found')
+            return Response({'message': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        user = request.user if request.user.is_authenticated else None
+
+        with transaction.atomic():
+            if not claim(reservation.id):
+                PURCHASES.inc(kind='reservation', outcome='expired')
+                return Response({'message': 'Reservation expired'}, status=status.HTTP_410_GONE)
+
+            food_item = reservation.food_item
+            record_sale(food_item, user, reservation.quantity)
+            record_purchase('reservation', {food_item.truck_id: reservation.quantity})
         return Response({'message': "ENJOY!"}, status=status.HTTP_201_CREATED)
 
+    def destroy(self, request, pk=None):
+        if not release(pk):
+            return Response({'message': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
-class InventoryViewSet(viewsets.ViewSet):
+class InventoryViewSet(ReplicaReadMixin, viewsets.ViewSet):
     """
     API endpoint for retrieving the trucks inventory.
 
     This endpoint returns a list of all ice cream trucks along with their inventory of food items
-    and total sales.
+    and total sales, or the inventory of a single truck.
 
     Expects a GET request without any data.
 
     Returns a JSON response containing information about the ice cream trucks, their food items,
-    and total sales.
+    and total sales. The trucks are cursor-paginated: follow the 'next' and 'previous' links,
+    and pick a page size with the 'page_size' query parameter. Each page is read in a fixed
+    number of queries, however many trucks it holds.
+
+    Responses are cached until the trucks, their food items or their sales change, and carry
+    ETag and Last-Modified headers. Conditional requests with an unchanged inventory get a
+    304 Not Modified response without touching the database.
     """
 
+    @method_decorator(condition(etag_func=inventory_etag, last_modified_func=inventory_last_modified))
     def list(self, request):
-        trucks = TruckSerializer(Truck.objects.all(), many=True)
-        return Response({'Inventory': trucks.data}, status=status.HTTP_200_OK)
+        def build():
+            paginator = IdCursorPagination()
+            page = paginator.paginate_queryset(Truck.objects.with_inventory(), request, view=self)
+            trucks = TruckSerializer(page, many=True)
+            return {
+                'Inventory': trucks.data,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            }
+
+        return Response(cached_inventory(FLEET, request, build), status=status.HTTP_200_OK)
+
+    @method_decorator(condition(etag_func=inventory_etag, last_modified_func=inventory_last_modified))
+    def retrieve(self, request, pk=None):
+        def build():
+            return TruckSerializer(get_object_or_404(Truck.objects.with_inventory(), id=pk)).data
 
+        return Response(cached_inventory(pk, request, build), status=status.HTTP_200_OK)
 
-class FoodItemViewSet(viewsets.ModelViewSet):
+
+class FoodItemViewSet(ReplicaReadMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing food items.
 
@@ -83,15 +377,22 @@ class FoodItemViewSet(viewsets.ModelViewSet):
 
     - To retrieve a list of food items or a specific food item, use a GET request.
 
+    A specific food item carries ETag and Last-Modified headers; conditional requests for an
+    unchanged food item get a 304 Not Modified response.
+
+    The list is cursor-paginated: follow the 'next' and 'previous' links, and pick a page size
+    with the 'page_size' query parameter.
+
     Returns:
         Response: A Response object with food item details or an error message.
     """
 
-    queryset = FoodItem.objects.all()
+    queryset = FoodItem.objects.with_stock()
     serializer_class = FoodItemSerializer
+    pagination_class = IdCursorPagination
 
 
-class TruckViewSet(viewsets.ModelViewSet):
+class TruckViewSet(ReplicaReadMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet):
     """
     API endpoint for listing ice cream trucks.
 
@@ -99,11 +400,15 @@ class TruckViewSet(viewsets.ModelViewSet):
 
     Expects a GET request without any data.
 
-    Returns a JSON response with a list of ice cream trucks and their details.
+    Returns a JSON response with a list of ice cream trucks and their details. The list is
+    cursor-paginated: follow the 'next' and 'previous' links, and pick a page size with the
+    'page_size' query parameter. A specific truck carries ETag and Last-Modified headers;
+    conditional requests for an unchanged truck get a 304 Not Modified response.
     """
 
-    queryset = Truck.objects.all()
+    queryset = Truck.objects.with_inventory()
     serializer_class = TruckSerializer
+    pagination_class = IdCursorPagination
 
 
 class CreateTruckViewSet(viewsets.ViewSet):
@@ -135,11 +440,16 @@ class CreateFoodItemViewset(viewsets.ModelViewSet):
     This endpoint allows users to add new food items to a specific ice cream truck.
 
     Expects a PUT request with a JSON body containing the data for the new food items.
+
+    The uploaded image is validated while it streams in, and oversized or invalid images are
+    rejected with a 400 Bad Request response before the rest of the request is read. It is
+    stored without its metadata, and its resized variants are generated in the background
+    after the response is sent.
     """
 
     serializer_class = CreateFoodItemSerializer
 
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (ImageUploadParser, FormParser)
 
     def perform_create(self, serializer):
         truck_id = self.kwargs['truck_id']
@@ -147,3 +457,107 @@ class CreateFoodItemViewset(viewsets.ModelViewSet):
         truck = get_object_or_404(Truck, id=truck_id)
         instance = serializer.save(truck=truck)
         FoodFlavor.objects.create(name=flavour, food_item=instance)
+        if instance.image:
+            schedule_image_variants(instance.id)
+
+
+class ImportViewSet(viewsets.ViewSet):
+    """
+    API endpoint for importing trucks, food items and restocks in bulk.
+
+    Expects a POST request whose body is a CSV file (Content-Type 'text/csv') or a JSON Lines
+    file (Content-Type 'application/x-ndjson'), with one truck, food item or restock per row;
+    see imports.py for the fields. The body is read and imported as it streams in, in chunks
+    of IMPORT_CHUNK_SIZE rows, each applied in its own transaction.
+
+    Invalid rows are skipped and the valid ones imported. Returns the number of rows read, of
+    trucks and food items created, of restocks and units restocked, and the errors of the
+    invalid rows by row number.
+    """
+
+    def create(self, request):
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type not in CONTENT_TYPES:
+            raise UnsupportedMediaType(content_type)
+        if request.stream is None:
+            raise ParseError("The request body is empty.")
+
+        result = import_rows(read_rows(request.stream, CONTENT_TYPES[content_type]))
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+
+class SalesReportViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    API endpoint for hourly or daily sales reports.
+
+    This endpoint returns the units sold and revenue per time bucket, read from the sales
+    rollups maintained by the rollup_sales management command. Sales made since its last run
+    are not included yet.
+
+    Expects a GET request with the following optional query parameters:
+    - 'granularity': 'hour' or 'day' (default).
+    - 'start' and 'end': Only include buckets starting in this date range.
+    - 'truck': Only include sales of this truck.
+    - 'group_by': 'food_item' (default) for a row per truck and food item, or 'truck' for a
+      row per truck.
+    """
+
+    def list(self, request):
+        query = SalesReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rollups = SalesRollup.objects.filter(granularity=params['granularity'])
+        if 'start' in params:
+            rollups = rollups.filter(bucket_start__gte=params['start'])
+        if 'end' in params:
+            rollups = rollups.filter(bucket_start__lt=params['end'])
+        if 'truck' in params:
+            rollups = rollups.filter(truck_id=params['truck'])
+
+        group_by = ['bucket_start', 'truck']
+        if params['group_by'] == 'food_item':
+            group_by.append('food_item')
+        rows = rollups.values(*group_by).annotate(units=Sum('units'), revenue=Sum('revenue')).order_by(*group_by)
+        report = SalesReportSerializer(rows, many=True)
+        return Response({'Sales': report.data}, status=status.HTTP_200_OK)
+
+
+class SalesExportViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    API endpoint for exporting sales, e.g. to spreadsheets.
+
+    Streams every sale, oldest first, as CSV (default) or JSON Lines, with its ID, purchase
+    time, truck, food item, user, quantity, unit price and line total. The sales are read in
+    chunks and written out as they are read, so exports of any size run in constant memory.
+
+    Expects a GET request with the following optional query parameters:
+    - 'output': 'csv' or 'jsonl'.
+    - 'start' and 'end': Only include sales made in this date range.
+    - 'truck': Only include sales of this truck.
+
+    Sales name their customers, so exports are for staff users only.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        query = SalesExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        # filtered and ordered along the (truck, purchase_time) or (purchase_time) index
+        sales = Sale.objects.order_by('purchase_time')
+        if 'start' in params:
+            sales = sales.filter(purchase_time__gte=params['start'])
+        if 'end' in params:
+            sales = sales.filter(purchase_time__lt=params['end'])
+        if 'truck' in params:
+            sales = sales.filter(truck_id=params['truck'])
+        # the rows are read after the view returns, once the request's routing is reset
+        sales = sales.using(sales.db)
+
+        output = params['output']
+        response = StreamingHttpResponse(export_sales(sales, output), content_type=FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="sales.{output}"'
+        return response
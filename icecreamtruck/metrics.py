@@ -0,0 +1,283 @@
+"""
+Prometheus metrics, exposed in the text format at /metrics.
+
+Metrics are kept in an in-process registry, where an update takes one uncontended lock. With
+several worker processes (e.g. gunicorn workers), set METRICS_MULTIPROCESS_DIR to a directory
+shared by them, emptied before they start: each process then keeps its values in a
+memory-mapped file there, and /metrics sums the files of all of them, so any worker can
+answer a scrape. Gauges are summed across processes too.
+"""
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MemoryValues:
+    """
+    Sample values of the current process, in memory.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, keys, amount):
+        with self.lock:
+            for key in keys:
+                self.values[key] += amount
+
+    def set(self, key, value):
+        with self.lock:
+            self.values[key] = value
+
+    def read(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class MmapValues:
+    """
+    Sample values of the current process, in a memory-mapped file of `directory`.
+
+    The file starts with the number of bytes used, followed by entries made of the length of
+    a key, the key padded to 8 bytes, and a double. New entries are written before the used
+    size is bumped, so other processes can read the file at any time. A process forked from
+    another one starts a file of its own on its first update.
+    """
+
+    INITIAL_SIZE = 2**16
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def open(self):
+        self.pid = os.getpid()
+        self.file = open(os.path.join(self.directory, f'metrics_{self.pid}.db'), 'a+b')
+        self.file.truncate(self.INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), self.INITIAL_SIZE)
+        self.used = 8
+        self.positions = {}
+        struct.pack_into('q', self.map, 0, self.used)
+
+    def position(self, key):
+        position = self.positions.get(key)
+        if position is None:
+            encoded = key.encode()
+            entry = struct.pack(f'i{len(encoded)}s', len(encoded), encoded)
+            entry += b' ' * (-len(entry) % 8)
+            while self.used + len(entry) + 8 > len(self.map):
+                size = len(self.map) * 2
+                self.map.close()
+                self.file.truncate(size)
+                self.map = mmap.mmap(self.file.fileno(), size)
+            self.map[self.used : self.used + len(entry)] = entry
+            position = self.used + len(entry)
+            struct.pack_into('d', self.map, position, 0.0)
+            self.used = position + 8
+            struct.pack_into('q', self.map, 0, self.used)
+            self.positions[key] = position
+        return position
+
+    def inc(self, keys, amount):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            for key in keys:
+                position = self.position(key)
+                struct.pack_into('d', self.map, position, struct.unpack_from('d', self.map, position)[0] + amount)
+
+    def set(self, key, value):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            struct.pack_into('d', self.map, self.position(key), value)
+
+    def read(self):
+        """
+        Returns the values of all the processes, summed by key.
+        """
+        values = defaultdict(float)
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            with open(path, 'rb') as file:
+                data = file.read()
+            if len(data) < 8:
+                continue
+            used = struct.unpack_from('q', data, 0)[0]
+            position = 8
+            while position < used:
+                length = struct.unpack_from('i', data, position)[0]
+                key = data[position + 4 : position + 4 + length].decode()
+                position += 4 + length + (-(4 + length) % 8)
+                values[key] += struct.unpack_from('d', data, position)[0]
+                position += 8
+        return values
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._values = None
+
+    @property
+    def values(self):
+        if self._values is None:
+            directory = settings.METRICS_MULTIPROCESS_DIR
+            self._values = MmapValues(directory) if directory else MemoryValues()
+        return self._values
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def exposition(self):
+        """
+        Returns all the samples in the Prometheus text format.
+        """
+        samples = defaultdict(list)
+        for key, value in self.values.read().items():
+            name, sample, labels = json.loads(key)
+            samples[name].append((sample, labels, value))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for sample, labels, value in sorted(samples[name], key=metric.sort_key):
+                label_text = ','.join(f'{label}="{escape(label_value)}"' for label, label_value in labels)
+                lines.append(f'{sample}{{{label_text}}} {value:g}' if label_text else f'{sample} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def key(self, sample, labels, **extra):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.labelnames)}")
+        items = [[label, str(labels[label])] for label in self.labelnames]
+        items += [[label, value] for label, value in extra.items()]
+        return json.dumps([self.name, sample, items])
+
+    @staticmethod
+    def sort_key(sample):
+        name, labels, _ = sample
+        return name, labels
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.values.inc([self.key(self.name, labels)], amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self.registry.values.set(self.key(self.name, labels), value)
+
+    def inc(self, amount=1, **labels):
+        self.registry.values.inc([self.key(self.name, labels)], amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        # buckets are stored cumulatively, so the samples of several processes add up
+        first = bisect.bisect_left(self.buckets, value)
+        keys = [self.key(f'{self.name}_bucket', labels, le=f'{bound:g}') for bound in self.buckets[first:]]
+        keys.append(self.key(f'{self.name}_bucket', labels, le='+Inf'))
+        keys.append(self.key(f'{self.name}_count', labels))
+        self.registry.values.inc(keys, 1)
+        self.registry.values.inc([self.key(f'{self.name}_sum', labels)], value)
+
+    def sort_key(self, sample):
+        name, labels, _ = sample
+        le = dict(labels).get('le')
+        bound = float('inf') if le in (None, '+Inf') else float(le)
+        return [item for item in labels if item[0] != 'le'], name, bound
+
+
+PURCHASES = Counter(
+    'icecreamtruck_purchases_total',
+    "Purchase requests by kind (single, batch or reservation) and outcome (enjoy, sorry, not_found or expired).",
+    ['kind', 'outcome'],
+)
+UNITS_SOLD = Counter('icecreamtruck_units_sold_total', "Units sold, by truck.", ['truck'])
+REQUEST_DURATION = Histogram(
+    'icecreamtruck_request_duration_seconds',
+    "Time to answer requests, by URL name, method and status code.",
+    ['view', 'method', 'status'],
+)
+DB_QUERIES = Counter('icecreamtruck_db_queries_total', "Database queries run by requests, by URL name.", ['view'])
+SALE_BUFFER_DEPTH = Gauge('icecreamtruck_sale_buffer_depth', "Sales queued for a group commit, not inserted yet.")
+SALE_BUFFER_FLUSHED = Counter('icecreamtruck_sale_buffer_flushed_total', "Sales inserted by group commits.")
+SALE_BUFFER_DROPPED = Counter(
+    'icecreamtruck_sale_buffer_dropped_total', "Buffered sales dropped as they failed an integrity check."
+)
+SALE_BUFFER_FLUSH_DURATION = Histogram(
+    'icecreamtruck_sale_buffer_flush_seconds', "Time to insert a batch of buffered sales."
+)
+
+# queries run by the current request, counted by count_queries
+_query_count = ContextVar('query_count', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper counting the queries of the current request, installed on every connection.
+    """
+    count = _query_count.get()
+    if count is not None:
+        count[0] += 1
+    return execute(sql, params, many, context)
+
+
+def start_counting_queries():
+    count = [0]
+    return count, _query_count.set(count)
+
+
+def stop_counting_queries(token):
+    _query_count.reset(token)
+
+
+def metrics_view(request):
+    return HttpResponse(REGISTRY.exposition(), content_type=CONTENT_TYPE)
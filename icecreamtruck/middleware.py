@@ -0,0 +1,242 @@
+"""
+Per-request metrics, and profiling of SQL queries and timings.
+
+MetricsMiddleware records the duration and query count of every request in the metrics
+exposed at /metrics (see metrics.py).
+
+A sample of the requests, REQUEST_PROFILING_SAMPLE_RATE of them, is profiled: every query run
+for it is counted and timed through a database execute wrapper, and the serializers of the
+API time the objects they turn into data (see ProfiledSerializerMixin). Profiled responses
+carry a Server-Timing header with the database, serialization, rendering (JSON encoding) and
+total times, which browser developer tools display, and a structured log line is written to
+the 'icecreamtruck.requests' logger.
+Statements run REQUEST_PROFILING_REPEATED_QUERIES times or more by the same request, the
+signature of an N+1 query pattern, are logged as warnings.
+
+Requests that are not sampled only pay for a random number.
+"""
+
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metrics import DB_QUERIES, REQUEST_DURATION, start_counting_queries, stop_counting_queries
+
+logger = logging.getLogger('icecreamtruck.requests')
+
+_profile = ContextVar('request_profile', default=None)
+
+
+def current_profile():
+    """
+    Returns the RequestProfile of the current request, if it is profiled.
+    """
+    return _profile.get()
+
+
+class RequestProfile:
+    """
+    Query count and timings of a request, recorded by wrapping the execution of its queries.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_started = None
+        self.render_time = None
+        self.serialize_time = None
+        self.serializing = False
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def install(self):
+        """
+        Wraps the queries of every database connection of the current thread until the
+        returned stack is closed.
+        """
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    @contextmanager
+    def time_serialization(self):
+        """
+        Adds the time spent in the block to the serialization time, unless it is nested in
+        another timed serialization, e.g. of a related object.
+        """
+        if self.serializing:
+            yield
+            return
+        self.serializing = True
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.serialize_time = (self.serialize_time or 0) + time.perf_counter() - started
+            self.serializing = False
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        response.add_post_render_callback(self.end_render)
+        return response
+
+    def end_render(self, response):
+        self.render_time = time.perf_counter() - self.render_started
+
+    def repeated_statements(self):
+        threshold = settings.REQUEST_PROFILING_REPEATED_QUERIES
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+    def server_timing(self, total):
+        metrics = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        if self.serialize_time is not None:
+            metrics.append(f'serialize;dur={self.serialize_time * 1000:.1f}')
+        if self.render_time is not None:
+            metrics.append(f'render;dur={self.render_time * 1000:.1f}')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def finish(self, request, response):
+        total = time.perf_counter() - self.started
+        response.headers['Server-Timing'] = self.server_timing(total)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'serialize_ms': round(self.serialize_time * 1000, 2) if self.serialize_time is not None else None,
+            'render_ms': round(self.render_time * 1000, 2) if self.render_time is not None else None,
+            'total_ms': round(total * 1000, 2),
+        }
+        logger.info(json.dumps(record), extra={'profile': record})
+        for sql, count in self.repeated_statements().items():
+            logger.warning(
+                json.dumps({'method': request.method, 'path': request.path, 'repeated_query': sql, 'count': count}),
+                extra={'profile': record},
+            )
+        return response
+
+
+class QueryProfilingMiddleware:
+    """
+    Profiles a sample of the requests, see the module documentation.
+
+    Under ASGI the wrapper is installed on the connections of the thread that runs the
+    request's database queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+
+        request.profile = RequestProfile()
+        token = _profile.set(request.profile)
+        try:
+            with request.profile.install():
+                response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return request.profile.finish(request, response)
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+
+        request.profile = RequestProfile()
+        token = _profile.set(request.profile)
+        stack = await sync_to_async(request.profile.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _profile.reset(token)
+        return request.profile.finish(request, response)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook
+        if hasattr(request, 'profile'):
+            response = request.profile.start_render(response)
+        return response
+
+    @staticmethod
+    def sampled(request):
+        rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+
+class MetricsMiddleware:
+    """
+    Records the duration and query count of every request, by URL name.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        count, token = start_counting_queries()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_counting_queries(token)
+        return self.record(request, response, started, count[0])
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        count, token = start_counting_queries()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_counting_queries(token)
+        return self.record(request, response, started, count[0])
+
+    @staticmethod
+    def record(request, response, started, queries):
+        match = request.resolver_match
+        view = match.url_name or match.view_name if match else 'unmatched'
+        REQUEST_DURATION.observe(
+            time.perf_counter() - started, view=view, method=request.method, status=response.status_code
+        )
+        if queries:
+            DB_QUERIES.inc(queries, view=view)
+        return response
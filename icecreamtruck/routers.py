@@ -0,0 +1,114 @@
+"""
+Routing of read-only requests to the read replicas.
+
+Everything goes to the primary ('default') database, except the reads of the views that opt
+in with ReplicaReadMixin (the inventory, truck and food item views and the sales reports),
+which go to one of the DATABASE_REPLICAS for the rest of the request. Replicas lag behind
+the primary, so a client that just wrote, e.g. made a purchase, keeps reading from the
+primary for REPLICA_MAX_LAG_SECONDS: ReadYourWritesMiddleware marks it with a cookie.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY_COOKIE = 'read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('read_alias', default=None)
+_read_primary = ContextVar('read_primary', default=False)
+
+
+def use_replica_for_reads():
+    """
+    Sends the reads of the rest of the current request to a replica, unless there is none or
+    the client has to read its own writes.
+    """
+    if settings.DATABASE_REPLICAS and not _read_primary.get():
+        _read_alias.set(random.choice(settings.DATABASE_REPLICAS))
+
+
+def reading_from_replica():
+    return _read_alias.get() is not None
+
+
+@contextmanager
+def request_routing(request):
+    """
+    Routes the reads of a request to the primary until a view opts in to the replicas.
+    """
+    alias_token = _read_alias.set(None)
+    primary_token = _read_primary.set(PRIMARY_COOKIE in request.COOKIES)
+    try:
+        yield
+    finally:
+        _read_alias.reset(alias_token)
+        _read_primary.reset(primary_token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending writes to the primary, and the reads of the requests using
+    replicas to the replica picked for the request.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are migrated by replicating the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """
+    View mixin reading from a replica for GET, HEAD and OPTIONS requests.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            use_replica_for_reads()
+        return super().dispatch(request, *args, **kwargs)
+
+
+def stick_to_primary(request, response):
+    if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+        response.set_cookie(
+            PRIMARY_COOKIE, '1', max_age=settings.REPLICA_MAX_LAG_SECONDS, httponly=True, samesite='Lax'
+        )
+    return response
+
+
+@sync_and_async_middleware
+def ReadYourWritesMiddleware(get_response):
+    """
+    Sets up the read routing of every request, and has clients that sent a write read from the
+    primary until the replicas have caught up with it.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            with request_routing(request):
+                response = await get_response(request)
+            return stick_to_primary(request, response)
+
+    else:
+
+        def middleware(request):
+            with request_routing(request):
+                response = get_response(request)
+            return stick_to_primary(request, response)
+
+    return middleware
@@ -44,10 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'icecreamtruck.middleware.MetricsMiddleware',
+    'icecreamtruck.middleware.QueryProfilingMiddleware',
     # cors
     'corsheaders.middleware.CorsMiddleware',
     # cors
     'django.middleware.security.SecurityMiddleware',
+    'icecreamtruck.routers.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -116,6 +119,105 @@ STATIC_URL = 'static/'
 # Media settings
 MEDIA_URL = '/images/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Cache lifetime of content-addressed images (see icecreamapi/storage.py), which never change.
+# Only applied by the development server; production servers should send the same headers.
+IMMUTABLE_MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# Resized copies of food item images generated after upload: variant name -> longest edge
+# in pixels. Each is saved as JPEG and WebP by IMAGE_PROCESSING_WORKERS background threads
+# per process, or within the request when IMAGE_PROCESSING_EAGER is set.
+FOOD_ITEM_IMAGE_VARIANTS = {
+    'thumbnail': 150,
+    'medium': 600,
+}
+IMAGE_VARIANT_QUALITY = 85
+IMAGE_PROCESSING_WORKERS = config('IMAGE_PROCESSING_WORKERS', default=2, cast=int)
+IMAGE_PROCESSING_EAGER = config('IMAGE_PROCESSING_EAGER', default=False, cast=bool)
+
+# Uploaded food item images are validated while they stream in (see icecreamapi/uploads.py)
+# and rejected as soon as they exceed these limits.
+FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE = config('FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE', default=10 * 2**20, cast=int)
+FOOD_ITEM_IMAGE_MAX_DIMENSION = config('FOOD_ITEM_IMAGE_MAX_DIMENSION', default=8000, cast=int)
+FOOD_ITEM_IMAGE_FORMATS = ['JPEG', 'PNG', 'WEBP']
+
+# 'immediate' inserts the sale of a purchase in its transaction, 'buffered' queues it for a
+# group commit by a background thread every SALE_BUFFER_FLUSH_MILLISECONDS or
+# SALE_BUFFER_MAX_ROWS sales, trading the durability of the last sales for write throughput
+# (see icecreamapi/sales_buffer.py).
+PURCHASE_WRITE_MODE = config('PURCHASE_WRITE_MODE', default='immediate')
+SALE_BUFFER_FLUSH_MILLISECONDS = config('SALE_BUFFER_FLUSH_MILLISECONDS', default=50, cast=int)
+SALE_BUFFER_MAX_ROWS = config('SALE_BUFFER_MAX_ROWS', default=500, cast=int)
+SALE_BUFFER_MAX_QUEUED = config('SALE_BUFFER_MAX_QUEUED', default=10000, cast=int)
+
+# How long a checkout reservation holds its stock (see icecreamapi/reservations.py). Expired
+# reservations are put back in stock by the sweep_reservations management command.
+RESERVATION_TTL_SECONDS = config('RESERVATION_TTL_SECONDS', default=600, cast=int)
+
+# Live stock level events (see icecreamapi/events.py). The in-process broker only reaches
+# clients of the same process; multi-process deployments use the polling broker, which reads
+# the stock levels of the trucks streamed every STOCK_EVENTS_POLL_SECONDS.
+STOCK_EVENTS_BROKER = config('STOCK_EVENTS_BROKER', default='icecreamtruck.icecreamapi.events.InProcessBroker')
+STOCK_EVENTS_POLL_SECONDS = config('STOCK_EVENTS_POLL_SECONDS', default=1, cast=float)
+STOCK_EVENTS_MAX_QUEUED = 100
+STOCK_EVENTS_HEARTBEAT_SECONDS = 15
+STOCK_EVENTS_MAX_SECONDS = config('STOCK_EVENTS_MAX_SECONDS', default=300, cast=int)
+STOCK_EVENTS_RETRY_MILLISECONDS = 2000
+
+# Read replicas: aliases of DATABASES that the read-only views read from (see routers.py),
+# and how long a client that wrote keeps reading from the primary, which should exceed the
+# replication lag. Cached inventory read from a replica is kept no longer than that either.
+DATABASE_ROUTERS = ['icecreamtruck.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=5, cast=int)
+
+# SQLite databases use write-ahead logging, so reads never wait for the writer, and wait up
+# to SQLITE_BUSY_TIMEOUT seconds for the write lock instead of failing with "database is
+# locked". Set SQLITE_JOURNAL_MODE to an empty value to keep SQLite's default.
+SQLITE_JOURNAL_MODE = config('SQLITE_JOURNAL_MODE', default='WAL')
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=20, cast=float)
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default. Deployments running several processes should point CACHE_BACKEND
+# and CACHE_LOCATION at a shared backend (e.g. django.core.cache.backends.redis.RedisCache),
+# so cache invalidations reach every process.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='icecreamtruck'),
+    }
+}
+
+# Cache holding the serialized inventory, and how long an unused inventory page is kept
+INVENTORY_CACHE_ALIAS = 'default'
+INVENTORY_CACHE_TIMEOUT = config('INVENTORY_CACHE_TIMEOUT', default=300, cast=int)
+
+# Share of the requests profiled by QueryProfilingMiddleware (0 to disable, 1 for all), and how
+# many runs of the same statement within a request are logged as a likely N+1 query.
+REQUEST_PROFILING_SAMPLE_RATE = config('REQUEST_PROFILING_SAMPLE_RATE', default=0.01, cast=float)
+REQUEST_PROFILING_REPEATED_QUERIES = config('REQUEST_PROFILING_REPEATED_QUERIES', default=5, cast=int)
+
+# Directory shared by the worker processes to aggregate their metrics in (see metrics.py);
+# empty to keep metrics in memory, when running a single process.
+METRICS_MULTIPROCESS_DIR = config('METRICS_MULTIPROCESS_DIR', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'icecreamtruck.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -124,6 +226,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema'}
 
+# Page sizes of the cursor-paginated list endpoints
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=50, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=500, cast=int)
+
+# Bulk imports (see icecreamapi/imports.py) are validated and applied this many rows per
+# transaction, and report the errors of at most IMPORT_MAX_ERRORS rows.
+IMPORT_CHUNK_SIZE = config('IMPORT_CHUNK_SIZE', default=1000, cast=int)
+IMPORT_MAX_ERRORS = config('IMPORT_MAX_ERRORS', default=1000, cast=int)
+
+# Sales exports (see icecreamapi/exports.py) read and send this many rows at a time
+SALES_EXPORT_CHUNK_SIZE = config('SALES_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
 SPECTACULAR_SETTINGS = {'TITLE': 'Django DRF Ecommerce'}
 
 CORS_ALLOWED_ORIGINS = [
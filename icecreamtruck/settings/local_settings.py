@@ -10,5 +10,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT},
+        # A file-backed test database (instead of the shared in-memory one) lets threaded
+        # tests exercise real SQLite locking rather than failing on table-level locks.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
+
+# A local read replica: set SQLITE_REPLICA to the path of a copy of the database, refreshed
+# with `python manage.py copy_sqlite_replica`. Tests use the primary as the replica.
+SQLITE_REPLICA = config('SQLITE_REPLICA', default='')
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': SQLITE_REPLICA or BASE_DIR / 'db.sqlite3',
+    'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT},
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ['replica'] if SQLITE_REPLICA else []
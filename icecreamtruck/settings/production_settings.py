@@ -1,3 +1,48 @@
 from .base import *
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
+
+# Database
+# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# Configured from the environment; DB_ENGINE defaults to PostgreSQL. Connections are kept
+# open for DB_CONN_MAX_AGE seconds and checked before being reused, so requests do not pay
+# for a new connection each time. Django 4.2 has no connection pool of its own: every worker
+# thread keeps one connection, so size the workers and threads to what the database accepts,
+# or cap the connections with a pooler such as PgBouncer in front of it.
+
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.postgresql')
+DB_STATEMENT_TIMEOUT = config('DB_STATEMENT_TIMEOUT', default=5000, cast=int)  # milliseconds
+
+DATABASES = {
+    'default': {
+        'ENGINE': DB_ENGINE,
+        'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+}
+
+if DB_ENGINE == 'django.db.backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+        'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}',
+    }
+elif DB_ENGINE == 'django.db.backends.mysql':
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+        'init_command': f'SET SESSION max_execution_time={DB_STATEMENT_TIMEOUT}',
+    }
+elif DB_ENGINE == 'django.db.backends.sqlite3':
+    # single-node deployments: wait for the writer instead of failing with "database is locked"
+    DATABASES['default']['OPTIONS'] = {'timeout': SQLITE_BUSY_TIMEOUT}
+
+# Read replicas, as the comma-separated hosts of copies of the primary database that accept
+# the same credentials.
+for index, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv())):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
@@ -9,6 +9,15 @@ common_settings = override_settings(
             'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
         },
     },
+    # Changes made inside a test case never commit, so they would never invalidate a real
+    # cache; tests of the cache itself enable one explicitly.
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    },
+    IMAGE_PROCESSING_EAGER=True,
+    REQUEST_PROFILING_SAMPLE_RATE=0,
     PASSWORD_HASHERS=[
         'django.contrib.auth.hashers.MD5PasswordHasher',
     ],
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
 from django.test import TestCase
 
 from icecreamtruck.icecreamapi.models import FoodFlavor, FoodItem, Sale, Truck
@@ -37,6 +38,56 @@ class TruckModelTest(TestCase):
         Sale.objects.create(food_item=food_item_1, truck=self.truck, user=user, quantity=1)
 
         self.assertEqual(self.truck.total_sales(), 20.00)
+        self.assertEqual(self.truck.units_sold, 3)
+
+    def test_bulk_recorded_sales_update_running_totals(self):
+        food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        Sale.objects.bulk_record(
+            [
+                Sale(food_item=food_item, truck=self.truck, quantity=2),
+                Sale(food_item=food_item, truck=self.truck, quantity=1),
+            ]
+        )
+
+        self.truck.refresh_from_db()
+        self.assertEqual(self.truck.total_sales(), 15.00)
+        self.assertEqual(self.truck.units_sold, 3)
+
+    def test_rebuild_sales_totals(self):
+        food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        Sale.objects.create(food_item=food_item, truck=self.truck, quantity=2)
+        Truck.objects.update(sales_total=0, units_sold=0)
+
+        self.assertEqual(Truck.objects.rebuild_sales_totals(), 1)
+        self.truck.refresh_from_db()
+        self.assertEqual(self.truck.total_sales(), 10.00)
+        self.assertEqual(self.truck.units_sold, 2)
+
+    def test_sales_of_sharded_food_items_go_to_sales_shards(self):
+        food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        food_item.reshard_stock(2)
+        self.assertEqual(self.truck.sales_shards.count(), 2)
+
+        Sale.objects.create(food_item=food_item, truck_id=self.truck.id, quantity=2)
+        Sale.objects.bulk_record([Sale(food_item=food_item, truck_id=self.truck.id, quantity=1)])
+
+        self.truck.refresh_from_db()
+        self.assertEqual((self.truck.sales_total, self.truck.units_sold), (0, 0))
+        self.assertEqual((self.truck.total_sales(), self.truck.total_units_sold()), (15, 3))
+        truck = Truck.objects.with_sales_totals().get()
+        self.assertEqual((truck.total_sales(), truck.total_units_sold()), (15, 3))
+
+        # the rebuilt totals are held by the truck alone
+        Truck.objects.rebuild_sales_totals()
+        self.truck.refresh_from_db()
+        self.assertEqual((self.truck.sales_total, self.truck.units_sold), (15, 3))
+        self.assertEqual((self.truck.total_sales(), self.truck.total_units_sold()), (15, 3))
 
 
 class FoodItemModelTest(TestCase):
@@ -53,6 +104,65 @@ class FoodItemModelTest(TestCase):
         self.assertEqual(self.food_item.item_type, 'ice_cream')
         self.assertEqual(self.food_item.truck, self.truck)
 
+    def test_save_bumps_versions(self):
+        self.assertEqual(self.food_item.version, 1)
+        self.truck.refresh_from_db()
+        truck_version = self.truck.version
+
+        self.food_item.name = 'Mint Ice Cream'
+        self.food_item.save()
+        self.truck.refresh_from_db()
+        self.assertEqual(self.food_item.version, 2)
+        self.assertEqual(self.truck.version, truck_version + 1)
+
+        self.food_item.save(update_fields=['name'])
+        self.assertEqual(self.food_item.version, 3)
+
+    def test_quantity_cannot_go_negative(self):
+        with self.assertRaises(IntegrityError):
+            FoodItem.objects.filter(id=self.food_item.id).update(quantity=-1)
+
+    def test_decrement_stock(self):
+        self.assertEqual(FoodItem.objects.filter(id=self.food_item.id).decrement_stock(4), 1)
+        self.assertEqual(FoodItem.objects.filter(id=self.food_item.id).decrement_stock(7), 0)
+
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 6)
+
+    def test_decrement_stock_bulk(self):
+        other = FoodItem.objects.create(name='Snack', price=2.00, quantity=1, item_type='snack_bar', truck=self.truck)
+
+        self.assertEqual(FoodItem.objects.decrement_stock_bulk({self.food_item.id: 3, other.id: 2}), 1)
+        self.assertEqual(FoodItem.objects.decrement_stock_bulk({self.food_item.id: 3, other.id: 1}), 2)
+
+        self.food_item.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 4)
+        self.assertEqual(other.quantity, 0)
+
+    def test_reshard_stock(self):
+        self.food_item.reshard_stock(3)
+        self.assertEqual((self.food_item.quantity, self.food_item.stock_shards), (0, 3))
+        self.assertEqual(list(self.food_item.shards.order_by('shard').values_list('quantity', flat=True)), [4, 3, 3])
+        self.assertEqual(self.food_item.stock, 10)
+
+        self.food_item.reshard_stock(0)
+        self.assertEqual((self.food_item.quantity, self.food_item.stock_shards), (10, 0))
+        self.assertFalse(self.food_item.shards.exists())
+
+    def test_sharded_decrement_stock_sweeps_the_shards(self):
+        self.food_item.reshard_stock(3)
+        FoodItem.objects.filter(id=self.food_item.id).update(quantity=2)
+
+        # more than any single shard holds
+        self.assertTrue(self.food_item.decrement_stock(5))
+        self.assertEqual(FoodItem.objects.with_stock().get(id=self.food_item.id).stock, 7)
+        # more than is left, nothing is deducted
+        self.assertFalse(self.food_item.decrement_stock(8))
+        self.assertEqual(FoodItem.objects.with_stock().get(id=self.food_item.id).stock, 7)
+        self.assertTrue(self.food_item.decrement_stock(7))
+        self.assertEqual(FoodItem.objects.with_stock().get(id=self.food_item.id).stock, 0)
+
 
 class FlavorModelTest(TestCase):
     def setUp(self):
@@ -81,3 +191,26 @@ class SaleModelTest(TestCase):
         self.assertEqual(self.sale.truck, self.truck)
         self.assertEqual(self.sale.user, self.user)
         self.assertEqual(self.sale.quantity, 2)
+
+    def test_sale_snapshots_price(self):
+        self.assertEqual(self.sale.unit_price, 5.00)
+        self.assertEqual(self.sale.line_total, 10.00)
+
+        FoodItem.objects.filter(id=self.food_item.id).update(price=7.00)
+        Truck.objects.rebuild_sales_totals()
+
+        self.sale.refresh_from_db()
+        self.truck.refresh_from_db()
+        self.assertEqual(self.sale.line_total, 10.00)
+        self.assertEqual(self.truck.total_sales(), 10.00)
+
+
+class DatabaseConnectionTest(TestCase):
+    def test_sqlite_connection_settings(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
@@ -1,16 +1,28 @@
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from shutil import rmtree
 from tempfile import NamedTemporaryFile, mkdtemp
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 from rest_framework.test import APIClient, APITestCase
 from rest_framework.views import status
 
-from icecreamtruck.icecreamapi.models import FoodFlavor, FoodItem, Sale, Truck
+from icecreamtruck.icecreamapi.events import get_broker, publish_stock_levels
+from icecreamtruck.icecreamapi.models import FoodFlavor, FoodItem, Sale, SalesRollup, StockReservation, Truck
 from icecreamtruck.test_settings import common_settings
-from icecreamtruck.tests.api.utils import generate_photo_file
+from icecreamtruck.tests.api.utils import generate_jpeg_with_exif, generate_photo_file
 
 
 @common_settings
@@ -28,6 +40,17 @@ class PurchaseViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data, {'message': 'ENJOY!'})
 
+        self.truck.refresh_from_db()
+        self.assertEqual(self.truck.total_sales(), 5.00)
+        self.assertEqual(self.truck.units_sold, 1)
+
+    def test_create_purchase_queries(self):
+        # the food item, the stock deduction, the sale and the truck's totals, in the view's
+        # transaction: a savepoint and its release here, as tests run in a transaction
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
     def test_create_purchase_insufficient_quantity(self):
         response = self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 20})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -43,6 +66,204 @@ class PurchaseViewSetTest(APITestCase):
         response = self.client.post(reverse('purchase-list'), data={'food_id': 999, 'quantity': 1})
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_purchase_sharded_food_item(self):
+        self.food_item.reshard_stock(4)
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 3}
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            # only shards are updated, neither the food item's row nor the truck's
+            tables = {query['sql'].split()[1] for query in queries if query['sql'].startswith('UPDATE')}
+            self.assertEqual(tables, {'"icecreamapi_stockshard"', '"icecreamapi_salesshard"'})
+        response = self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # the shards add up to the quantity shown
+        response = self.client.get(reverse('fooditem-detail', kwargs={'pk': self.food_item.id}))
+        self.assertEqual(response.data['quantity'], 1)
+        response = self.client.get(reverse('inventory-detail', kwargs={'pk': self.truck.id}))
+        self.assertEqual(response.data['food_items'][0]['quantity'], 1)
+        self.assertEqual(response.data['total_sales'], 45)
+        self.assertEqual(Sale.objects.filter(food_item=self.food_item).count(), 3)
+
+
+@common_settings
+class BatchPurchaseViewSetTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.ice_cream = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        self.shaved_ice = FoodItem.objects.create(
+            name='Shaved Ice', price=3.00, quantity=2, item_type='shaved_ice', truck=self.truck
+        )
+
+    def purchase(self, items):
+        return self.client.post(reverse('purchase-batch'), data={'items': items}, format='json')
+
+    def test_batch_purchase(self):
+        response = self.purchase(
+            [{'food_id': self.ice_cream.id, 'quantity': 3}, {'food_id': self.shaved_ice.id, 'quantity': 2}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'message': 'ENJOY!'})
+
+        self.ice_cream.refresh_from_db()
+        self.shaved_ice.refresh_from_db()
+        self.assertEqual(self.ice_cream.quantity, 7)
+        self.assertEqual(self.shaved_ice.quantity, 0)
+        self.assertEqual(Sale.objects.filter(truck=self.truck).count(), 2)
+
+    def test_batch_purchase_of_sharded_food_item(self):
+        self.ice_cream.reshard_stock(3)
+        response = self.purchase(
+            [{'food_id': self.ice_cream.id, 'quantity': 3}, {'food_id': self.shaved_ice.id, 'quantity': 2}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FoodItem.objects.with_stock().get(id=self.ice_cream.id).stock, 7)
+
+        response = self.purchase([{'food_id': self.ice_cream.id, 'quantity': 8}])
+        self.assertEqual(response.data['errors'], [{'line': 0, 'food_id': self.ice_cream.id, 'message': 'SORRY!'}])
+
+    def test_batch_purchase_is_all_or_nothing(self):
+        response = self.purchase(
+            [
+                {'food_id': self.ice_cream.id, 'quantity': 3},
+                {'food_id': self.shaved_ice.id, 'quantity': 5},
+                {'food_id': 999, 'quantity': 1},
+            ]
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data,
+            {
+                'message': 'SORRY!',
+                'errors': [
+                    {'line': 1, 'food_id': self.shaved_ice.id, 'message': 'SORRY!'},
+                    {'line': 2, 'food_id': 999, 'message': 'Food item not found'},
+                ],
+            },
+        )
+
+        self.ice_cream.refresh_from_db()
+        self.assertEqual(self.ice_cream.quantity, 10)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_batch_purchase_checks_repeated_items_together(self):
+        response = self.purchase(
+            [{'food_id': self.shaved_ice.id, 'quantity': 1}, {'food_id': self.shaved_ice.id, 'quantity': 2}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['errors']), 2)
+
+        self.shaved_ice.refresh_from_db()
+        self.assertEqual(self.shaved_ice.quantity, 2)
+
+    def test_batch_purchase_invalid_data(self):
+        response = self.purchase([])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@common_settings
+class PurchaseConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def purchase(self, quantity):
+        try:
+            data = {'food_id': self.food_item.id, 'quantity': quantity}
+            return APIClient().post(reverse('purchase-list'), data=data).status_code
+        finally:
+            connection.close()
+
+    def test_parallel_purchases_never_oversell(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(self.purchase, [3] * 24))
+
+        self.food_item.refresh_from_db()
+        sold = Sale.objects.filter(food_item=self.food_item).count()
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED), 3)
+        self.assertEqual(statuses.count(status.HTTP_400_BAD_REQUEST), 21)
+        self.assertEqual(sold, 3)
+        self.assertEqual(self.food_item.quantity, 1)
+
+    def test_parallel_purchases_of_sharded_stock_never_oversell(self):
+        self.food_item.reshard_stock(4)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(self.purchase, [1] * 24))
+
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED), 10)
+        self.assertEqual(Sale.objects.filter(food_item=self.food_item).count(), 10)
+        self.assertEqual(FoodItem.objects.with_stock().get(id=self.food_item.id).stock, 0)
+
+
+@common_settings
+class ReservationViewSetTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def reserve(self, quantity):
+        return self.client.post(reverse('reservation-list'), data={'food_id': self.food_item.id, 'quantity': quantity})
+
+    def purchase(self, reservation_id):
+        return self.client.post(reverse('reservation-purchase', kwargs={'pk': reservation_id}))
+
+    def test_reserve_and_purchase(self):
+        response = self.reserve(4)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['food_id'], response.data['quantity']), (self.food_item.id, 4))
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 6)
+
+        # the stock is not touched again at checkout
+        reservation_id = response.data['id']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.purchase(reservation_id)
+        self.assertFalse([query for query in queries if 'UPDATE "icecreamapi_fooditem"' in query['sql']])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'message': 'ENJOY!'})
+        self.food_item.refresh_from_db()
+        self.truck.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 6)
+        self.assertEqual((self.truck.units_sold, self.truck.total_sales()), (4, 20))
+
+        response = self.purchase(reservation_id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reserve_insufficient_quantity(self):
+        response = self.reserve(11)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'message': 'SORRY!'})
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservation_cannot_be_purchased(self):
+        reservation_id = self.reserve(4).data['id']
+        StockReservation.objects.update(expires_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+        response = self.purchase(reservation_id)
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_release(self):
+        reservation_id = self.reserve(4).data['id']
+        response = self.client.delete(reverse('reservation-detail', kwargs={'pk': reservation_id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 10)
+
+        response = self.client.delete(reverse('reservation-detail', kwargs={'pk': reservation_id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 @common_settings
 class InventoryViewSetTest(APITestCase):
@@ -54,6 +275,242 @@ class InventoryViewSetTest(APITestCase):
         response = self.client.get(reverse('inventory-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_inventory_pagination(self):
+        truck = Truck.objects.create(name='Truck 1')
+
+        response = self.client.get(reverse('inventory-list'), {'page_size': 1})
+        self.assertEqual([truck['id'] for truck in response.data['Inventory']], [self.truck.id])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([truck['id'] for truck in response.data['Inventory']], [truck.id])
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_list_inventory_total_sales(self):
+        food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        Sale.objects.create(food_item=food_item, truck=self.truck, quantity=3)
+
+        response = self.client.get(reverse('inventory-list'))
+        self.assertEqual(response.data['Inventory'][0]['total_sales'], 15)
+        self.assertEqual(len(response.data['Inventory'][0]['food_items']), 1)
+
+    def test_list_inventory_query_count_is_constant(self):
+        def add_truck(name):
+            truck = Truck.objects.create(name=name)
+            food_item = FoodItem.objects.create(name='Ice Cream', price=5.00, quantity=10, truck=truck)
+            Sale.objects.create(food_item=food_item, truck=truck, quantity=1)
+
+        add_truck('Truck 1')
+        with self.assertNumQueries(2):
+            self.client.get(reverse('inventory-list'))
+
+        for index in range(2, 10):
+            add_truck(f'Truck {index}')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('inventory-list'))
+        self.assertEqual(len(response.data['Inventory']), 10)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@common_settings
+class InventoryCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.other_truck = Truck.objects.create(name='Truck 1')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def purchase(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': quantity})
+
+    def test_inventory_is_cached_until_a_purchase(self):
+        self.client.get(reverse('inventory-list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('inventory-list'))
+        self.assertEqual(response.data['Inventory'][0]['food_items'][0]['quantity'], 10)
+
+        self.purchase(3)
+        response = self.client.get(reverse('inventory-list'))
+        self.assertEqual(response.data['Inventory'][0]['food_items'][0]['quantity'], 7)
+        self.assertEqual(response.data['Inventory'][0]['total_sales'], 15)
+
+    def test_truck_inventory_is_invalidated_per_truck(self):
+        self.client.get(reverse('inventory-detail', kwargs={'pk': self.truck.id}))
+        self.client.get(reverse('inventory-detail', kwargs={'pk': self.other_truck.id}))
+
+        self.purchase(3)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('inventory-detail', kwargs={'pk': self.other_truck.id}))
+        response = self.client.get(reverse('inventory-detail', kwargs={'pk': self.truck.id}))
+        self.assertEqual(response.data['food_items'][0]['quantity'], 7)
+
+    def test_batch_purchase_invalidates_inventory(self):
+        self.client.get(reverse('inventory-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('purchase-batch'),
+                data={'items': [{'food_id': self.food_item.id, 'quantity': 2}]},
+                format='json',
+            )
+
+        response = self.client.get(reverse('inventory-list'))
+        self.assertEqual(response.data['Inventory'][0]['food_items'][0]['quantity'], 8)
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('inventory-list'))
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('inventory-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.purchase(1)
+        response = self.client.get(reverse('inventory-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_retrieve_missing_truck(self):
+        response = self.client.get(reverse('inventory-detail', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@common_settings
+class SalesReportViewSetTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.ice_cream = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        self.shaved_ice = FoodItem.objects.create(
+            name='Shaved Ice', price=3.00, quantity=10, item_type='shaved_ice', truck=self.truck
+        )
+        for food_item, day, units in [(self.ice_cream, 1, 2), (self.shaved_ice, 1, 1), (self.ice_cream, 2, 4)]:
+            SalesRollup.objects.create(
+                truck=self.truck,
+                food_item=food_item,
+                granularity=SalesRollup.DAY,
+                bucket_start=datetime(2023, 11, day, tzinfo=timezone.utc),
+                units=units,
+                revenue=food_item.price * units,
+            )
+
+    def test_sales_report(self):
+        response = self.client.get(reverse('sales-report'), {'start': '2023-11-02T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data['Sales'],
+            [
+                {
+                    'bucket_start': '2023-11-02T00:00:00Z',
+                    'truck': self.truck.id,
+                    'food_item': self.ice_cream.id,
+                    'units': 4,
+                    'revenue': '20.00',
+                }
+            ],
+        )
+
+    def test_sales_report_by_truck(self):
+        response = self.client.get(reverse('sales-report'), {'group_by': 'truck', 'end': '2023-11-02T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data['Sales'],
+            [{'bucket_start': '2023-11-01T00:00:00Z', 'truck': self.truck.id, 'units': 3, 'revenue': '13.00'}],
+        )
+
+    def test_sales_report_invalid_granularity(self):
+        response = self.client.get(reverse('sales-report'), {'granularity': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@common_settings
+class SalesExportViewSetTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.other_truck = Truck.objects.create(name='Other Truck')
+        self.ice_cream = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        self.shaved_ice = FoodItem.objects.create(
+            name='Shaved Ice', price=3.00, quantity=10, item_type='shaved_ice', truck=self.other_truck
+        )
+        self.sales = []
+        for food_item, day, quantity in [(self.ice_cream, 2, 2), (self.shaved_ice, 1, 1), (self.ice_cream, 3, 4)]:
+            sale = Sale.objects.create(food_item=food_item, truck=food_item.truck, quantity=quantity)
+            Sale.objects.filter(id=sale.id).update(purchase_time=datetime(2023, 11, day, tzinfo=timezone.utc))
+            self.sales.append(sale)
+        self.client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+
+    def export(self, **params):
+        response = self.client.get(reverse('sales-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_is_for_staff_only(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('sales-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create_user(username='customer'))
+        response = self.client.get(reverse('sales-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales.csv"')
+        first, second, third = self.sales
+        self.assertEqual(
+            content.splitlines(),
+            [
+                'id,purchase_time,truck_id,food_item_id,user_id,quantity,unit_price,line_total',
+                f'{second.id},2023-11-01T00:00:00+00:00,{self.other_truck.id},{self.shaved_ice.id},,1,3.00,3.00',
+                f'{first.id},2023-11-02T00:00:00+00:00,{self.truck.id},{self.ice_cream.id},,2,5.00,10.00',
+                f'{third.id},2023-11-03T00:00:00+00:00,{self.truck.id},{self.ice_cream.id},,4,5.00,20.00',
+            ],
+        )
+
+    @override_settings(SALES_EXPORT_CHUNK_SIZE=1)
+    def test_export_jsonl_filtered(self):
+        response, content = self.export(
+            output='jsonl', truck=self.truck.id, start='2023-11-02T00:00:00Z', end='2023-11-03T00:00:00Z'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(
+            [json.loads(line) for line in content.splitlines()],
+            [
+                {
+                    'id': self.sales[0].id,
+                    'purchase_time': '2023-11-02T00:00:00Z',
+                    'truck_id': self.truck.id,
+                    'food_item_id': self.ice_cream.id,
+                    'user_id': None,
+                    'quantity': 2,
+                    'unit_price': '5.00',
+                    'line_total': '10.00',
+                }
+            ],
+        )
+
+    def test_export_reads_rows_in_one_query(self):
+        response = self.client.get(reverse('sales-export'))
+        with self.assertNumQueries(1):
+            b''.join(response.streaming_content)
+
+    def test_export_invalid_params(self):
+        response = self.client.get(reverse('sales-export'), {'output': 'xlsx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 @common_settings
 class TruckViewSetTest(APITestCase):
@@ -74,7 +531,7 @@ class TruckViewSetTest(APITestCase):
     def test_list_trucks(self):
         response = self.client.get(reverse('truck-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        trucks_data = response.data
+        trucks_data = response.data['results']
 
         # Check if the response data is a list
         self.assertIsInstance(trucks_data, list)
@@ -87,6 +544,17 @@ class TruckViewSetTest(APITestCase):
             self.assertIn('id', truck_data)
             self.assertIn('name', truck_data)
 
+    def test_list_trucks_cursor_pagination(self):
+        response = self.client.get(reverse('truck-list'), {'page_size': 2})
+        self.assertEqual([truck['id'] for truck in response.data['results']], [self.truck.id, self.truck1.id])
+        self.assertIsNone(response.data['previous'])
+
+        # a truck added while paging is picked up at the end, without repeating any
+        new_truck = Truck.objects.create(name='Truck 3')
+        response = self.client.get(response.data['next'])
+        self.assertEqual([truck['id'] for truck in response.data['results']], [self.truck2.id, new_truck.id])
+        self.assertIsNone(response.data['next'])
+
 
 @common_settings
 class FoodItemViewSetTest(APITestCase):
@@ -108,7 +576,7 @@ class FoodItemViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # confirm response data
-        food_items_data = response.data
+        food_items_data = response.data['results']
         self.assertIsInstance(food_items_data, list)
         # self.assertEqual(len(food_items_data), 1)
 
@@ -136,6 +604,312 @@ class FoodItemViewSetTest(APITestCase):
         self.assertIn('truck', food_item_data)
 
 
+@common_settings
+class ConditionalRetrieveTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def assertRevalidates(self, url, change):
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def purchase(self):
+        self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 1})
+
+    def test_food_item_changes_on_purchase(self):
+        self.assertRevalidates(reverse('fooditem-detail', kwargs={'pk': self.food_item.id}), self.purchase)
+
+    def test_sharded_food_item_changes_on_purchase(self):
+        self.food_item.reshard_stock(2)
+        self.assertRevalidates(reverse('fooditem-detail', kwargs={'pk': self.food_item.id}), self.purchase)
+
+    def test_truck_changes_on_purchase(self):
+        self.assertRevalidates(reverse('truck-detail', kwargs={'pk': self.truck.id}), self.purchase)
+
+    def test_truck_changes_on_sharded_purchase(self):
+        self.food_item.reshard_stock(2)
+        self.assertRevalidates(reverse('truck-detail', kwargs={'pk': self.truck.id}), self.purchase)
+
+    @override_settings(PURCHASE_WRITE_MODE='buffered')
+    def test_truck_changes_on_buffered_purchase(self):
+        # the sale is only queued once the purchase commits, so the truck itself is untouched
+        self.assertRevalidates(reverse('truck-detail', kwargs={'pk': self.truck.id}), self.purchase)
+
+    def test_truck_changes_when_a_food_item_is_deleted(self):
+        food_item = FoodItem.objects.create(
+            name='Snack Bar', price=2.00, quantity=10, item_type='snack_bar', truck=self.truck
+        )
+        self.assertRevalidates(reverse('truck-detail', kwargs={'pk': self.truck.id}), food_item.delete)
+
+    def test_truck_changes_with_its_food_items(self):
+        def rename_food_item():
+            self.food_item.name = 'Mint Ice Cream'
+            self.food_item.save()
+
+        self.assertRevalidates(reverse('truck-detail', kwargs={'pk': self.truck.id}), rename_food_item)
+
+    def test_retrieve_missing_food_item(self):
+        response = self.client.get(reverse('fooditem-detail', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@common_settings
+class AsyncViewsTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.trucks = [Truck.objects.create(name=f'Truck {index}') for index in range(3)]
+        for truck in self.trucks:
+            FoodItem.objects.create(name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=truck)
+
+    def test_detail_matches_sync_view(self):
+        truck = self.trucks[0]
+        food_item = truck.food_items.get()
+        for sync_name, async_name, pk in [
+            ('truck-detail', 'async-truck-detail', truck.id),
+            ('fooditem-detail', 'async-fooditem-detail', food_item.id),
+            ('inventory-detail', 'async-inventory-detail', truck.id),
+        ]:
+            sync_response = self.client.get(reverse(sync_name, kwargs={'pk': pk}))
+            async_response = self.client.get(reverse(async_name, kwargs={'pk': pk}))
+            self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_list_matches_sync_view(self):
+        for sync_name, async_name in [
+            ('truck-list', 'async-truck-list'),
+            ('fooditem-list', 'async-fooditem-list'),
+            ('inventory-list', 'async-inventory-list'),
+        ]:
+            sync_url, async_url = reverse(sync_name), reverse(async_name)
+            params = {'page_size': 2}
+            while True:
+                sync_data = self.client.get(sync_url, params).json()
+                async_data = self.client.get(async_url, params).json()
+                # the links differ in their path only, so they carry the same cursor
+                self.assertEqual(async_data, json.loads(json.dumps(sync_data).replace(sync_url, async_url)))
+                if sync_data['next'] is None:
+                    break
+                params = {'page_size': 2, 'cursor': parse_qs(urlsplit(sync_data['next']).query)['cursor'][0]}
+
+    async def test_list_pages(self):
+        response = await self.async_client.get(reverse('async-truck-list'), {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual([truck['name'] for truck in data['results']], ['Truck 0', 'Truck 1'])
+        self.assertEqual(len(data['results'][0]['food_items']), 1)
+
+        response = await self.async_client.get(data['next'])
+        data = response.json()
+        self.assertEqual([truck['name'] for truck in data['results']], ['Truck 2'])
+        self.assertIsNone(data['next'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_inventory_list(self):
+        url = reverse('async-inventory-list')
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['Inventory']), 2)
+        self.assertIn('cursor=', response.json()['next'])
+
+        response = self.client.get(url, {'page_size': 2}, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('async-fooditem-list'), {'cursor': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), self.client.get(reverse('fooditem-list'), {'cursor': 'x'}).json())
+
+    def test_detail_revalidates(self):
+        url = reverse('async-fooditem-detail', kwargs={'pk': self.trucks[0].food_items.get().id})
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_retrieve_missing_truck(self):
+        for name in ['async-truck-detail', 'async-inventory-detail']:
+            response = self.client.get(reverse(name, kwargs={'pk': 999}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@common_settings
+class StockEventsTest(APITestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=2, item_type='ice_cream', truck=self.truck
+        )
+        self.url = reverse('truck-stock-events', kwargs={'pk': self.truck.id})
+
+    def purchase(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': quantity}
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    async def test_purchases_are_streamed(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.headers['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry: '))
+        event = {'truck': self.truck.id, 'food_item': self.food_item.id, 'quantity': 2}
+        self.assertEqual(await anext(stream), f'event: stock\ndata: {json.dumps(event)}\n\n'.encode())
+
+        await sync_to_async(self.purchase)(2)
+        event['quantity'] = 0
+        self.assertEqual(await anext(stream), f'event: stock\ndata: {json.dumps(event)}\n\n'.encode())
+        self.assertEqual(await anext(stream), f'event: sold_out\ndata: {json.dumps(event)}\n\n'.encode())
+        await stream.aclose()
+
+    @override_settings(
+        STOCK_EVENTS_BROKER='icecreamtruck.icecreamapi.events.PollingBroker', STOCK_EVENTS_POLL_SECONDS=60
+    )
+    async def test_polling_broker_streams_changes_of_any_process(self):
+        response = await self.async_client.get(self.url)
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        event = {'truck': self.truck.id, 'food_item': self.food_item.id, 'quantity': 2}
+        self.assertEqual(await anext(stream), f'event: stock\ndata: {json.dumps(event)}\n\n'.encode())
+
+        poll = sync_to_async(get_broker().poll)
+        # the first poll of a truck sends its stock levels again, later ones only the changes
+        await poll()
+        self.assertEqual(await anext(stream), f'event: stock\ndata: {json.dumps(event)}\n\n'.encode())
+        await poll()
+        # sold by another process, which publishes nothing here
+        await FoodItem.objects.filter(id=self.food_item.id).aupdate(quantity=0)
+        await poll()
+        event['quantity'] = 0
+        self.assertEqual(await anext(stream), f'event: stock\ndata: {json.dumps(event)}\n\n'.encode())
+        self.assertEqual(await anext(stream), f'event: sold_out\ndata: {json.dumps(event)}\n\n'.encode())
+        await stream.aclose()
+
+    def test_nothing_is_published_without_subscribers(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            publish_stock_levels([self.truck.id], [self.food_item.id])
+        self.assertEqual(callbacks, [])
+
+    async def test_missing_truck(self):
+        response = await self.async_client.get(reverse('truck-stock-events', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_not_streamed_under_wsgi(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(get_broker().has_subscribers(self.truck.id))
+
+    @override_settings(STOCK_EVENTS_BROKER='icecreamtruck.icecreamapi.events.PollingBroker')
+    def test_polling_broker_is_not_published_to(self):
+        with mock.patch.object(get_broker(), 'has_subscribers', return_value=True):
+            with self.captureOnCommitCallbacks() as callbacks:
+                publish_stock_levels([self.truck.id], [self.food_item.id])
+        self.assertEqual(callbacks, [])
+
+
+@common_settings
+class ImportViewSetTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def post(self, body, content_type):
+        return self.client.generic('POST', reverse('import'), body.encode(), content_type=content_type)
+
+    def test_import_csv(self):
+        body = (
+            'action,truck,food_item,name,price,quantity,item_type,flavour\n'
+            'truck,,,New Truck,,,,\n'
+            f'food_item,{self.truck.id},,Shaved Ice,3.50,20,shaved_ice,strawberry\n'
+            f'food_item,{self.truck.id},,Snack Bar,2.00,5,snack_bar,\n'
+            f'restock,,{self.food_item.id},,,15,,\n'
+            f'restock,,{self.food_item.id},,,5,,\n'
+        )
+        version = self.truck.version
+
+        response = self.post(body, 'text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {
+                'rows': 5,
+                'trucks_created': 1,
+                'food_items_created': 2,
+                'restocks': 2,
+                'units_restocked': 20,
+                'error_count': 0,
+                'errors': [],
+            },
+        )
+        self.assertTrue(Truck.objects.filter(name='New Truck').exists())
+        shaved_ice = FoodItem.objects.get(name='Shaved Ice')
+        self.assertEqual(
+            (shaved_ice.truck_id, shaved_ice.quantity, shaved_ice.item_type), (self.truck.id, 20, 'shaved_ice')
+        )
+        self.assertEqual(list(FoodFlavor.objects.values_list('name', 'food_item')), [('strawberry', shaved_ice.id)])
+
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 30)
+        self.truck.refresh_from_db()
+        self.assertGreater(self.truck.version, version)
+
+    def test_import_jsonl_reports_invalid_rows(self):
+        lines = [
+            {'action': 'restock', 'food_item': self.food_item.id, 'quantity': 2},
+            {'action': 'restock', 'food_item': 0, 'quantity': 2},
+            {'action': 'restock', 'food_item': self.food_item.id, 'quantity': -1},
+            {'action': 'food_item', 'truck': 0, 'name': 'Lost', 'price': '1.00', 'quantity': 1},
+            {'action': 'sell'},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n\nnot json\n'
+
+        with override_settings(IMPORT_CHUNK_SIZE=2):
+            response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rows'], 6)
+        self.assertEqual(response.data['units_restocked'], 2)
+        self.assertEqual(response.data['error_count'], 5)
+        self.assertEqual(
+            [(error['row'], list(error['errors'])) for error in response.data['errors']],
+            [(2, ['food_item']), (3, ['quantity']), (4, ['truck']), (5, ['action']), (6, ['non_field_errors'])],
+        )
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 12)
+
+    @override_settings(IMPORT_MAX_ERRORS=1)
+    def test_import_caps_reported_errors(self):
+        response = self.post('{}\n{}\n', 'application/x-ndjson')
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual(len(response.data['errors']), 1)
+
+    def test_import_unsupported_content_type(self):
+        response = self.post('{}', 'application/json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_import_empty_body(self):
+        response = self.post('', 'text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 @common_settings
 class CreateTruckViewSetTest(APITestCase):
     def setUp(self):
@@ -173,6 +947,72 @@ class CreateFoodItemViewSetTest(APITestCase):
         # Ensure food items and flavors were created
         self.assertEqual(FoodItem.objects.count(), 1)
 
+    def test_create_food_item_generates_image_variants(self):
+        valid_data = {
+            'name': 'Ice Cream',
+            'price': '5.00',
+            'quantity': 10,
+            'item_type': 'ice_cream',
+            'image': self.photo_file,
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, valid_data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        food_item = FoodItem.objects.get()
+        response = self.client.get(reverse('fooditem-detail', kwargs={'pk': food_item.id}))
+        self.assertEqual(set(response.data['image_variants']), {'thumbnail', 'medium'})
+        self.assertTrue(response.data['image_variants']['thumbnail']['webp'].startswith('http://testserver/images/'))
+
+    def test_create_food_item_strips_image_metadata(self):
+        data = {
+            'name': 'Ice Cream',
+            'price': '5.00',
+            'quantity': 10,
+            'item_type': 'ice_cream',
+            'image': generate_jpeg_with_exif(gps={1: 'N', 2: (48.0, 51.0, 24.0)}),
+        }
+
+        response = self.client.post(self.url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with FoodItem.objects.get().image.open('rb') as image_file, Image.open(image_file) as image:
+            self.assertEqual(dict(image.getexif()), {})
+
+    @override_settings(FOOD_ITEM_IMAGE_MAX_UPLOAD_SIZE=1024, DATA_UPLOAD_MAX_MEMORY_SIZE=None)
+    def test_create_food_item_image_too_large(self):
+        image = SimpleUploadedFile('big.png', self.photo_file.read() + b'\0' * 2048, content_type='image/png')
+        data = {'name': 'Ice Cream', 'price': '5.00', 'quantity': 10, 'item_type': 'ice_cream', 'image': image}
+
+        response = self.client.post(self.url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('at most 1024 bytes', response.data['detail'])
+        self.assertEqual(FoodItem.objects.count(), 0)
+
+    @override_settings(FOOD_ITEM_IMAGE_MAX_DIMENSION=50)
+    def test_create_food_item_image_too_wide(self):
+        data = {
+            'name': 'Ice Cream',
+            'price': '5.00',
+            'quantity': 10,
+            'item_type': 'ice_cream',
+            'image': self.photo_file,
+        }
+
+        response = self.client.post(self.url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not 100x100', response.data['detail'])
+        self.assertEqual(FoodItem.objects.count(), 0)
+
+    def test_create_food_item_not_an_image(self):
+        image = SimpleUploadedFile('photo.png', b'not an image', content_type='image/png')
+        data = {'name': 'Ice Cream', 'price': '5.00', 'quantity': 10, 'item_type': 'ice_cream', 'image': image}
+
+        response = self.client.post(self.url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Upload a valid image', response.data['detail'])
+        self.assertEqual(FoodItem.objects.count(), 0)
+
     def test_create_food_item_invalid_data(self):
         invalid_data = {
             'name': 'Invalid Food',
@@ -1,5 +1,6 @@
 import io
 
+from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 
 
@@ -10,3 +11,15 @@ def generate_photo_file():
     file.name = 'test.png'
     file.seek(0)
     return file
+
+
+def generate_jpeg_with_exif(orientation=None, gps=None):
+    exif = Image.Exif()
+    exif[0x010E] = 'taken on a phone'
+    if orientation is not None:
+        exif[0x0112] = orientation
+    if gps is not None:
+        exif[0x8825] = gps
+    file = io.BytesIO()
+    Image.new('RGB', size=(1200, 800), color=(0, 155, 0)).save(file, 'jpeg', exif=exif)
+    return SimpleUploadedFile('photo.jpg', file.getvalue(), content_type='image/jpeg')
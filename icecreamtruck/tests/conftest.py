@@ -1,7 +1,8 @@
 from pytest_factoryboy import register
 
-from .factories import CustomerFactory, FoodFlavorFactory, FoodItemFactory
+from .factories import FoodFlavorFactory, FoodItemFactory, SaleFactory, TruckFactory
 
 register(FoodItemFactory)
 register(FoodFlavorFactory)
-register(CustomerFactory)
+register(TruckFactory)
+register(SaleFactory)
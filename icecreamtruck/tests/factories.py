@@ -4,7 +4,14 @@ import factory
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 
-from icecreamtruck.icecreamapi.models import Customer, FoodFlavor, FoodItem
+from icecreamtruck.icecreamapi.models import FoodFlavor, FoodItem, Sale, Truck
+
+
+class TruckFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Truck
+
+    name = factory.Sequence(lambda n: f"Truck {n}")
 
 
 class FoodItemFactory(factory.django.DjangoModelFactory):
@@ -15,6 +22,9 @@ class FoodItemFactory(factory.django.DjangoModelFactory):
 
     name = "test_fooditem"
     price = 5.00
+    quantity = 10
+    item_type = 'ice_cream'
+    truck = factory.SubFactory(TruckFactory)
 
     # Create a SimpleUploadedFile to test images
     @factory.post_generation
@@ -35,8 +45,10 @@ class FoodFlavorFactory(factory.django.DjangoModelFactory):
     food_item = factory.SubFactory(FoodItemFactory)
 
 
-class CustomerFactory(factory.django.DjangoModelFactory):
+class SaleFactory(factory.django.DjangoModelFactory):
     class Meta:
-        model = Customer
+        model = Sale
 
-    name = "test_customer"
+    food_item = factory.SubFactory(FoodItemFactory)
+    truck = factory.SelfAttribute('food_item.truck')
+    quantity = 1
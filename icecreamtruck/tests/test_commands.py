@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from tempfile import NamedTemporaryFile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.timezone import now as timezone_now
+
+from icecreamtruck.icecreamapi.models import FoodItem, Sale, SalesRollup, StockReservation, Truck
+from icecreamtruck.icecreamapi.reservations import reserve
+
+
+class RebuildSalesTotalsCommandTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        Sale.objects.create(food_item=self.food_item, truck=self.truck, quantity=2)
+
+    def test_check_reports_drift(self):
+        out = StringIO()
+        call_command('rebuild_sales_totals', '--check', stdout=out)
+        self.assertIn('All sales totals match', out.getvalue())
+
+        Truck.objects.update(sales_total=1, units_sold=1)
+        out = StringIO()
+        call_command('rebuild_sales_totals', '--check', stdout=out)
+        self.assertIn('1 truck(s) have drifted', out.getvalue())
+
+        self.truck.refresh_from_db()
+        self.assertEqual(self.truck.units_sold, 1)
+
+    def test_check_adds_up_sales_shards(self):
+        self.food_item.reshard_stock(2)
+        Sale.objects.create(food_item=self.food_item, truck=self.truck, quantity=1)
+
+        out = StringIO()
+        call_command('rebuild_sales_totals', '--check', stdout=out)
+        self.assertIn('All sales totals match', out.getvalue())
+
+    def test_rebuild(self):
+        Truck.objects.update(sales_total=0, units_sold=0)
+        call_command('rebuild_sales_totals', stdout=StringIO())
+
+        self.truck.refresh_from_db()
+        self.assertEqual(self.truck.total_sales(), 10)
+        self.assertEqual(self.truck.units_sold, 2)
+
+
+class RollupSalesCommandTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def sell(self, quantity, purchase_time):
+        sale = Sale.objects.create(food_item=self.food_item, truck=self.truck, quantity=quantity)
+        Sale.objects.filter(id=sale.id).update(purchase_time=purchase_time)
+
+    def rollup(self):
+        call_command('rollup_sales', '--settle-seconds', '0', stdout=StringIO())
+
+    def test_rollup_is_incremental(self):
+        self.sell(1, datetime(2023, 11, 1, 10, 15, tzinfo=timezone.utc))
+        self.sell(2, datetime(2023, 11, 1, 10, 45, tzinfo=timezone.utc))
+        self.rollup()
+        self.rollup()
+
+        hourly = SalesRollup.objects.get(granularity=SalesRollup.HOUR)
+        self.assertEqual(hourly.bucket_start, datetime(2023, 11, 1, 10, tzinfo=timezone.utc))
+        self.assertEqual((hourly.units, hourly.revenue), (3, 15))
+
+        self.sell(1, datetime(2023, 11, 1, 11, 5, tzinfo=timezone.utc))
+        self.rollup()
+
+        self.assertEqual(SalesRollup.objects.filter(granularity=SalesRollup.HOUR).count(), 2)
+        daily = SalesRollup.objects.get(granularity=SalesRollup.DAY)
+        self.assertEqual(daily.bucket_start, datetime(2023, 11, 1, tzinfo=timezone.utc))
+        self.assertEqual((daily.units, daily.revenue), (4, 20))
+
+    def test_rollup_waits_for_unsettled_sales(self):
+        # the first sale's purchase time comes after the cutoff, the second's before
+        self.sell(1, timezone_now() + timedelta(hours=1))
+        self.sell(2, datetime(2023, 11, 1, 10, 15, tzinfo=timezone.utc))
+        self.rollup()
+        self.assertFalse(SalesRollup.objects.exists())
+
+        Sale.objects.update(purchase_time=datetime(2023, 11, 1, 10, 45, tzinfo=timezone.utc))
+        self.rollup()
+        hourly = SalesRollup.objects.get(granularity=SalesRollup.HOUR)
+        self.assertEqual((hourly.units, hourly.revenue), (3, 15))
+
+
+class ImportInventoryCommandTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+
+    def test_import(self):
+        with NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('action,truck,name,price,quantity\n')
+            for index in range(25):
+                file.write(f'food_item,{self.truck.id},Item {index},1.50,10\n')
+            file.write('food_item,0,Lost,1.50,10\n')
+            file.flush()
+
+            out, err = StringIO(), StringIO()
+            call_command('import_inventory', file.name, '--chunk-size', '10', stdout=out, stderr=err)
+
+        self.assertEqual(FoodItem.objects.filter(truck=self.truck).count(), 25)
+        self.assertIn('Imported 25 of 26 row(s)', out.getvalue())
+        self.assertIn('Row 26', err.getvalue())
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            call_command('import_inventory', 'inventory.txt', stdout=StringIO())
+
+
+class ShardStockCommandTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def test_shard_and_merge(self):
+        out = StringIO()
+        call_command('shard_stock', self.food_item.id, '--shards', '4', stdout=out)
+        self.assertIn('over 4 shard(s)', out.getvalue())
+        self.assertEqual(self.food_item.shards.count(), 4)
+
+        call_command('shard_stock', self.food_item.id, '--shards', '0', stdout=out)
+        self.food_item.refresh_from_db()
+        self.assertEqual((self.food_item.quantity, self.food_item.stock_shards), (10, 0))
+
+    def test_unknown_food_item(self):
+        with self.assertRaises(CommandError):
+            call_command('shard_stock', 999, stdout=StringIO())
+
+
+class SweepReservationsCommandTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def test_sweep_reclaims_expired_reservations(self):
+        for _ in range(3):
+            reserve(self.food_item, 2)
+        live = reserve(self.food_item, 1)
+        StockReservation.objects.exclude(id=live.id).update(expires_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+        out = StringIO()
+        call_command('sweep_reservations', '--batch-size', '2', stdout=out)
+        self.assertIn('Reclaimed 3 expired reservation(s)', out.getvalue())
+        self.assertEqual(list(StockReservation.objects.values_list('id', flat=True)), [live.id])
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 9)
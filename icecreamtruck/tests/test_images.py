@@ -0,0 +1,110 @@
+import hashlib
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image
+
+from icecreamtruck.icecreamapi.images import generate_image_variants, strip_metadata
+from icecreamtruck.icecreamapi.models import FoodItem, ImageBlob, Truck
+from icecreamtruck.test_settings import common_settings
+from icecreamtruck.tests.api.utils import generate_jpeg_with_exif
+
+
+@common_settings
+class GenerateImageVariantsTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream',
+            price=5.00,
+            quantity=10,
+            item_type='ice_cream',
+            image=generate_jpeg_with_exif(),
+            truck=self.truck,
+        )
+
+    def test_generate_image_variants(self):
+        generate_image_variants(self.food_item.id)
+        self.food_item.refresh_from_db()
+
+        self.assertEqual(set(self.food_item.image_variants), {'thumbnail', 'medium'})
+        storage = self.food_item.image.storage
+        for image_format, path in self.food_item.image_variants['thumbnail'].items():
+            with storage.open(path) as variant_file:
+                variant = Image.open(variant_file)
+                self.assertEqual(variant.format, image_format.upper())
+                self.assertEqual(variant.size, (150, 100))
+                self.assertEqual(dict(variant.getexif()), {})
+
+    def test_generate_image_variants_bumps_versions(self):
+        self.truck.refresh_from_db()
+        truck_version = self.truck.version
+
+        generate_image_variants(self.food_item.id)
+        self.food_item.refresh_from_db()
+        self.truck.refresh_from_db()
+        self.assertEqual(self.food_item.version, 2)
+        self.assertEqual(self.truck.version, truck_version + 1)
+
+
+class StripMetadataTest(TestCase):
+    def test_strip_metadata(self):
+        # taken rotated, somewhere
+        upload = generate_jpeg_with_exif(orientation=6, gps={1: 'N', 2: (48.0, 51.0, 24.0)})
+        strip_metadata(upload)
+
+        with Image.open(upload) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (800, 1200))
+            self.assertEqual(dict(image.getexif()), {})
+
+
+@common_settings
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.photo = generate_jpeg_with_exif().read()
+
+    def create_food_item(self):
+        return FoodItem.objects.create(
+            name='Ice Cream',
+            price=5.00,
+            quantity=10,
+            item_type='ice_cream',
+            image=SimpleUploadedFile('photo.JPG', self.photo, content_type='image/jpeg'),
+            truck=self.truck,
+        )
+
+    def test_same_content_is_stored_once(self):
+        first, second = self.create_food_item(), self.create_food_item()
+
+        digest = hashlib.sha256(self.photo).hexdigest()
+        self.assertEqual(first.image.name, f'images/sha256/{digest[:2]}/{digest}.jpg')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).references, 2)
+        with first.image.open('rb') as image_file:
+            self.assertEqual(image_file.read(), self.photo)
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        first, second = self.create_food_item(), self.create_food_item()
+        name, storage = first.image.name, first.image.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_image_variants_are_released_with_the_food_item(self):
+        food_item = self.create_food_item()
+        generate_image_variants(food_item.id)
+        food_item.refresh_from_db()
+        self.assertEqual(ImageBlob.objects.count(), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            food_item.delete()
+        self.assertFalse(ImageBlob.objects.exists())
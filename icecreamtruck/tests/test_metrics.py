@@ -0,0 +1,119 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from icecreamtruck.icecreamapi.models import FoodItem, Truck
+from icecreamtruck.metrics import Counter, Histogram, MemoryValues, MmapValues, Registry
+from icecreamtruck.test_settings import common_settings
+
+
+def samples(text):
+    """
+    Returns the samples of a metrics exposition, by sample line without the value.
+    """
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, _, value = line.rpartition(' ')
+            values[sample] = float(value)
+    return values
+
+
+@common_settings
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=3, item_type='ice_cream', truck=self.truck
+        )
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return samples(response.content.decode())
+
+    def test_purchases(self):
+        # the registry is shared by the whole test run, so changes are compared
+        before = self.scrape()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('purchase-list'), {'food_id': self.food_item.id, 'quantity': 2})
+        self.client.post(reverse('purchase-list'), {'food_id': self.food_item.id, 'quantity': 2})
+        self.client.post(reverse('purchase-list'), {'food_id': 0, 'quantity': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('purchase-batch'), {'items': [{'food_id': self.food_item.id, 'quantity': 1}]}, format='json'
+            )
+        after = self.scrape()
+
+        def change(sample):
+            return after.get(sample, 0) - before.get(sample, 0)
+
+        self.assertEqual(change('icecreamtruck_purchases_total{kind="single",outcome="enjoy"}'), 1)
+        self.assertEqual(change('icecreamtruck_purchases_total{kind="single",outcome="sorry"}'), 1)
+        self.assertEqual(change('icecreamtruck_purchases_total{kind="single",outcome="not_found"}'), 1)
+        self.assertEqual(change('icecreamtruck_purchases_total{kind="batch",outcome="enjoy"}'), 1)
+        self.assertEqual(change(f'icecreamtruck_units_sold_total{{truck="{self.truck.id}"}}'), 3)
+        self.assertEqual(
+            change('icecreamtruck_request_duration_seconds_count{view="purchase-list",method="POST",status="201"}'), 1
+        )
+        self.assertEqual(
+            change('icecreamtruck_request_duration_seconds_count{view="purchase-list",method="POST",status="400"}'), 1
+        )
+        self.assertGreater(change('icecreamtruck_db_queries_total{view="purchase-list"}'), 0)
+
+
+class MetricsTest(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry._values = MemoryValues()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', "Latency.", ['view'], buckets=[0.1, 1], registry=self.registry)
+        histogram.observe(0.05, view='home')
+        histogram.observe(0.5, view='home')
+        histogram.observe(5, view='home')
+
+        text = self.registry.exposition()
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertEqual(
+            [line for line in text.splitlines() if line.startswith('latency_seconds')],
+            [
+                'latency_seconds_bucket{view="home",le="0.1"} 1',
+                'latency_seconds_bucket{view="home",le="1"} 2',
+                'latency_seconds_bucket{view="home",le="+Inf"} 3',
+                'latency_seconds_count{view="home"} 3',
+                'latency_seconds_sum{view="home"} 5.55',
+            ],
+        )
+
+    def test_labels(self):
+        counter = Counter('things_total', "Things.", ['kind'], registry=self.registry)
+        counter.inc(kind='a "quoted"\nkind')
+        self.assertIn('things_total{kind="a \\"quoted\\"\\nkind"} 1', self.registry.exposition())
+        with self.assertRaises(ValueError):
+            counter.inc(other='label')
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry._values = MmapValues(directory)
+            counter = Counter('things_total', "Things.", ['kind'], registry=self.registry)
+            counter.inc(2, kind='a')
+
+            # another worker process, with a file of its own
+            with mock.patch('os.getpid', return_value=os.getpid() + 1):
+                counter.inc(3, kind='a')
+                counter.inc(kind='b')
+                for index in range(5000):
+                    counter.inc(kind=f'many-{index}')
+
+            self.assertEqual(len(os.listdir(directory)), 2)
+            values = samples(self.registry.exposition())
+            self.assertEqual(values['things_total{kind="a"}'], 5)
+            self.assertEqual(values['things_total{kind="b"}'], 1)
+            self.assertEqual(values['things_total{kind="many-4999"}'], 1)
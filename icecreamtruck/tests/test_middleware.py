@@ -0,0 +1,59 @@
+import json
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from icecreamtruck.icecreamapi.models import FoodItem, Truck
+from icecreamtruck.middleware import RequestProfile
+from icecreamtruck.test_settings import common_settings
+
+
+@override_settings(REQUEST_PROFILING_SAMPLE_RATE=1)
+@common_settings
+class QueryProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        FoodItem.objects.create(name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck)
+
+    def test_profiled_response(self):
+        with self.assertLogs('icecreamtruck.requests', 'INFO') as logs:
+            response = self.client.get(reverse('truck-list'))
+
+        timing = response.headers['Server-Timing']
+        self.assertRegex(
+            timing, r'^db;dur=[\d.]+;desc="2 queries", serialize;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('truck-list'))
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], 2)
+        self.assertGreater(record['serialize_ms'], 0)
+
+    def test_async_view(self):
+        with self.assertLogs('icecreamtruck.requests', 'INFO'):
+            response = self.client.get(reverse('async-truck-list'))
+        self.assertIn('desc="2 queries"', response.headers['Server-Timing'])
+
+    async def test_asgi(self):
+        with self.assertLogs('icecreamtruck.requests', 'INFO'):
+            response = await self.async_client.get(reverse('async-truck-list'))
+        self.assertIn('desc="2 queries"', response.headers['Server-Timing'])
+        self.assertIn('serialize;dur=', response.headers['Server-Timing'])
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(reverse('truck-list'))
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_repeated_statements(self):
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            for _ in range(5):
+                list(Truck.objects.filter(id=self.truck.id))
+            list(FoodItem.objects.all())
+
+        self.assertEqual(profile.queries, 6)
+        self.assertEqual(list(profile.repeated_statements().values()), [5])
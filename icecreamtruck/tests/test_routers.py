@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework.views import status
+
+from icecreamtruck.icecreamapi.models import FoodItem, Truck
+from icecreamtruck.routers import PRIMARY_COOKIE
+from icecreamtruck.test_settings import common_settings
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+@common_settings
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(primary), len(replica)
+
+    def test_read_only_views_read_from_replica(self):
+        for url in [
+            reverse('truck-list'),
+            reverse('truck-detail', kwargs={'pk': self.truck.id}),
+            reverse('fooditem-list'),
+            reverse('inventory-list'),
+            reverse('sales-report'),
+            reverse('async-fooditem-list'),
+        ]:
+            primary, replica = self.get(url)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+
+    def test_client_reads_its_writes_from_primary(self):
+        response = self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        primary, replica = self.get(reverse('truck-detail', kwargs={'pk': self.truck.id}))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_purchase_reads_from_primary(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 1})
+        self.assertEqual(len(replica), 0)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_client_reads_its_writes_despite_cached_replica_reads(self):
+        cache.clear()
+        url = reverse('inventory-detail', kwargs={'pk': self.truck.id})
+        other_client = APIClient()
+
+        # the replica's snapshot predates the purchase, as if it lagged behind the primary
+        with transaction.atomic(using='replica'):
+            FoodItem.objects.using('replica').get(id=self.food_item.id)
+            self.client.post(reverse('purchase-list'), data={'food_id': self.food_item.id, 'quantity': 1})
+
+            response = other_client.get(url)
+            self.assertEqual(response.data['food_items'][0]['quantity'], 10)
+            response = self.client.get(url)
+            self.assertEqual(response.data['food_items'][0]['quantity'], 9)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        primary, replica = self.get(reverse('truck-list'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
@@ -0,0 +1,117 @@
+import time
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from icecreamtruck.icecreamapi.models import FoodItem, Sale, Truck
+from icecreamtruck.icecreamapi.sales_buffer import SaleBuffer, get_sale_buffer
+from icecreamtruck.test_settings import common_settings
+
+
+@override_settings(PURCHASE_WRITE_MODE='buffered', SALE_BUFFER_FLUSH_MILLISECONDS=60000, SALE_BUFFER_MAX_ROWS=3)
+@common_settings
+class BufferedPurchaseTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+
+    def purchase(self, food_item=None):
+        food_item = food_item or self.food_item
+        response = self.client.post(reverse('purchase-list'), {'food_id': food_item.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 201)
+
+    def test_sales_are_group_committed(self):
+        self.purchase()
+        self.purchase()
+
+        # the stock is deducted right away, the sales wait for the group commit
+        self.food_item.refresh_from_db()
+        self.assertEqual(self.food_item.quantity, 8)
+        self.assertEqual(Sale.objects.count(), 0)
+
+        self.purchase()
+        deadline = time.monotonic() + 10
+        while Sale.objects.count() < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(list(Sale.objects.values_list('quantity', 'unit_price', 'line_total')), [(1, 5, 5)] * 3)
+        self.truck.refresh_from_db()
+        self.assertEqual((self.truck.units_sold, self.truck.total_sales()), (3, 15))
+
+    @override_settings(SALE_BUFFER_MAX_QUEUED=1)
+    def test_failed_flush_of_full_queue_does_not_fail_the_purchase(self):
+        with mock.patch.object(Sale.objects, 'bulk_record', side_effect=RuntimeError):
+            with self.assertLogs('icecreamtruck.icecreamapi.sales_buffer', 'ERROR'):
+                self.purchase()
+        self.assertEqual(len(get_sale_buffer().sales), 1)
+
+        get_sale_buffer().shutdown()
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_sales_of_deleted_food_items_are_dropped(self):
+        snack_bar = FoodItem.objects.create(
+            name='Snack Bar', price=2.00, quantity=10, item_type='snack_bar', truck=self.truck
+        )
+        self.purchase()
+        self.purchase(snack_bar)
+        snack_bar.delete()
+
+        with self.assertLogs('icecreamtruck.icecreamapi.sales_buffer', 'ERROR'):
+            self.assertEqual(get_sale_buffer().flush(), 1)
+        self.assertEqual(len(get_sale_buffer().sales), 0)
+        self.assertEqual(list(Sale.objects.values_list('food_item_id', flat=True)), [self.food_item.id])
+        self.truck.refresh_from_db()
+        self.assertEqual((self.truck.units_sold, self.truck.total_sales()), (1, 5))
+
+        # the queue is not held up by the dropped sale
+        self.purchase()
+        self.assertEqual(get_sale_buffer().flush(), 1)
+
+    def test_shutdown_flushes_queued_sales(self):
+        self.purchase()
+        get_sale_buffer().shutdown()
+        self.assertEqual(Sale.objects.count(), 1)
+
+
+class SaleBufferTest(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(name='Test Truck')
+        self.food_item = FoodItem.objects.create(
+            name='Ice Cream', price=5.00, quantity=10, item_type='ice_cream', truck=self.truck
+        )
+        self.buffer = SaleBuffer(flush_interval=60, max_rows=100, max_queued=3)
+        self.addCleanup(self.buffer.shutdown)
+
+    def sale(self):
+        return Sale(food_item=self.food_item, truck=self.truck, quantity=1)
+
+    def test_failed_flush_keeps_the_sales(self):
+        self.buffer.add(self.sale())
+        self.buffer.add(self.sale())
+        with mock.patch.object(Sale.objects, 'bulk_record', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer.sales), 2)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_failed_flush_of_full_queue_keeps_the_sales(self):
+        self.buffer.add(self.sale())
+        self.buffer.add(self.sale())
+        with mock.patch.object(Sale.objects, 'bulk_record', side_effect=RuntimeError):
+            with self.assertLogs('icecreamtruck.icecreamapi.sales_buffer', 'ERROR'):
+                self.buffer.add(self.sale())
+        self.assertEqual(len(self.buffer.sales), 3)
+
+    def test_full_queue_is_flushed_by_the_purchase(self):
+        self.buffer.add(self.sale())
+        self.buffer.add(self.sale())
+        self.assertEqual(Sale.objects.count(), 0)
+        self.buffer.add(self.sale())
+        self.assertEqual(Sale.objects.count(), 3)
+        self.assertEqual(len(self.buffer.sales), 0)
@@ -1,15 +1,29 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from icecreamtruck.icecreamapi.storage import BLOB_DIRECTORY
+from icecreamtruck.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('icecreamtruck.icecreamapi.urls')),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/schema/docs", SpectacularSwaggerView.as_view(url_name="schema")),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
+    # content-addressed images never change, so they can be cached for good
+    urlpatterns += [
+        re_path(
+            rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>[^/]+/{BLOB_DIRECTORY}/.*)$',
+            cache_control(public=True, max_age=settings.IMMUTABLE_MEDIA_MAX_AGE, immutable=True)(serve),
+            {'document_root': settings.MEDIA_ROOT},
+        ),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -11,6 +11,12 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'icecreamtruck.settings')
+from icecreamtruck.settings import base
+
+# the same settings selection as manage.py
+if base.DEBUG:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'icecreamtruck.settings.local_settings')
+else:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'icecreamtruck.settings.production_settings')
 
 application = get_wsgi_application()